@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+__doc__ = """
+Benchmarks the TapeStation peak engine (tapestation_peaks.py) on large synthetic
+Compact Peak Tables, generated from test_data/tapestation_compact_peak_table.csv.
+
+Every synthetic run is a copy of the test table with its own FileName and with
+the fragment sizes and integrated areas of the sample peaks randomly perturbed.
+The engine is compared to the row by row csv.DictReader parsing that
+parse_tapestation_compact_peak_table.py used before.
+
+Usage:
+    python benchmark_tapestation_peaks.py [--runs 500] [--repeat 5]
+"""
+__author__ = "CTMR"
+__date__ = "2020"
+from argparse import ArgumentParser
+from collections import defaultdict
+import csv
+import os
+import random
+import timeit
+
+import tapestation_peaks
+
+TEST_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "test_data", "tapestation_compact_peak_table.csv")
+
+
+def synthetic_tables(runs, seed=1):
+    """Copies of the test table, one per run, with perturbed sample peaks"""
+    rng = random.Random(seed)
+    with open(TEST_TABLE, encoding="utf-8") as table:
+        header, *rows = list(csv.reader(table))
+    size_ix, area_ix, file_ix = header.index("Size [bp]"), header.index("% Integrated Area"), header.index("FileName")
+    tables = list()
+    for run in range(runs):
+        lines = [",".join(header)]
+        for row in rows:
+            row = list(row)
+            row[file_ix] = "synthetic run %05d" % run
+            if row[area_ix] and row[size_ix] and row[2] != "Ladder":
+                row[size_ix] = str(max(1, int(int(row[size_ix]) * rng.uniform(0.8, 1.2))))
+                row[area_ix] = "%.2f" % (float(row[area_ix]) * rng.uniform(0.5, 1.0))
+            lines.append(",".join(row))
+        tables.append(lines)
+    return tables
+
+
+def row_by_row(tables, min_fragsize, max_fragsize):
+    """The previous implementation: a DictReader and a list of peaks per well"""
+    measured_peaks = defaultdict(list)
+    for lines in tables:
+        for line in csv.DictReader(lines, delimiter=','):
+            if line["Observations"] in ("Lower Marker", "Upper Marker"):
+                continue
+            if line["Sample Description"] == "Ladder":
+                continue
+            size = int(line["Size [bp]"]) if line["Size [bp]"] else 0
+            if min_fragsize < size < max_fragsize:
+                measured_peaks[(line["FileName"], line["Well"])].append(size)
+    return {key: peaks[0] if len(peaks) == 1 else -1 for key, peaks in measured_peaks.items()}
+
+
+def benchmark(name, func, repeat, rows):
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    print("%-40s %9.2f ms %12.0f rows/s" % (name, seconds * 1000, rows / seconds))
+
+
+def main(args):
+    single = synthetic_tables(1)
+    pile = synthetic_tables(args.runs)
+    single_rows = len(single[0]) - 1
+    pile_rows = sum(len(lines) - 1 for lines in pile)
+    print("One run: %d rows, pile: %d runs, %d rows" % (single_rows, args.runs, pile_rows))
+
+    engine = tapestation_peaks.summarize_tables(pile, 200, 1000)
+    engine = dict(zip(zip(engine.files.tolist(), engine.wells.tolist()), engine.sizes.tolist()))
+    if engine != row_by_row(pile, 200, 1000):
+        raise(RuntimeError("The engine and the row by row parsing don't agree!"))
+
+    benchmark("row by row, one run", lambda: row_by_row(single, 200, 1000), args.repeat, single_rows)
+    benchmark("row by row, pile", lambda: row_by_row(pile, 200, 1000), args.repeat, pile_rows)
+    table = tapestation_peaks.load_tables(pile)
+    benchmark("engine load, pile", lambda: tapestation_peaks.load_tables(pile), args.repeat, pile_rows)
+    for strategy in tapestation_peaks.STRATEGIES:
+        benchmark("engine %s, one run" % strategy,
+                  lambda: tapestation_peaks.summarize_tables(single, 200, 1000, strategy), args.repeat, single_rows)
+        benchmark("engine %s, pile" % strategy,
+                  lambda: tapestation_peaks.summarize_tables(pile, 200, 1000, strategy), args.repeat, pile_rows)
+        benchmark("engine %s, pile (loaded)" % strategy,
+                  lambda: tapestation_peaks.summarize(table, 200, 1000, strategy), args.repeat, pile_rows)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=500, help="Number of synthetic runs in the pile [%(default)s].")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times to repeat each benchmark [%(default)s].")
+    main(parser.parse_args())
@@ -0,0 +1,172 @@
+"""
+Allocates barcodes that are unique across processes and users, from counters that are stored
+in an SQLite database on the server.
+
+IDs are reserved from a counter a block at a time, in a transaction that holds the write lock
+of the database file, so two processes never get the same IDs. The barcodes of a block are
+then generated in memory, without waiting for the clock.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+DEFAULT_COUNTER_PATH = "~/.config/clarity-ext/barcode-counters.sqlite"
+
+# The number of IDs reserved from a counter at a time
+BLOCK_SIZE = 1000
+
+# The running numbers of a batch, '000' to '999'
+RUNNING = ["{:03d}".format(running) for running in range(1000)]
+
+
+class BarcodeCounters(object):
+    """
+    Named counters, shared by all processes that use the same file. Each counter holds the
+    next free ID.
+    """
+
+    def __init__(self, path=DEFAULT_COUNTER_PATH):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            # Transactions are started explicitly, see reserve
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, next INTEGER)")
+        return self._connection
+
+    def reserve(self, name, count, minimum=0):
+        """
+        Reserves count IDs of the counter and returns the first one. If the counter is
+        below minimum, the IDs start at minimum.
+        """
+        with self._lock:
+            connection = self._connect()
+            # Takes the write lock of the file, which is held until the commit
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT next FROM counters WHERE name = ?", (name,)).fetchone()
+                start = max(row[0] if row else 0, minimum)
+                connection.execute(
+                    "INSERT OR REPLACE INTO counters VALUES (?, ?)", (name, start + count))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        log.debug("Reserved {} IDs of the counter {} from {}".format(count, name, start))
+        return start
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class BarcodeAllocator(object):
+    """
+    Generates barcodes that are short enough to fit within a limited length barcode
+    (currently 14 characters).
+
+    Format: <one letter prefix><2 digit type_id (0-99)><8 chars timestamp in hex><3 digits running>
+
+    The last 11 characters are an ID from the counter of the prefix and type_id, the
+    timestamp being the ID // 1000 and the running number the ID % 1000. The counter never
+    goes below the current second * 1000, so the timestamp is the second the barcode was
+    reserved in, or a later second if more than 1000 barcodes were reserved in the same
+    second. Barcodes generated by the earlier generator, which used the current second and
+    0-999, are therefore never generated again.
+    """
+
+    def __init__(self, prefix, counters=None, block_size=BLOCK_SIZE):
+        """
+        :prefix: Any character
+        :counters: The BarcodeCounters to reserve IDs from. Defaults to the counters in
+                   DEFAULT_COUNTER_PATH, which are opened on first use.
+        """
+        self.prefix = prefix
+        self.counters = counters
+        self.block_size = block_size
+        # type_id -> the range of reserved IDs that are left, (next, end)
+        self._blocks = dict()
+        self._lock = threading.Lock()
+        self.pattern = re.compile(
+            "^" +
+            prefix +
+            r"(?P<type_id>\d{2})" +
+            r"(?P<timestamp>\w{8})" +
+            r"(?P<running>\d{3})" +
+            "$")
+
+    def parse(self, barcode):
+        """
+        Returns the tuple (type_id, timestamp, running number) if the barcode was generated
+        with this generator and prefix. Otherwise returns None
+        """
+        m = self.pattern.match(barcode)
+
+        if not m:
+            return None
+
+        vals = m.groupdict()
+        type_id = int(vals["type_id"])
+        timestamp = vals["timestamp"]
+        timestamp = int("0x" + timestamp, 16)
+        timestamp = datetime.fromtimestamp(timestamp)
+
+        running = int(vals["running"])
+        return (type_id, timestamp, running)
+
+    def _reserve(self, type_id, number_of_barcodes):
+        """Takes number_of_barcodes IDs from the reserved block, reserving a new block if needed"""
+        with self._lock:
+            start, end = self._blocks.get(type_id, (0, 0))
+            if end - start < number_of_barcodes:
+                if self.counters is None:
+                    self.counters = BarcodeCounters()
+                count = max(self.block_size, number_of_barcodes)
+                start = self.counters.reserve("{}{:02d}".format(self.prefix, type_id), count,
+                                              minimum=int(time.time()) * 1000)
+                end = start + count
+            self._blocks[type_id] = (start + number_of_barcodes, end)
+        if (start + number_of_barcodes - 1) // 1000 > 0xffffffff:
+            raise AssertionError("The counter of type_id {} has run out of barcodes".format(type_id))
+        return start
+
+    def generate(self, type_id, number_of_barcodes):
+        """
+        Reserves and returns an iterator of number_of_barcodes new barcodes.
+
+        :type_id: ID of the entity being represented. Any integer between 0-99
+        :number_of_barcodes: Number of barcodes to generate
+        """
+        if type_id < 0 or type_id > 99:
+            raise AssertionError("The type_id must be an integer in the range 0-99")
+        if number_of_barcodes < 1:
+            raise AssertionError("Number of barcodes must be a positive integer")
+
+        start = self._reserve(type_id, number_of_barcodes)
+        end = start + number_of_barcodes
+        barcodes = list()
+        batch_format = "{}{:02d}{{:08x}}".format(self.prefix, type_id)
+        for batch in range(start // 1000, (end - 1) // 1000 + 1):
+            batch_name = batch_format.format(batch)
+            first = max(start - batch * 1000, 0)
+            last = min(end - batch * 1000, 1000)
+            barcodes.extend([batch_name + running for running in RUNNING[first:last]])
+        return iter(barcodes)
@@ -1,6 +1,6 @@
-from clarity_ext_scripts.covid.utils import UniqueBarcodeGenerator
+from clarity_ext_scripts.covid.barcode_allocator import BarcodeAllocator
 
-controls_barcode_generator = UniqueBarcodeGenerator("x")
+controls_barcode_generator = BarcodeAllocator("x")
 
 
 class Controls(object):
@@ -12,7 +12,7 @@ class Extension(GeneralExtension):
     * Selects ControlType from a dropdown
     * User presses "Create controls"
     * Script generates a list in the csv file "Generated controls". It has a list of barcodes
-      which can be interpreted back with UniqueBarcodeGenerator
+      which can be interpreted back with BarcodeAllocator
 
     Note that this doesn't actually create any controls in Clarity, only names that the
     extension `import_samples` recognizes as such, it will do a similar mapping back to known
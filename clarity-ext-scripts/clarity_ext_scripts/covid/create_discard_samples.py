@@ -2,9 +2,10 @@
 Extension for creating discarded samples from a validated file
 """
 
-from clarity_ext.domain import Container, Sample
 from clarity_ext_scripts.covid.utils import CtmrCovidSubstanceInfo
 from clarity_ext_scripts.covid.import_samples import BaseCreateSamplesExtension
+from clarity_ext_scripts.covid.services.bulk_create_service import (
+    NewContainer, NewSample, CONTAINER_TYPE_TUBE)
 
 
 class Extension(BaseCreateSamplesExtension):
@@ -16,21 +17,16 @@ class Extension(BaseCreateSamplesExtension):
     Requires a CSV file with the headers barcode;well
 
 
-    Creates two containers with samples and controls in Clarity:
-        COVID_<date>_PREXT_<time>
-            <sample_name_in_csv>_<timestamp w sec>
-            <control_name_in_csv>_<timestamp w sec>_<running>
-            ...
-        COVID_<date>_BIOBANK_<time>
-            <sample_name_in_csv>_<timestamp w sec>_BIOBANK
-            <control_name_in_csv>_<timestamp w sec>_<running>_BIOBANK
-            ...
+    Creates a container in Clarity for every sample in the list:
+        COVID_<date>_DISCARD_<time>_<running>
+            <sample_name_in_csv>_<timestamp w sec>_DISCARD
 
-    The <running> part of the names is a running number for controls.
+    The container is a 96 well plate as a quick fix. If covid.bulk_create is set in the
+    config, it's a tube, and all tubes and samples are created with a few batch requests.
     """
 
     @staticmethod
-    def create_sample(original_name, timestamp, project, specifier, org_uri,
+    def create_sample(original_name, timestamp, specifier, org_uri,
                       service_request_id):
         """
         Creates the sample in memory
@@ -39,23 +35,22 @@ class Extension(BaseCreateSamplesExtension):
         if specifier:
             name.append(specifier)
         name = "_".join(name)
-        sample = Sample(sample_id=None, name=name, project=project)
-        sample.udf_map.force("Control", "False")
+        sample = NewSample(name)
+        sample.udf["Control"] = "False"
 
         # Add KNM data:test_partner_user
-        sample.udf_map.force("KNM data added at", timestamp)
-        sample.udf_map.force("KNM org URI", org_uri)
-        sample.udf_map.force("KNM service request id", service_request_id)
-        sample.udf_map.force("Source", "KNM")
-        sample.udf_map.force("Status", CtmrCovidSubstanceInfo.STATUS_DISCARD)
+        sample.udf["KNM data added at"] = timestamp
+        sample.udf["KNM org URI"] = org_uri
+        sample.udf["KNM service request id"] = service_request_id
+        sample.udf["Source"] = "KNM"
+        sample.udf["Status"] = CtmrCovidSubstanceInfo.STATUS_DISCARD
 
         return sample
 
     def create_in_mem_container(
             self, row, container_specifier, sample_specifier, date, time, container_running):
-        """Creates an in-memory container with a single sample. Note that currently
-        the container is a 96 well plate as a quick fix, it would make more sense to have a
-        Tube.
+        """Creates an in-memory container with a single sample, a tube if bulk_create is set
+        and otherwise a 96 well plate.
 
         The name of the container will be on the form:
 
@@ -67,29 +62,26 @@ class Extension(BaseCreateSamplesExtension):
         """
         timestamp = date + "T" + time
 
-        # 1. Get the project
-        project = self.context.clarity_service.get_project_by_name(
-            self.context.current_step.udf_project)
-
-        # 2. Create a plate in memory:
-        container_type = "96 well plate"
-        name = "COVID_{}_{}_{}_{}".format(
-            date, container_specifier, time, container_running + 1)
-        container = Container(container_type=container_type, name=name)
-
-        # 3. Create in-memory sample
+        # 1. Create in-memory sample
         original_name = row["Sample Id"]
         org_uri = row["org_uri"]
         service_request_id = row["service_request_id"]
 
         substance = self.create_sample(
-            original_name, timestamp, project, sample_specifier, org_uri,
+            original_name, timestamp, sample_specifier, org_uri,
             service_request_id)
-        substance.udf_map.force("Sample Buffer", "None")
-        substance.udf_map.force("Step ID created in",
-                                self.context.current_step.id)
+        substance.udf["Sample Buffer"] = "None"
+        substance.udf["Step ID created in"] = self.context.current_step.id
 
-        container.append(substance)
+        # 2. Create the container in memory:
+        name = "COVID_{}_{}_{}_{}".format(
+            date, container_specifier, time, container_running + 1)
+        if self.bulk_create:
+            container = NewContainer(name, container_type=CONTAINER_TYPE_TUBE)
+            container.append(substance)
+        else:
+            container = NewContainer(name)
+            container["A:1"] = substance
         return container
 
     def raise_if_already_created(self):
@@ -122,27 +114,24 @@ class Extension(BaseCreateSamplesExtension):
         # TODO: create a wrapper for this too
         created_sample_list = validated_sample_list.csv
 
-        # 3. Create the plates in memory
+        # 3. Create the containers in memory
         in_mem_containers = list()
         for index, row in created_sample_list.iterrows():
-            plate = self.create_in_mem_container(row,
-                                                 container_specifier="DISCARD",
-                                                 sample_specifier="DISCARD",
-                                                 date=date,
-                                                 time=time,
-                                                 container_running=index)
-            in_mem_containers.append(plate)
-            created_sample_list.loc[index, "plate_name"] = plate.name
+            container = self.create_in_mem_container(row,
+                                                     container_specifier="DISCARD",
+                                                     sample_specifier="DISCARD",
+                                                     date=date,
+                                                     time=time,
+                                                     container_running=index)
+            in_mem_containers.append(container)
+            created_sample_list.loc[index, "plate_name"] = container.name
             created_sample_list.loc[index,
-                                    "sample_name"] = plate["A1"].artifact.name
+                                    "sample_name"] = container.samples[0].name
         created_sample_list_content = created_sample_list.to_csv(
             index=False, sep=",")
 
-        # 4. Create the container and samples in clarity
-        workflow = self.context.current_step.udf_assign_to_workflow
-        for in_mem_container in in_mem_containers:
-            _ = self.context.clarity_service.create_container(
-                in_mem_container, with_samples=True, assign_to=workflow)
+        # 4. Create the containers and samples in clarity, and assign the samples to the workflow
+        self.create_containers(in_mem_containers, assign_to_workflow=in_mem_containers)
 
         timestamp = start.strftime("%y%m%dT%H%M%S")
         file_name = "created_sample_list_{}.csv".format(timestamp)
@@ -25,23 +25,30 @@ class Extension(GeneralExtension):
             self.context)
         no_unregistered = ValidatedSampleListFile(validated_sample_list.csv)
 
-        for ix, row in no_unregistered.csv.iterrows():
-            if row[no_unregistered.COLUMN_STATUS] == no_unregistered.STATUS_UNREGISTERED:
-                org_uri = row[no_unregistered.COLUMN_ORG_URI]
-                ref = row[no_unregistered.COLUMN_REFERENCE]
-                service_request_id, comment = self._create_anonymous_service_request(
-                    client, ref, org_uri)
-                if service_request_id:
-                    no_unregistered.csv.at[ix,
-                                           no_unregistered.COLUMN_SERVICE_REQUEST_ID] = service_request_id
-                    no_unregistered.csv.at[ix,
-                                           no_unregistered.COLUMN_STATUS] = no_unregistered.STATUS_OK
-                else:
-                    no_unregistered.csv.at[ix,
-                                           no_unregistered.COLUMN_STATUS] = no_unregistered.STATUS_ERROR
+        unregistered = no_unregistered.rows_with_status(no_unregistered.STATUS_UNREGISTERED)
+        rows = no_unregistered.csv[unregistered]
+        service_request_ids = list()
+        statuses = list()
+        comments = list()
+        for ref, org_uri, previous_id in zip(rows[no_unregistered.COLUMN_REFERENCE].tolist(),
+                                             rows[no_unregistered.COLUMN_ORG_URI].tolist(),
+                                             rows[no_unregistered.COLUMN_SERVICE_REQUEST_ID].tolist()):
+            service_request_id, comment = self._create_anonymous_service_request(
+                client, ref, org_uri)
+            if service_request_id:
+                service_request_ids.append(service_request_id)
+                statuses.append(no_unregistered.STATUS_OK)
+            else:
+                service_request_ids.append(previous_id)
+                statuses.append(no_unregistered.STATUS_ERROR)
+            comments.append(comment)
 
-                no_unregistered.csv.at[ix,
-                                       no_unregistered.COLUMN_COMMENT] = comment
+        if service_request_ids:
+            no_unregistered.set_columns({
+                no_unregistered.COLUMN_SERVICE_REQUEST_ID: service_request_ids,
+                no_unregistered.COLUMN_STATUS: statuses,
+                no_unregistered.COLUMN_COMMENT: comments,
+            }, rows=unregistered)
 
         no_unregistered_content = no_unregistered.csv.to_csv(
             index=False, sep=",")
@@ -15,104 +15,19 @@ These will for example share common files.
 
 import logging
 from uuid import uuid4
-import pandas as pd
+from clarity_ext.domain import Container, Sample
 from clarity_ext.extensions import GeneralExtension
+from clarity_ext_scripts.covid.create_samples.sample_list import (
+    PandasWrapper, BaseRawSampleListFile, ValidatedSampleListFile)
 from clarity_ext_scripts.covid.partner_api_client import (
     TESTING_ORG, ORG_URI_BY_NAME, KARLSSON_AND_NOVAK,
     OrganizationReferralCodeNotFound, PartnerClientAPIException)
+from clarity_ext_scripts.covid.services.bulk_create_service import BulkCreateService
+from clarity_ext_scripts.covid.services.routing_service import RoutingService
 
 logger = logging.getLogger(__name__)
 
 
-class PandasWrapper(object):
-    """
-    Wraps a pandas file, having methods to consistenly fetch from a context
-    """
-
-    # Override this in subclasses
-    FILE_HANDLE = "Some file handle"
-
-    SEPARATOR = ","
-
-    def __init__(self, csv):
-        self.csv = csv
-
-    @classmethod
-    def create_from_context(cls, context):
-        # Creates an instance of this file from the extension context
-        f = context.local_shared_file(cls.FILE_HANDLE, mode="rb")
-        f = cls.filter_before_parse(f)
-        csv = cls.parse_to_csv(f)
-        return cls(csv)
-
-    @classmethod
-    def parse_to_csv(cls, file_like):
-        return pd.read_csv(file_like, sep=cls.SEPARATOR, dtype="string")
-
-    @staticmethod
-    def filter_before_parse(file_like):
-        """
-        If required in subclasses, return a new file_like that has been filtered
-        """
-        return file_like
-
-
-class BaseRawSampleListFile(PandasWrapper):
-    """
-    Describes the CSV file that hangs on the 'Raw sample list' file handle.
-
-    Note that this is currently subtly different between the two use cases
-    """
-    FILE_HANDLE = "Raw sample list"
-
-    # Subclass should define the COLUMNS as constants and a HEADER that lists all headers
-
-    # COLUMN_*
-
-    HEADERS = ["<Should be subclassed>"]
-
-    # The column from which we can get the fake status in integration tests
-    COLUMN_FAKE_STATUS = "<Should be subclassed>"
-
-    def ValidatedSampleListFile(self):
-        # Generates a new file of type ValidatedSampleListFile from this file. Ensures
-        # that all columns we require later in the workflow are now named the same.
-        ret = ValidatedSampleListFile(self.csv)
-        ret.COLUMN_FAKE_STATUS = self.COLUMN_FAKE_STATUS
-        return ret
-
-
-class ValidatedSampleListFile(PandasWrapper):
-    """
-    Defines constants etc. that are in the ValidatedSampleList.
-
-    This file is built using the data from the raw sample list file as a baseline, but adds
-    metadata related to the validation.
-    """
-
-    FILE_HANDLE = "Validated sample list"
-
-    COLUMN_REFERENCE = "Sample Id"
-    COLUMN_REGION = "Region"
-    COLUMN_DEVIATION = "Deviation"
-
-    COLUMN_SERVICE_REQUEST_ID = "service_request_id"
-    COLUMN_STATUS = "status"
-    COLUMN_COMMENT = "comment"
-    COLUMN_ORG_URI = "org_uri"
-    COLUMN_POSITION = "Position"  # NOTE: This is not in the discard samples file
-
-    STATUS_OK = "ok"
-    STATUS_ERROR = "error"
-    STATUS_UNREGISTERED = "unregistered"
-
-    STATUS_ALL = [
-        STATUS_OK,
-        STATUS_ERROR,
-        STATUS_UNREGISTERED
-    ]
-
-
 BUTTON_TEXT_ASSIGN_UNREGISTERED_TO_ANONYMOUS = "Assign unregistered to anonymous"
 
 
@@ -152,16 +67,43 @@ class BaseValidateRawSampleListExtension(GeneralExtension):
 
         try:
             response = client.search_for_service_request(org_uri, barcode)
-            service_request_id = response["resource"]["id"]
-            status = validated_sample_list.STATUS_OK
-            comment = ""
-        except OrganizationReferralCodeNotFound as e:
+        except PartnerClientAPIException as e:
+            response = e
+        return self._search_result(validated_sample_list, org_uri, barcode, response)
+
+    def _search_for_ids(self, validated_sample_list, client, ordering_org, rows):
+        """
+        Searches for the IDs of all rows, like _search_for_id, but with the searches at
+        KNM made in parallel.
+
+        Returns a list with the tuple (service_request_id, status, comment, org_uri)
+        for every row, in the same order as the rows. Usage warnings and errors are
+        also reported in the order of the rows.
+
+        :rows: The rows of the csv to search for, a DataFrame
+        """
+        if ordering_org == TESTING_ORG:
+            return [self._search_for_id(validated_sample_list, client, ordering_org, row)
+                    for row in rows.to_dict("records")]
+        org_uri = ORG_URI_BY_NAME[ordering_org]
+        barcodes = [str(barcode) for barcode in rows[validated_sample_list.COLUMN_REFERENCE].tolist()]
+        responses = client.search_for_service_requests(org_uri, barcodes)
+        return [self._search_result(validated_sample_list, org_uri, barcode, response)
+                for barcode, response in zip(barcodes, responses)]
+
+    def _search_result(self, validated_sample_list, org_uri, barcode, response):
+        """
+        Turns the response of a search for a barcode into the tuple:
+            (service_request_id, status, comment, org_uri)
+
+        :response: The ServiceRequest, or the PartnerClientAPIException raised by the search
+        """
+        if isinstance(response, OrganizationReferralCodeNotFound):
             self.usage_warning(
                 "These barcodes are not registered for the org {}. "
                 "Press '{}' in order to fetch anonymous service requests for these.".format(
                     org_uri,
                     BUTTON_TEXT_ASSIGN_UNREGISTERED_TO_ANONYMOUS), barcode)
-            status = validated_sample_list.STATUS_UNREGISTERED
 
             # Overwrite the org_uri so we use KARLSSON_AND_NOVAK, because this will be anonymous
             org_uri = ORG_URI_BY_NAME[KARLSSON_AND_NOVAK]
@@ -174,13 +116,17 @@ class BaseValidateRawSampleListExtension(GeneralExtension):
                        "Press '{}' in order to fetch anonymous service requests for these.".format(
                            BUTTON_TEXT_ASSIGN_UNREGISTERED_TO_ANONYMOUS
                        ))
-        except PartnerClientAPIException as e:
+        elif isinstance(response, PartnerClientAPIException):
             self.usage_error_defer(
                 "Something was wrong with {} for barcode(s). "
                 "See file validated sample list for details.".format(org_uri), barcode)
             service_request_id = ""
             status = validated_sample_list.STATUS_ERROR
-            comment = e.message
+            comment = response.message
+        else:
+            service_request_id = response["resource"]["id"]
+            status = validated_sample_list.STATUS_OK
+            comment = ""
         return service_request_id, status, comment, org_uri
 
 
@@ -194,18 +140,13 @@ class BaseCreateSamplesExtension(GeneralExtension):
         validated_sample_list = ValidatedSampleListFile.create_from_context(
             self.context)
 
-        errors = list()
-        unregistered = list()
-
-        for ix, row in validated_sample_list.csv.iterrows():
-            status = row[validated_sample_list.COLUMN_STATUS]
-            ref = row[validated_sample_list.COLUMN_REFERENCE]
-            if status == validated_sample_list.STATUS_UNREGISTERED:
-                unregistered.append(ref)
-            elif status == validated_sample_list.STATUS_ERROR:
-                errors.append(ref)
-            elif status != validated_sample_list.STATUS_OK:
-                raise AssertionError("Unexpected status: {}".format(status))
+        unexpected = validated_sample_list.unexpected_statuses()
+        if unexpected:
+            raise AssertionError("Unexpected status: {}".format(unexpected[0]))
+        errors = validated_sample_list.references_with_status(
+            validated_sample_list.STATUS_ERROR)
+        unregistered = validated_sample_list.references_with_status(
+            validated_sample_list.STATUS_UNREGISTERED)
 
         if len(errors) + len(unregistered) > 0:
             msg = "There are {} errors and {} unregistered in the sample list. " \
@@ -214,3 +155,51 @@ class BaseCreateSamplesExtension(GeneralExtension):
             self.usage_error(msg)
 
         return validated_sample_list
+
+    @property
+    def bulk_create(self):
+        """
+        True if the containers and samples are to be created with the batch endpoints, see
+        bulk_create_service. Set covid.bulk_create: true in the clarity-ext config to enable it.
+        """
+        try:
+            return str(self.config["covid.bulk_create"]).lower() == "true"
+        except KeyError:
+            return False
+
+    def create_containers(self, containers, assign_to_workflow):
+        """
+        Creates the in-memory containers (NewContainer) and their samples in Clarity, and
+        assigns the samples of the containers in assign_to_workflow to the workflow of the step.
+
+        Returns the created containers, with their id and name.
+        """
+        workflow = self.context.current_step.udf_assign_to_workflow
+        if self.bulk_create:
+            BulkCreateService(self.context.session.api).create(
+                containers, self.context.current_step.udf_project)
+            routing_service = RoutingService(self.context.session.api)
+            routing_service.add([sample.artifact for container in assign_to_workflow
+                                 for sample in container.samples], workflow)
+            routing_service.route()
+            return containers
+
+        project = self.context.clarity_service.get_project_by_name(
+            self.context.current_step.udf_project)
+        created = list()
+        for container in containers:
+            kwargs = dict(assign_to=workflow) if container in assign_to_workflow else dict()
+            created.append(self.context.clarity_service.create_container(
+                domain_container(container, project), with_samples=True, **kwargs))
+        return created
+
+
+def domain_container(container, project):
+    """The clarity-ext Container with its Samples, for a NewContainer"""
+    result = Container(container_type=container.container_type, name=container.name)
+    for new_sample in container.samples:
+        sample = Sample(sample_id=None, name=new_sample.name, project=project)
+        for key, value in sorted(new_sample.udf.items()):
+            sample.udf_map.force(key, value)
+        result[new_sample.well] = sample
+    return result
@@ -0,0 +1,142 @@
+"""
+The sample list files of the workflow for creating samples, see common.py.
+
+The files are wrapped pandas DataFrames. Their columns are read and written as whole
+columns, rather than row by row, as the lists may have many thousands of rows.
+"""
+
+from collections import OrderedDict
+
+
+class PandasWrapper(object):
+    """
+    Wraps a pandas file, having methods to consistenly fetch from a context
+    """
+
+    # Override this in subclasses
+    FILE_HANDLE = "Some file handle"
+
+    SEPARATOR = ","
+
+    def __init__(self, csv):
+        self.csv = csv
+
+    @classmethod
+    def create_from_context(cls, context):
+        # Creates an instance of this file from the extension context
+        f = context.local_shared_file(cls.FILE_HANDLE, mode="rb")
+        f = cls.filter_before_parse(f)
+        csv = cls.parse_to_csv(f)
+        return cls(csv)
+
+    @classmethod
+    def parse_to_csv(cls, file_like):
+        import pandas as pd  # imported on first use, it's slow to import
+        return pd.read_csv(file_like, sep=cls.SEPARATOR, dtype="string")
+
+    @staticmethod
+    def filter_before_parse(file_like):
+        """
+        If required in subclasses, return a new file_like that has been filtered
+        """
+        return file_like
+
+
+class BaseRawSampleListFile(PandasWrapper):
+    """
+    Describes the CSV file that hangs on the 'Raw sample list' file handle.
+
+    Note that this is currently subtly different between the two use cases
+    """
+    FILE_HANDLE = "Raw sample list"
+
+    # Subclass should define the COLUMNS as constants and a HEADER that lists all headers
+
+    # COLUMN_*
+
+    HEADERS = ["<Should be subclassed>"]
+
+    # The column from which we can get the fake status in integration tests
+    COLUMN_FAKE_STATUS = "<Should be subclassed>"
+
+    def ValidatedSampleListFile(self):
+        # Generates a new file of type ValidatedSampleListFile from this file. Ensures
+        # that all columns we require later in the workflow are now named the same.
+        ret = ValidatedSampleListFile(self.csv)
+        ret.COLUMN_FAKE_STATUS = self.COLUMN_FAKE_STATUS
+        return ret
+
+
+class ValidatedSampleListFile(PandasWrapper):
+    """
+    Defines constants etc. that are in the ValidatedSampleList.
+
+    This file is built using the data from the raw sample list file as a baseline, but adds
+    metadata related to the validation.
+    """
+
+    FILE_HANDLE = "Validated sample list"
+
+    COLUMN_REFERENCE = "Sample Id"
+    COLUMN_REGION = "Region"
+    COLUMN_DEVIATION = "Deviation"
+
+    COLUMN_SERVICE_REQUEST_ID = "service_request_id"
+    COLUMN_STATUS = "status"
+    COLUMN_COMMENT = "comment"
+    COLUMN_ORG_URI = "org_uri"
+    COLUMN_POSITION = "Position"  # NOTE: This is not in the discard samples file
+
+    STATUS_OK = "ok"
+    STATUS_ERROR = "error"
+    STATUS_UNREGISTERED = "unregistered"
+
+    STATUS_ALL = [
+        STATUS_OK,
+        STATUS_ERROR,
+        STATUS_UNREGISTERED
+    ]
+
+    def rows_with_status(self, status):
+        """A boolean mask of the rows with the status"""
+        return self.csv[self.COLUMN_STATUS].isin([status])
+
+    def references_with_status(self, status):
+        return self.csv.loc[self.rows_with_status(status), self.COLUMN_REFERENCE].tolist()
+
+    def unexpected_statuses(self):
+        """The statuses that are not in STATUS_ALL, e.g. missing ones"""
+        statuses = self.csv[self.COLUMN_STATUS]
+        return statuses[~statuses.isin(self.STATUS_ALL)].tolist()
+
+    def set_columns(self, values_by_column, rows=None):
+        """
+        Sets whole columns at once, from a dict of column to a list of values or a single
+        value. With rows, a boolean mask, only those rows are set.
+        """
+        for column, values in values_by_column.items():
+            if rows is None:
+                self.csv[column] = values
+            elif column in self.csv:
+                self.csv.loc[rows, column] = values
+            else:
+                # A new column is empty in the other rows
+                import pandas as pd
+                self.csv[column] = pd.Series(values, index=self.csv.index[rows])
+
+    def set_search_results(self, search_results, rows=None):
+        """
+        Sets the org URI, service request ID, status and comment columns from a list with
+        the tuple (service_request_id, status, comment, org_uri) for every row.
+        """
+        search_results = list(search_results)
+        if not search_results:
+            return
+        service_request_ids, statuses, comments, org_uris = zip(*search_results)
+        self.set_columns(OrderedDict([
+            (self.COLUMN_ORG_URI, list(org_uris)),
+            (self.COLUMN_SERVICE_REQUEST_ID, list(service_request_ids)),
+            (self.COLUMN_STATUS, list(statuses)),
+            # If we have the separator in the comment
+            (self.COLUMN_COMMENT, [comment.replace(",", "<SC>") for comment in comments]),
+        ]), rows)
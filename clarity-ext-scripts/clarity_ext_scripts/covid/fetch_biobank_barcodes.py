@@ -1,11 +1,60 @@
-import re
+from collections import namedtuple
 from clarity_ext.service.file_service import Csv
 from clarity_ext.domain.validation import UsageError
 from clarity_ext.utils import single
+from clarity_ext_scripts.wells import InvalidWell, format_well
 
 BIOBANK_FILE_3_COLUMN_HEADER = ['well', 'biobank_barcode', 'plate_barcode']
 BIOBANK_FILE_4_COLUMN_HEADER = ['well', 'biobank_barcode', 'some text', 'plate_barcode']
 RAW_BIOANK_LIST = "Raw biobank list"
+RAW_SAMPLE_LIST = "Raw sample list"
+NO_TUBE = "NO TUBE"
+
+# The attribute of the context that the plate model of a run is cached in
+CONTEXT_CACHE_ATTRIBUTE = "_biobank_plate_model"
+
+BiobankTube = namedtuple("BiobankTube", ["plate_barcode", "well", "biobank_barcode"])
+SampleListEntry = namedtuple("SampleListEntry", ["well", "position", "sample_id"])
+
+
+class BiobankPlateModel(object):
+    """
+    The biobank tubes of all destination plates in the 'Raw biobank list', and the samples
+    of the 'Raw sample list', which is for the plate whose barcode is in its file name.
+
+    All wells are in the format A1. The model is not changed after it has been built.
+    """
+
+    def __init__(self, tubes, samples, sample_list_filename):
+        self._tube_by_plate_and_well = dict(
+            ((tube.plate_barcode, tube.well), tube) for tube in tubes)
+        self.tubes = tuple(tubes)
+        self.plate_barcodes = frozenset(tube.plate_barcode for tube in tubes)
+        self._sample_by_well = dict((sample.well, sample) for sample in samples)
+        self.samples = tuple(samples)
+        self.sample_list_filename = sample_list_filename
+        self.plate_barcode = self._plate_barcode_of_sample_list()
+
+    def _plate_barcode_of_sample_list(self):
+        matching = sorted(plate_barcode for plate_barcode in self.plate_barcodes
+                          if plate_barcode in self.sample_list_filename)
+        if not matching:
+            raise UsageError(
+                "The 'Raw sample list' name is not matching with the plate "
+                "barcode in '{}', {}".format(RAW_BIOANK_LIST, ", ".join(sorted(self.plate_barcodes))))
+        if len(matching) > 1:
+            raise UsageError(
+                "The 'Raw sample list' name is matching with more than one plate "
+                "barcode in '{}', {}".format(RAW_BIOANK_LIST, ", ".join(matching)))
+        return matching[0]
+
+    def tube(self, well, plate_barcode=None):
+        """The biobank tube in the well of the plate, by default of the sample list's plate"""
+        return self._tube_by_plate_and_well.get((plate_barcode or self.plate_barcode, well))
+
+    def sample(self, well):
+        """The entry of the sample list in the well"""
+        return self._sample_by_well.get(well)
 
 
 class FetchBiobankBarcodes(object):
@@ -28,87 +77,78 @@ class FetchBiobankBarcodes(object):
             self.biobank_barcode_by_sample_referral_code()
         self._print(self.barcode_by_sample_code)
 
-    def validate(self):
-        try:
-            file_stream = self.context.local_shared_file(RAW_BIOANK_LIST)
-        except IOError:
-            raise UsageError("Please upload the file to '{}' before proceeding!"
-                             .format(RAW_BIOANK_LIST))
-
-        biobank_info_by_well_barcode = self._build_biobank_info_by_well_barcode(file_stream)
-        plate_barcodes = {
-            biobank_info_by_well_barcode[key]['plate_barcode']
-            for key in biobank_info_by_well_barcode
-        }
-        if len(plate_barcodes) > 1:
-            raise UsageError("There are more than one destination plates the file in '{}'!"
-                             .format(RAW_BIOANK_LIST))
-
-        # Validate that sample list file has plate barcode as name
-        filename = single(self.context.file_service.list_filenames('Raw sample list'))
-        plate_barcode = single(list(plate_barcodes))
-        if plate_barcode not in filename:
-            raise UsageError(
-                "The 'Raw sample list' name is not matching with the plate "
-                "barcode in '{}', {}".format(RAW_BIOANK_LIST, plate_barcode))
+    @property
+    def model(self):
+        """
+        The plate model of the files of this run. The files are only read and parsed
+        once per context.
+        """
+        model = getattr(self.context, CONTEXT_CACHE_ATTRIBUTE, None)
+        if model is None:
+            model = self._build_model()
+            setattr(self.context, CONTEXT_CACHE_ATTRIBUTE, model)
+        return model
 
-        file_stream2 = self.context.local_shared_file('Raw sample list')
-        sample_info_by_well_barcode = \
-            self._build_sample_info_by_well_barcode(file_stream2, plate_barcode)
+    def validate(self):
+        model = self.model
 
         # Validate that 'NO TUBE' entries in biobank file is empty in sample list
-        sample_matrix_keys = [k for k in sample_info_by_well_barcode]
-        for key in biobank_info_by_well_barcode:
-            if biobank_info_by_well_barcode[key]['biobank_barcode'] == 'NO TUBE' \
-                    and key in sample_matrix_keys \
-                    and sample_info_by_well_barcode[key]['Sample Id']:
-                biobank_well = biobank_info_by_well_barcode[key]['well']
-                sample_list_well = sample_info_by_well_barcode[key]['Position']
+        for tube in model.tubes:
+            if tube.plate_barcode != model.plate_barcode or tube.biobank_barcode != NO_TUBE:
+                continue
+            sample = model.sample(tube.well)
+            if sample and sample.sample_id:
                 raise UsageError(
                     "There is an empty entry in the biobank barcode file "
                     "that is not empty in the sample list file, "
                     "biobank well: {}, sample list well: {}"
-                    .format(biobank_well, sample_list_well))
+                    .format(tube.well, sample.position))
 
     def biobank_barcode_by_sample_referral_code(self):
-        file_stream = self.context.local_shared_file(RAW_BIOANK_LIST)
-        biobank_matrix = self._build_biobank_info_by_well_barcode(file_stream)
-        plate_barcode = self._plate_barcode_from(biobank_matrix)
-        file_stream2 = self.context.local_shared_file('Raw sample list')
-        sample_matrix = self._build_sample_info_by_well_barcode(file_stream2, plate_barcode)
+        model = self.model
         barcode_map = dict()
-        for key in sample_matrix:
-            if biobank_matrix[key]['biobank_barcode'] == 'NO TUBE':
+        for sample in model.samples:
+            if not sample.sample_id:
                 continue
-            biobank_barcode = biobank_matrix[key]['biobank_barcode']
-            sample_referal_code = sample_matrix[key]['Sample Id']
-            barcode_map[sample_referal_code] = biobank_barcode
-
+            tube = model.tube(sample.well)
+            if tube is None:
+                raise UsageError("There is no entry in the '{}' for the well {} of the plate {}"
+                                 .format(RAW_BIOANK_LIST, sample.position, model.plate_barcode))
+            if tube.biobank_barcode == NO_TUBE:
+                continue
+            barcode_map[sample.sample_id] = tube.biobank_barcode
         return barcode_map
 
+    def _build_model(self):
+        try:
+            file_stream = self.context.local_shared_file(RAW_BIOANK_LIST)
+        except IOError:
+            raise UsageError("Please upload the file to '{}' before proceeding!"
+                             .format(RAW_BIOANK_LIST))
+        tubes = self._parse_biobank_tubes(file_stream)
+        filename = single(self.context.file_service.list_filenames(RAW_SAMPLE_LIST))
+        samples = self._parse_sample_list(self.context.local_shared_file(RAW_SAMPLE_LIST))
+        return BiobankPlateModel(tubes, samples, filename)
+
     def _end_of_file(self, line, stop_criteria):
-        stop_matches = [v for v in line.values if stop_criteria in v]
-        return len(stop_matches) > 0
+        return any(stop_criteria in v for v in line.values)
 
-    def _build_sample_info_by_well_barcode(self, file_stream, plate_barcode):
+    def _parse_sample_list(self, file_stream):
         csv = Csv(file_stream)
-        sample_info_by_well_barcode = dict()
-        pattern = re.compile(r"(?P<row>[A-Z])(?P<col>[0-9]+)")
+        samples = list()
         stop_criteria = "Sample Tracking Report Name"
         for line in csv:
             if self._end_of_file(line, stop_criteria):
                 break
-            trimmed_row = map(str.strip, line.values)
-            row_as_dict = dict(zip(csv.header, trimmed_row))
-            well_robot_format = line['Position']
-            m = pattern.match(well_robot_format)
-            if m is None:
+            row_as_dict = dict(zip(csv.header, (value.strip() for value in line.values)))
+            try:
+                # A01 -> A1
+                well_default_format = format_well(row_as_dict['Position'])
+            except InvalidWell:
                 continue
-            tokens = m.groupdict()
-            well_default_format = '{}{}'.format(tokens['row'], int(tokens['col']))
-            sample_info_by_well_barcode[
-                self._biobank_key(well_default_format, plate_barcode)] = row_as_dict
-        return sample_info_by_well_barcode
+            samples.append(SampleListEntry(
+                well_default_format, row_as_dict['Position'], row_as_dict['Sample Id']))
+        return samples
 
     def _print(self, var):
         from pprint import pprint
@@ -122,27 +162,20 @@ class FetchBiobankBarcodes(object):
         else:
             raise UsageError("Unknown format of the '{}'".format(RAW_BIOANK_LIST))
 
-    def _build_biobank_info_by_well_barcode(self, file_stream):
-        contents = file_stream.read()
-        rows = contents.split('\n')
-        biobank_info_by_well_barcode = dict()
+    def _parse_biobank_tubes(self, file_stream):
+        """The tubes of all destination plates in the file"""
+        tubes = list()
         header = None
-        for row in rows:
+        for row in file_stream.read().split('\n'):
             split_row = row.split(",")
             if header is None:
                 header = self._decide_biobank_header(split_row)
             if len(split_row) != len(header):
                 continue
-            trimmed_row = map(str.strip, split_row)
-            row_as_dict = dict(zip(header, trimmed_row))
-            well = row_as_dict['well']
-            plate_barcode = row_as_dict['plate_barcode']
-            biobank_info_by_well_barcode[self._biobank_key(well, plate_barcode)] = row_as_dict
-        return biobank_info_by_well_barcode
-
-    def _plate_barcode_from(self, biobank_matrix):
-        any_key = [k for k in biobank_matrix][0]
-        return biobank_matrix[any_key]['plate_barcode']
-
-    def _biobank_key(self, well, plate_barcode):
-        return '{}_{}'.format(well, plate_barcode)
+            row_as_dict = dict(zip(header, (value.strip() for value in split_row)))
+            try:
+                well = format_well(row_as_dict['well'])
+            except InvalidWell:
+                continue
+            tubes.append(BiobankTube(row_as_dict['plate_barcode'], well, row_as_dict['biobank_barcode']))
+        return tubes
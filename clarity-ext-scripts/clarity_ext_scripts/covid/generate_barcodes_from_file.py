@@ -1,5 +1,4 @@
 import datetime
-import pandas as pd
 from clarity_ext.extensions import GeneralExtension
 from clarity_ext_scripts.covid.label_printer import label_printer
 
@@ -25,6 +24,7 @@ class Extension(GeneralExtension):
     def get_barcodes_file(self):
         file_name = "Barcodes"
         f = self.context.local_shared_file(file_name, mode="rb")
+        import pandas as pd  # imported on first use, it's slow to import
         return pd.read_csv(f, encoding="utf-8", sep=",")
 
     def integration_tests(self):
@@ -1,8 +1,8 @@
 import logging
-from clarity_ext.domain import Container, Sample
 from clarity_ext_scripts.covid.controls import controls_barcode_generator, Controls
 from clarity_ext_scripts.covid.services.knm_service import KNMClientFromExtension, ServiceRequestProvider
 from clarity_ext_scripts.covid.create_samples.common import BaseCreateSamplesExtension
+from clarity_ext_scripts.covid.services.bulk_create_service import NewContainer, NewSample
 from clarity_ext_scripts.covid.partner_api_client import TESTING_ORG, ORG_URI_BY_NAME
 
 logger = logging.getLogger(__name__)
@@ -29,19 +29,36 @@ class Extension(BaseCreateSamplesExtension):
     The <running> part of the names is a running number for controls.
     """
 
-    def create_sample(self, original_name, timestamp, project, specifier, org_uri, service_request_id):
-
-        provider = ServiceRequestProvider(
-            self.client, org_uri, original_name)
-
-        if org_uri == ORG_URI_BY_NAME[TESTING_ORG]:
-            referring_clinic_name = ""
-        else:
-            try:
-                referring_clinic_name = provider.patient["managingOrganization"]["display"].encode("ascii", "ignore")
-            except AttributeError:
-                logger.warning("Found no referring clinic information for %s" % original_name)
+    def referring_clinic_by_sample(self, samples_file):
+        """
+        Fetches the referring clinic of every sample in the sample list from KNM. The service
+        requests and patients are fetched up front, a plate at a time and in parallel.
 
+        Returns a dict from (org_uri, referral code) to the name of the referring clinic
+        """
+        referral_codes_by_org = dict()
+        for ix, row in samples_file.csv.iterrows():
+            original_name = row[samples_file.COLUMN_REFERENCE]
+            org_uri = row[samples_file.COLUMN_ORG_URI]
+            if controls_barcode_generator.parse(original_name) or org_uri == ORG_URI_BY_NAME[TESTING_ORG]:
+                continue
+            referral_codes_by_org.setdefault(org_uri, set()).add(original_name)
+
+        referring_clinic_by_sample = dict()
+        for org_uri, referral_codes in referral_codes_by_org.items():
+            providers = ServiceRequestProvider.create_many(self.client, org_uri, sorted(referral_codes))
+            for original_name, provider in providers.items():
+                try:
+                    referring_clinic_name = provider.patient["managingOrganization"]["display"].encode(
+                        "ascii", "ignore")
+                except (KeyError, AttributeError, TypeError):
+                    logger.warning("Found no referring clinic information for %s" % original_name)
+                    referring_clinic_name = ""
+                referring_clinic_by_sample[(org_uri, original_name)] = referring_clinic_name
+        return referring_clinic_by_sample
+
+    def create_sample(self, original_name, timestamp, specifier, org_uri, service_request_id,
+                      referring_clinic_name):
         name = [
             original_name,
             "".join(referring_clinic_name.split()),
@@ -50,31 +67,31 @@ class Extension(BaseCreateSamplesExtension):
         if specifier:
             name.append(specifier)
         name = "_".join(str(component) for component in name if component)
-        sample = Sample(sample_id=None, name=name, project=project)
-        sample.udf_map.force("Control", "False")
+        sample = NewSample(name)
+        sample.udf["Control"] = "False"
 
         # Add KNM data:test_partner_user
-        sample.udf_map.force("KNM data added at", timestamp)
-        sample.udf_map.force("KNM org URI", org_uri)
-        sample.udf_map.force("KNM service request id", service_request_id)
+        sample.udf["KNM data added at"] = timestamp
+        sample.udf["KNM org URI"] = org_uri
+        sample.udf["KNM service request id"] = service_request_id
 
         return sample
 
     def create_control(self, original_name, control_type, timestamp,
-                       running_number, project, specifier):
+                       running_number, specifier):
         control_type_name = Controls.MAP_FROM_KEY_TO_ABBREVIATION[control_type]
         name = map(str, [control_type_name, timestamp, running_number])
         if specifier:
             name.append(specifier)
         name = "_".join(name)
-        control = Sample(sample_id=None, name=name, project=project)
-        control.udf_map.force("Control", "True")
-        control.udf_map.force("Control type", control_type_name)
+        control = NewSample(name)
+        control.udf["Control"] = "True"
+        control.udf["Control type"] = control_type_name
         return control
 
     def create_in_mem_container(
             self, samples_file, container_specifier, sample_specifier, control_specifier, date,
-            time, biobank_barcode_by_sample_referal_code=None
+            time, referring_clinic_by_sample, biobank_barcode_by_sample_referal_code=None
     ):
         """Creates an in-memory container with the samples
 
@@ -91,19 +108,17 @@ class Extension(BaseCreateSamplesExtension):
         The name of the controls will be on the form:
 
             <name in csv>_<timestamp>_<control_specifier>
+
+        The referring clinics are looked up in referring_clinic_by_sample, so that no
+        requests are made to KNM here.
         """
         timestamp = date + "T" + time
 
-        # 1. Get the project
-        project = self.context.clarity_service.get_project_by_name(
-            self.context.current_step.udf_project)
-
-        # 2. Create a 96 well plate in memory:
-        container_type = "96 well plate"
+        # 1. Create a 96 well plate in memory:
         name = "COVID_{}_{}_{}".format(date, container_specifier, time)
-        container = Container(container_type=container_type, name=name)
+        container = NewContainer(name)
 
-        # 3. Create in-memory samples
+        # 2. Create in-memory samples
         control_running = 0
         for ix, row in samples_file.csv.iterrows():
             original_name = row[samples_file.COLUMN_REFERENCE]
@@ -119,19 +134,19 @@ class Extension(BaseCreateSamplesExtension):
                 control_running += 1
                 substance = self.create_control(
                     original_name, control_type, timestamp,
-                    control_running, project, control_specifier)
+                    control_running, control_specifier)
             else:
                 substance = self.create_sample(
-                    original_name, timestamp, project, sample_specifier, org_uri,
-                    service_request_id)
+                    original_name, timestamp, sample_specifier, org_uri,
+                    service_request_id,
+                    referring_clinic_by_sample.get((org_uri, original_name), ""))
                 if biobank_barcode_by_sample_referal_code:
                     biobank_barcode = biobank_barcode_by_sample_referal_code[
                         original_name
                     ]
-                    substance.udf_map.force("Biobank barcode", biobank_barcode)
-            substance.udf_map.force("Sample Buffer", "None")
-            substance.udf_map.force(
-                "Step ID created in", self.context.current_step.id)
+                    substance.udf["Biobank barcode"] = biobank_barcode
+            substance.udf["Sample Buffer"] = "None"
+            substance.udf["Step ID created in"] = self.context.current_step.id
             container[well] = substance
         return container
 
@@ -169,12 +184,14 @@ class Extension(BaseCreateSamplesExtension):
         fetch_biobank_barcodes = FetchBiobankBarcodes(self.context)
         barcode_by_sample =\
             fetch_biobank_barcodes.biobank_barcode_by_sample_referral_code()
+        referring_clinic_by_sample = self.referring_clinic_by_sample(validated_sample_list)
         prext_plate = self.create_in_mem_container(validated_sample_list,
                                                    container_specifier="PREXT",
                                                    sample_specifier="",
                                                    control_specifier="",
                                                    date=date,
-                                                   time=time)
+                                                   time=time,
+                                                   referring_clinic_by_sample=referring_clinic_by_sample)
 
         biobank_plate = self.create_in_mem_container(
             validated_sample_list,
@@ -183,17 +200,16 @@ class Extension(BaseCreateSamplesExtension):
             control_specifier="BIOBANK",
             date=date,
             time=time,
+            referring_clinic_by_sample=referring_clinic_by_sample,
             biobank_barcode_by_sample_referal_code=barcode_by_sample)
 
-        # 4. Create the container and samples in clarity
-        workflow = self.context.current_step.udf_assign_to_workflow
-        prext_plate = self.context.clarity_service.create_container(
-            prext_plate, with_samples=True, assign_to=workflow)
-        biobank_plate = self.context.clarity_service.create_container(
-            biobank_plate, with_samples=True)
+        # 4. Create the containers and samples in clarity, and assign the PREXT samples
+        #    to the workflow
+        created = self.create_containers([prext_plate, biobank_plate],
+                                         assign_to_workflow=[prext_plate])
 
         # 5. Add both containers to a UDF so they can be printed
-        for plate in [prext_plate, biobank_plate]:
+        for plate in created:
             container_log.append("{}:{}".format(plate.id, plate.name))
 
         self.context.current_step.udf_map.force(
@@ -150,5 +150,21 @@ class ZebraLabelPrinter(object):
         return "".join(self._parse(info))
 
 
+class LazyLabelPrinterService(object):
+    """Creates the default LabelPrinterService on first use, rather than when the module is imported"""
+
+    def __init__(self):
+        self._service = None
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = LabelPrinterService.create()
+        return self._service
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+
 # Provide a default label_printer so it can be easily used in extensions:
-label_printer = LabelPrinterService.create()
+label_printer = LazyLabelPrinterService()
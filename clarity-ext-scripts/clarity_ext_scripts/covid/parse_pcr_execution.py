@@ -1,7 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import pandas as pd
-import numpy as np
 from datetime import datetime
 from clarity_ext.domain.validation import UsageError
 
@@ -22,6 +20,7 @@ class Quant7Parser(object):
 
     def _determine_start_row(self, file_handle):
         file_stream = self.context.local_shared_file(file_handle, mode="rb")
+        import pandas as pd  # pandas and numpy are imported on first use, they're slow to import
         data = pd.read_excel(file_stream, 'Results', index_col=None, header=None, encoding='utf-8')
         header_row_entry = data[(data[0] == 'Well') & (data[1] == 'Well Position')].index
         header_row_index = header_row_entry.values[0]
@@ -30,6 +29,7 @@ class Quant7Parser(object):
     def parse(self, file_handle):
         header_row_index = self._determine_start_row(file_handle)
         file_stream = self.context.local_shared_file(file_handle, mode="rb")
+        import pandas as pd
         data = pd.read_excel(file_stream, 'Results', index_col=None,
                              skiprows=header_row_index, encoding='utf-8')
         for _, output in self.context.all_analytes:
@@ -72,6 +72,7 @@ class Quant7Parser(object):
     def _parse_ct(self, ct):
         # CT values with no signal is shown as an empty cell in the output file
         # which in turn is interpreted as NaN by pandas.
+        import numpy as np
         if (isinstance(ct, basestring) and ct.lower() == 'undetermined') or np.isnan(ct):
             ct = 0
         return ct
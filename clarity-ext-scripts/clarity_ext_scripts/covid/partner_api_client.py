@@ -3,10 +3,13 @@ from datetime import datetime
 from luhn import verify as mod10verify
 from luhn import generate as mod10generate
 import logging
+from multiprocessing.pool import ThreadPool
 import requests
 from requests import ConnectionError, Timeout
+from requests.adapters import HTTPAdapter
 from retry import retry
 import re
+from clarity_ext_scripts.covid.resource_cache import ResourceCache
 
 
 log = logging.getLogger(__name__)
@@ -34,6 +37,13 @@ ORG_URI_BY_NAME = {
     ORG_RVB_RID: "http://uri.d-t.se/id/Identifier/i-lab/region-vasterbotten-nus"
 }
 
+# The number of searches that are sent to the test partner at the same time
+SEARCH_WORKERS = 8
+
+# The number of identifiers that are searched for in one request. All identifiers
+# are in the URL, which must be kept well below the usual limit of 8 KB.
+SEARCH_BATCH_SIZE = 20
+
 
 class PartnerClientAPIException(Exception):
     pass
@@ -245,12 +255,35 @@ class PartnerAPIV7Client(object):
     """
 
     def __init__(self, test_partner_base_url, test_partner_user, test_partner_password,
-                 test_partner_code_system_base_url):
+                 test_partner_code_system_base_url, test_partner_cache_path=None):
+        """
+        :test_partner_cache_path: The SQLite file to cache resources in, see resource_cache.
+                                  Nothing is cached if not given.
+        """
         self._base_url = test_partner_base_url
         self._user = test_partner_user
         self._password = test_partner_password
         self._test_partner_code_system_base_url = test_partner_code_system_base_url
         self._session = requests.Session()
+        # Keep a connection per search worker, so that parallel searches reuse them
+        adapter = HTTPAdapter(pool_maxsize=SEARCH_WORKERS)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self.cache = ResourceCache(test_partner_cache_path) if test_partner_cache_path else None
+
+    def _cached(self, key, resource_type):
+        if self.cache is None:
+            return None
+        return self.cache.get(key, resource_type)
+
+    def _cache_search_result(self, org, org_referral_code, service_request):
+        if self.cache is not None:
+            self.cache.set(self._search_key(org, org_referral_code), "ServiceRequest",
+                           service_request["resource"]["id"], service_request)
+
+    @staticmethod
+    def _search_key(org, org_referral_code):
+        return "ServiceRequest?identifier={}|{}".format(org, org_referral_code)
 
     def _base64_encoded_credentials(self):
         user_and_password = "{}:{}".format(self._user, self._password)
@@ -266,6 +299,9 @@ class PartnerAPIV7Client(object):
 
     @retry(ConnectionError, tries=3, delay=2, backoff=2)  # To avoid BadStatusLine
     def search_for_service_request(self, org, org_referral_code):
+        cached = self._cached(self._search_key(org, org_referral_code), "ServiceRequest")
+        if cached is not None:
+            return cached
         try:
             params = {"identifier": "|".join([org, org_referral_code])}
             search_url = "{}/ServiceRequest".format(self._base_url)
@@ -291,6 +327,7 @@ class PartnerAPIV7Client(object):
 
             if nbr_of_results == 1:
                 service_request = response_json["entry"][0]
+                self._cache_search_result(org, org_referral_code, service_request)
                 return service_request
             elif nbr_of_results > 1:
                 raise MoreThanOneOrganizationReferralCodeFound(
@@ -305,6 +342,128 @@ class PartnerAPIV7Client(object):
             log.info("Error while connecting to KNM: {}".format(e.message))
             raise e
 
+    def search_for_service_requests(self, org, org_referral_codes, max_workers=SEARCH_WORKERS,
+                                    batch_size=SEARCH_BATCH_SIZE, included=None):
+        """
+        Searches for the ServiceRequests of many referral codes from the same organization.
+        The referral codes are searched for batch_size at a time with
+        bulk_search_for_service_requests, with up to max_workers searches at the same time
+        over the same session.
+
+        Returns a list in the same order as org_referral_codes, with either the ServiceRequest
+        or the PartnerClientAPIException for the referral code, which is the same exception
+        search_for_service_request would raise.
+
+        :included: See bulk_search_for_service_requests
+        """
+        def search(batch):
+            try:
+                return self.bulk_search_for_service_requests(org, batch, included)
+            except PartnerClientAPIException as e:
+                return dict((org_referral_code, e) for org_referral_code in batch)
+
+        org_referral_codes = list(org_referral_codes)
+        unique_codes = sorted(set(org_referral_codes))
+        batches = [unique_codes[i:i + batch_size] for i in range(0, len(unique_codes), batch_size)]
+        if len(batches) <= 1:
+            results = [search(batch) for batch in batches]
+        else:
+            pool = ThreadPool(min(max_workers, len(batches)))
+            try:
+                results = pool.map(search, batches)
+            finally:
+                pool.close()
+                pool.join()
+        by_code = dict()
+        for result in results:
+            by_code.update(result)
+        return [by_code[org_referral_code] for org_referral_code in org_referral_codes]
+
+    def bulk_search_for_service_requests(self, org, org_referral_codes, included=None):
+        """
+        Searches for the ServiceRequests of many referral codes from the same organization
+        with one FHIR search, where the identifiers are OR:ed with commas. All pages of the
+        resulting Bundle are fetched.
+
+        Returns a dict from the referral code to either its ServiceRequest, or to the
+        exception search_for_service_request would raise for it, i.e.
+        OrganizationReferralCodeNotFound or MoreThanOneOrganizationReferralCodeFound.
+
+        Raises FailedInContactingTestPartner if any request fails.
+
+        :included: If a dict is given, the Patient of each ServiceRequest and the managing
+                   Organization of the Patient are fetched in the same search, and added to
+                   the dict by their reference, e.g. Patient/123.
+        """
+        org_referral_codes = list(org_referral_codes)
+        results = dict()
+        for org_referral_code in org_referral_codes:
+            cached = self._cached(self._search_key(org, org_referral_code), "ServiceRequest")
+            if cached is not None:
+                results[org_referral_code] = cached
+        found = dict((org_referral_code, list()) for org_referral_code in org_referral_codes
+                     if org_referral_code not in results)
+        if not found:
+            return results
+
+        try:
+            url = "{}/ServiceRequest".format(self._base_url)
+            params = {"identifier": ",".join("|".join([org, org_referral_code])
+                                             for org_referral_code in found),
+                      "_count": len(found)}
+            if included is not None:
+                params["_include"] = "ServiceRequest:subject"
+                params["_include:iterate"] = "Patient:organization"
+            while url:
+                bundle = self._get_search_page(url, params)
+                for entry in bundle.get("entry", list()):
+                    mode = entry.get("search", dict()).get("mode")
+                    if mode == "include" and included is not None:
+                        resource = entry["resource"]
+                        included["{}/{}".format(resource["resourceType"], resource["id"])] = resource
+                        if self.cache is not None:
+                            self.cache.set_resource(resource)
+                    if mode in ("outcome", "include"):
+                        continue
+                    for identifier in entry["resource"].get("identifier", list()):
+                        if identifier.get("system") == org and identifier.get("value") in found:
+                            found[identifier["value"]].append(entry)
+                # The next link has all search parameters in it
+                url = next((link["url"] for link in bundle.get("link", list())
+                            if link["relation"] == "next"), None)
+                params = None
+        except PartnerClientAPIException as e:
+            log.info("Error while connecting to KNM: {}".format(e.message))
+            raise e
+
+        for org_referral_code, entries in found.items():
+            if len(entries) == 1:
+                results[org_referral_code] = entries[0]
+                self._cache_search_result(org, org_referral_code, entries[0])
+            elif len(entries) > 1:
+                results[org_referral_code] = MoreThanOneOrganizationReferralCodeFound(
+                    ("More than one partner referral code was found for organization: {} "
+                     "and organization referral code: {}").format(org, org_referral_code))
+            else:
+                results[org_referral_code] = OrganizationReferralCodeNotFound(
+                    ("No partner referral code was found for organization: {} "
+                     "and organization referral code: {}").format(org, org_referral_code))
+        return results
+
+    @retry(ConnectionError, tries=3, delay=2, backoff=2)  # To avoid BadStatusLine
+    def _get_search_page(self, url, params):
+        headers = self._generate_headers()
+        response = self._session.get(url=url, headers=headers, params=params)
+        if not response.status_code == 200:
+            mess = "Did not get a 200 response from test partner. Response status code was: {}".format(
+                response.status_code)
+            try:
+                mess += " and response json: {}".format(response.json())
+            except ValueError:
+                mess += " and the response json was empty."
+            raise FailedInContactingTestPartner(mess)
+        return response.json()
+
     def get_consent(self, patient_id):
         """
         Get consent for a sample via its patient_id, which can be found in
@@ -405,6 +564,8 @@ class PartnerAPIV7Client(object):
             response = self._session.post(url=url,
                                           json=payload,
                                           headers=headers)
+            if self.cache is not None:
+                self.cache.delete(self._search_key(payload["identifier"][0]["system"], referral_code))
 
             if response.status_code == 201:
                 response_json = response.json()
@@ -450,6 +611,9 @@ class PartnerAPIV7Client(object):
             response = self._session.post(url=url,
                                           json=payload,
                                           headers=headers)
+            # The ServiceRequest is updated when the report is posted
+            if self.cache is not None:
+                self.cache.invalidate("ServiceRequest", service_request_id)
 
             # TODO Add integration test mode
             if not response.status_code == 201:
@@ -474,6 +638,9 @@ class PartnerAPIV7Client(object):
 
         :ref: The reference, e.g. Patient/123
         """
+        cached = self._cached(ref, ref.split("/")[0])
+        if cached is not None:
+            return cached
         url = "{}/{}".format(self._base_url, ref)
         headers = self._generate_headers()
         response = self._session.get(url=url, headers=headers)
@@ -482,7 +649,10 @@ class PartnerAPIV7Client(object):
             raise PartnerClientAPIException(
                 "Couldn't get resource '{}', status code: {}".format(
                     url, response.status_code))
-        return response.json()
+        resource = response.json()
+        if self.cache is not None:
+            self.cache.set_resource(resource)
+        return resource
 
     def get_org_uri_by_name(self, name):
         return ORG_URI_BY_NAME[name]
@@ -4,7 +4,7 @@ from sminet_client import SampleMaterial, SmiNetError
 from clarity_ext.extensions import GeneralExtension
 from clarity_ext_scripts.covid.utils import CtmrCovidSubstanceInfo
 from clarity_ext_scripts.covid.services.sminet_service import SmiNetService
-from clarity_ext_scripts.covid.services.knm_service import KNMSampleAccessor
+from clarity_ext_scripts.covid.services.knm_service import KNMSampleAccessor, ServiceRequestProvider
 from clarity_ext_scripts.covid.services.knm_sminet_service import (
     KNMSmiNetIntegrationService, IntegrationError, UnregisteredPatient)
 from clarity_ext_scripts.covid.partner_api_client import (
@@ -62,21 +62,38 @@ class Extension(GeneralExtension):
     * Anonymous => ignore
     """
 
-    def report(self, substance):
-        """
-        Reports this substance to SmiNet and updates the status in the LIMS.
-        """
-
+    @staticmethod
+    def create_sample_accessor(substance):
         org_referral_code = substance.submitted_sample.name.split("_")[0]
         date_arrival = substance.submitted_sample.api_resource.date_received
         date_arrival = datetime.strptime(date_arrival, "%Y-%m-%d")
 
-        sample = KNMSampleAccessor(substance.submitted_sample.udf_knm_org_uri,
-                                   org_referral_code,
-                                   date_arrival,
-                                   SampleMaterial.SVALG)
+        return KNMSampleAccessor(substance.submitted_sample.udf_knm_org_uri,
+                                 org_referral_code,
+                                 date_arrival,
+                                 SampleMaterial.SVALG)
 
-        integration = KNMSmiNetIntegrationService(self.config)
+    def create_providers(self, client, samples):
+        """
+        Fetches the service requests, patients and organizations of all samples from KNM up
+        front, with a few requests per organization.
+
+        Returns a dict from (org_uri, org_referral_code) to the ServiceRequestProvider
+        """
+        codes_by_org = dict()
+        for sample in samples:
+            codes_by_org.setdefault(sample.org_uri, set()).add(sample.org_referral_code)
+        providers = dict()
+        for org_uri, org_referral_codes in codes_by_org.items():
+            for org_referral_code, provider in ServiceRequestProvider.create_many(
+                    client, org_uri, sorted(org_referral_codes)).items():
+                providers[(org_uri, org_referral_code)] = provider
+        return providers
+
+    def report(self, substance, integration, sample, provider=None):
+        """
+        Reports this substance to SmiNet and updates the status in the LIMS.
+        """
         lab_result = SmiNetService.create_scov2_positive_lab_result()
         service_request_notes_to_append = {
             "order_note",
@@ -92,7 +109,8 @@ class Extension(GeneralExtension):
                                          doctor_name="Lars Engstrand",
                                          lab_result=lab_result,
                                          sample_free_text="",
-                                         service_request_notes_to_append=service_request_notes_to_append)
+                                         service_request_notes_to_append=service_request_notes_to_append,
+                                         provider=provider)
             status = SmiNetService.STATUS_SUCCESS
         except UnregisteredPatient:
             status = SmiNetService.STATUS_IGNORE
@@ -128,11 +146,20 @@ class Extension(GeneralExtension):
         self.context.commit()
 
     def execute(self):
-        for plate in self.context.input_containers:
-            for well in plate.occupied:
-                substance = CtmrCovidSubstanceInfo(well.artifact)
-                if should_report(substance):
-                    self.report(substance)
+        substances = [CtmrCovidSubstanceInfo(well.artifact)
+                      for plate in self.context.input_containers
+                      for well in plate.occupied]
+        to_report = [(substance, self.create_sample_accessor(substance))
+                     for substance in substances if should_report(substance)]
+        if not to_report:
+            return
+
+        integration = KNMSmiNetIntegrationService(self.config)
+        providers = self.create_providers(integration.knm_service.client,
+                                          [sample for _, sample in to_report])
+        for substance, sample in to_report:
+            self.report(substance, integration, sample,
+                        providers[(sample.org_uri, sample.org_referral_code)])
 
     def integration_tests(self):
         yield "24-48808"
@@ -0,0 +1,117 @@
+"""
+A cache for resources fetched from the FHIR API of the test partner, shared by all processes
+on the server through an SQLite database.
+
+Resources are cached for a time that depends on their type. Organizations rarely change, but
+ServiceRequests change when we report results, so they are only kept for a short while.
+Resources of other types are not cached.
+
+The cache holds patient data, so the file is only readable by its owner. The hits and misses
+of a run are logged when the cache is closed, at the latest when the process exits.
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+# Seconds to keep resources in the cache, by resource type
+TTL_BY_RESOURCE_TYPE = {
+    "Organization": 24 * 60 * 60,
+    "Patient": 60 * 60,
+    "ServiceRequest": 10 * 60,
+}
+
+DEFAULT_CACHE_PATH = "~/.cache/clarity-ext/knm-resources.sqlite"
+
+
+class ResourceCache(object):
+    """
+    Caches JSON resources by key. The key is either a reference, e.g. Patient/123, or a
+    search, in which case the resource type and id of the resource found are stored with it
+    so that it's invalidated together with the resource.
+
+    The number of hits and misses are counted by resource type in `hits` and `misses`.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_by_resource_type=None):
+        self.path = os.path.expanduser(path)
+        self.ttl_by_resource_type = ttl_by_resource_type or TTL_BY_RESOURCE_TYPE
+        self.hits = Counter()
+        self.misses = Counter()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, 0o700)
+        # Create the file before SQLite does, so that only the owner can read it
+        os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+        if os.stat(self.path).st_mode & 0o077:
+            os.chmod(self.path, 0o600)
+        # The same connection is used by all threads of the process, one at a time
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS resources ("
+                "key TEXT PRIMARY KEY, resource_type TEXT, resource_id TEXT, "
+                "value TEXT, expires REAL)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS resources_by_id ON resources (resource_type, resource_id)")
+            self._connection.execute("DELETE FROM resources WHERE expires <= ?", (time.time(),))
+        atexit.register(self.close)
+
+    def get(self, key, resource_type):
+        """Returns the resource cached for the key, or None"""
+        if not self.ttl_by_resource_type.get(resource_type):
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM resources WHERE key = ? AND expires > ?",
+                (key, time.time())).fetchone()
+        if row is None:
+            self.misses[resource_type] += 1
+            return None
+        self.hits[resource_type] += 1
+        return json.loads(row[0])
+
+    def set(self, key, resource_type, resource_id, value):
+        ttl = self.ttl_by_resource_type.get(resource_type)
+        if not ttl:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?)",
+                (key, resource_type, resource_id, json.dumps(value), time.time() + ttl))
+
+    def set_resource(self, resource):
+        """Caches a resource by its reference"""
+        reference = "{}/{}".format(resource["resourceType"], resource["id"])
+        self.set(reference, resource["resourceType"], resource["id"], resource)
+
+    def delete(self, key):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM resources WHERE key = ?", (key,))
+
+    def invalidate(self, resource_type, resource_id):
+        """Removes a resource, and all searches that found it, from the cache"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM resources WHERE resource_type = ? AND resource_id = ?",
+                (resource_type, resource_id))
+
+    def stats(self):
+        return {"hits": dict(self.hits), "misses": dict(self.misses)}
+
+    def close(self):
+        """Closes the database and logs the stats. Does nothing if already closed."""
+        with self._lock:
+            if self._connection is None:
+                return
+            self._connection.close()
+            self._connection = None
+        log.info("Resource cache stats: {}".format(self.stats()))
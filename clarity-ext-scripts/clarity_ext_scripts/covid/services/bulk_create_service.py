@@ -0,0 +1,202 @@
+"""
+Creates many containers and samples in Clarity with the batch endpoints of the API,
+containers/batch/create and samples/batch/create, instead of one request per container
+and per sample.
+
+The payloads follow the batch create examples of the API documentation. They have not
+been posted to a Clarity server yet, and neither has the "Tube" container type been
+checked, so import_samples and create_discard_samples only use this service if
+covid.bulk_create is set in the clarity-ext config. Check one payload of each kind
+against the dev server before setting it in production.
+"""
+
+import logging
+import numbers
+from multiprocessing.pool import ThreadPool
+from xml.etree import ElementTree
+from clarity_ext_scripts.wells import COLON, format_well
+
+logger = logging.getLogger(__name__)
+
+NS_RI = "http://genologics.com/ri"
+NS_CONTAINER = "http://genologics.com/ri/container"
+NS_SAMPLE = "http://genologics.com/ri/sample"
+NS_UDF = "http://genologics.com/ri/userdefined"
+
+CONTAINER_TYPE_PLATE = "96 well plate"
+CONTAINER_TYPE_TUBE = "Tube"
+
+# The number of containers or samples created with one request
+CHUNK_SIZE = 100
+
+
+class NewSample(object):
+    """
+    A sample that is to be created, with its UDFs in the dict `udf`. After it has been
+    created, `uri` and `artifact` (its analyte) are set.
+    """
+
+    def __init__(self, name, udf=None):
+        self.name = name
+        self.udf = udf or dict()
+        self.container = None
+        self.well = None
+        self.uri = None
+        self.artifact = None
+
+
+class NewContainer(object):
+    """
+    A container that is to be created, with its samples by well, e.g. container["A:1"].
+    After it has been created, `uri` and `id` are set.
+    """
+
+    def __init__(self, name, container_type=CONTAINER_TYPE_PLATE):
+        self.name = name
+        self.container_type = container_type
+        self.samples = list()
+        self.uri = None
+
+    @property
+    def id(self):
+        return self.uri.split("/")[-1] if self.uri else None
+
+    def __setitem__(self, well, sample):
+        sample.container = self
+        sample.well = format_well(well, style=COLON)
+        self.samples.append(sample)
+
+    def __getitem__(self, well):
+        well = format_well(well, style=COLON)
+        return next(sample for sample in self.samples if sample.well == well)
+
+    def append(self, sample):
+        """Adds the sample to a tube"""
+        if self.samples:
+            raise AssertionError("The container {} already has a sample".format(self.name))
+        sample.container = self
+        sample.well = "1:1"
+        self.samples.append(sample)
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def udf_type_and_text(value):
+    """The type and text of a UDF field, with the types genologics gives new fields"""
+    if isinstance(value, bool):
+        return "Boolean", "true" if value else "false"
+    if isinstance(value, numbers.Number):
+        return "Numeric", str(value)
+    return "String", value
+
+
+class BulkCreateService(object):
+    """
+    Creates containers with their samples, chunk_size at a time. The samples of a chunk of
+    containers are created while the next chunk of containers is created.
+    """
+
+    def __init__(self, lims, chunk_size=CHUNK_SIZE):
+        """
+        :lims: A genologics Lims, e.g. context.session.api
+        """
+        self.lims = lims
+        self.chunk_size = chunk_size
+
+    def create(self, containers, project_name):
+        """
+        Creates the containers and their samples in the project, and fetches the analytes of
+        the samples. Returns the containers.
+        """
+        project_uri = self._get_uri(self.lims.get_projects(name=project_name), "project", project_name)
+        type_uris = dict(
+            (container_type, self._get_uri(self.lims.get_container_types(name=container_type),
+                                           "container type", container_type))
+            for container_type in set(container.container_type for container in containers))
+
+        pool = ThreadPool(1)
+        try:
+            pending = list()
+            for container_chunk in chunks(containers, self.chunk_size):
+                self._create_containers(container_chunk, type_uris)
+                samples = [sample for container in container_chunk for sample in container.samples]
+                for sample_chunk in chunks(samples, self.chunk_size):
+                    pending.append(pool.apply_async(self._create_samples, (sample_chunk, project_uri)))
+            for result in pending:
+                result.get()
+        finally:
+            pool.close()
+            pool.join()
+
+        self._fetch_artifacts([sample for container in containers for sample in container.samples])
+        logger.info("Created {} containers with {} samples".format(
+            len(containers), sum(len(container.samples) for container in containers)))
+        return containers
+
+    @staticmethod
+    def _get_uri(entities, what, name):
+        if len(entities) != 1:
+            raise AssertionError("Expected one {} called '{}', found {}".format(what, name, len(entities)))
+        return entities[0].uri
+
+    def _post(self, endpoint, details, created):
+        """
+        Posts the details to the batch endpoint and sets the uri of each created entity.
+        The payload is a ri:details root with one con:container or smp:samplecreation per entity.
+
+        The links in the response are not documented to be in the order of the request, so
+        they are matched to the entities by name.
+        """
+        uri = self.lims.get_uri(endpoint, "batch", "create")
+        response = self.lims.post(uri, ElementTree.tostring(details))
+        links = [link.get("uri") for link in response.findall("link")]
+        if len(links) != len(created):
+            raise AssertionError("Expected {} {} to be created, but got {}".format(
+                len(created), endpoint, len(links)))
+        uri_by_name = dict(zip(self._names(endpoint, links), links))
+        if sorted(uri_by_name) != sorted(entity.name for entity in created):
+            raise AssertionError("The created {} don't have the requested, unique names".format(endpoint))
+        for entity in created:
+            entity.uri = uri_by_name[entity.name]
+
+    def _names(self, endpoint, links):
+        """The names of the created entities, fetched with one batch retrieve. The samples are
+        cached by genologics, so fetching their analytes afterwards needs no new request."""
+        from genologics.entities import Container, Sample
+        entity_class = {"containers": Container, "samples": Sample}[endpoint]
+        entities = [entity_class(self.lims, uri=link) for link in links]
+        self.lims.get_batch(entities)
+        return [entity.name for entity in entities]
+
+    def _create_containers(self, containers, type_uris):
+        details = ElementTree.Element("{%s}details" % NS_RI)
+        for container in containers:
+            node = ElementTree.SubElement(details, "{%s}container" % NS_CONTAINER)
+            ElementTree.SubElement(node, "name").text = container.name
+            ElementTree.SubElement(node, "type", uri=type_uris[container.container_type],
+                                   name=container.container_type)
+        self._post("containers", details, containers)
+
+    def _create_samples(self, samples, project_uri):
+        details = ElementTree.Element("{%s}details" % NS_RI)
+        for sample in samples:
+            node = ElementTree.SubElement(details, "{%s}samplecreation" % NS_SAMPLE)
+            ElementTree.SubElement(node, "name").text = sample.name
+            ElementTree.SubElement(node, "project", uri=project_uri)
+            location = ElementTree.SubElement(node, "location")
+            ElementTree.SubElement(location, "container", uri=sample.container.uri)
+            ElementTree.SubElement(location, "value").text = sample.well
+            for key, value in sorted(sample.udf.items()):
+                udf_type, text = udf_type_and_text(value)
+                ElementTree.SubElement(node, "{%s}field" % NS_UDF, type=udf_type, name=key).text = text
+        self._post("samples", details, samples)
+
+    def _fetch_artifacts(self, samples):
+        from genologics.entities import Sample
+        entities = [Sample(self.lims, uri=sample.uri) for sample in samples]
+        for chunk in chunks(entities, self.chunk_size):
+            self.lims.get_batch(chunk)
+        for sample, entity in zip(samples, entities):
+            sample.artifact = entity.artifact
@@ -17,8 +17,11 @@ class KNMService(object):
 def KNMConfig(config):
     """
     Creates config required for KNM from the clarity-ext config (which has more than that)
+
+    Resources are only cached if the config has test_partner_cache_path, the SQLite file to
+    cache them in. See resource_cache.
     """
-    return {
+    ret = {
         key: config[key]
         for key in [
             "test_partner_base_url",
@@ -27,6 +30,11 @@ def KNMConfig(config):
             "test_partner_password"
         ]
     }
+    try:
+        ret["test_partner_cache_path"] = config["test_partner_cache_path"]
+    except KeyError:
+        ret["test_partner_cache_path"] = None
+    return ret
 
 
 def KNMClientFromExtension(extension):
@@ -61,32 +69,74 @@ class ServiceRequestProvider(object):
     """
     Represents a service request. Has methods to retrieve all data we require on it. Gives
     a higher level abstraction of the api for readability.
+
+    With include_subject, the patient and the organization are fetched with the service
+    request, in one request to KNM. Use create_many to fetch them for a whole plate at once.
     """
 
-    def __init__(self, client, org_uri, org_referral_code):
+    def __init__(self, client, org_uri, org_referral_code, include_subject=False):
         self.client = client
         self.org_uri = org_uri
         self.org_referral_code = org_referral_code
+        self.include_subject = include_subject
+        # Resources fetched together with the service request, by reference
+        self.included = dict()
+        # The service request or the exception from searching for it, if already searched for
+        self._search_result = None
+
+    @classmethod
+    def create_many(cls, client, org_uri, org_referral_codes):
+        """
+        Creates providers for many referral codes from the same organization, with the
+        service requests, patients and organizations of all of them fetched up front.
+
+        Returns a dict from the referral code to its provider. If the search for a service
+        request failed, the provider raises the error when the service request is used.
+        """
+        org_referral_codes = list(org_referral_codes)
+        included = dict()
+        search_results = client.search_for_service_requests(
+            org_uri, org_referral_codes, included=included)
+        providers = dict()
+        for org_referral_code, search_result in zip(org_referral_codes, search_results):
+            provider = cls(client, org_uri, org_referral_code, include_subject=True)
+            provider.included = included
+            provider._search_result = search_result
+            providers[org_referral_code] = provider
+        return providers
 
     @lazyprop
     def service_request(self):
         # The service_request json response
-        return self.client.search_for_service_request(self.org_uri, self.org_referral_code)
+        if self._search_result is None:
+            if not self.include_subject:
+                return self.client.search_for_service_request(self.org_uri, self.org_referral_code)
+            self._search_result = self.client.bulk_search_for_service_requests(
+                self.org_uri, [self.org_referral_code], self.included)[self.org_referral_code]
+        if isinstance(self._search_result, Exception):
+            raise self._search_result
+        return self._search_result
 
     @lazyprop
     def patient(self):
         # The patient data corresponding with the service request
-        return self.client.get_by_reference(self.patient_ref)
+        return self._get_by_reference(self.patient_ref)
 
     @lazyprop
     def organization(self):
         managing_organization = self.patient["managingOrganization"]
-        return self.client.get_by_reference(managing_organization["reference"])
+        return self._get_by_reference(managing_organization["reference"])
 
     @property
     def patient_ref(self):
         # A reference identifying the patient
         return self.service_request["resource"]["subject"]["reference"]
 
+    def _get_by_reference(self, ref):
+        try:
+            return self.included[ref]
+        except KeyError:
+            return self.client.get_by_reference(ref)
+
     def __str__(self):
         return "{}|{}".format(self.org_uri, self.org_referral_code)
@@ -159,17 +159,21 @@ class KNMSmiNetIntegrationService(object):
 
         return " ".join([sample_free_text] + notes_to_add)
 
-    def export_to_sminet(self, sample, doctor_name, lab_result, sample_free_text, service_request_notes_to_append):
+    def export_to_sminet(self, sample, doctor_name, lab_result, sample_free_text, service_request_notes_to_append,
+                         provider=None):
         """
         Exports a SmiNetLabExport based on a sample
 
         :sample: A KNMSampleAccessor object
         :doctor_name: Name of the doctor
         :lab_result: A LabResult entry (for convenience one can use those created by SmiNetService)
+        :provider: The ServiceRequestProvider of the sample, if it has been fetched already
         """
         # Generate export:
-        provider = ServiceRequestProvider(
-            self.knm_service.client, sample.org_uri, sample.org_referral_code)
+        if provider is None:
+            provider = ServiceRequestProvider(
+                self.knm_service.client, sample.org_uri, sample.org_referral_code,
+                include_subject=True)
 
         sample_free_text_with_notes = self._append_service_request_notes(sample_free_text, provider, service_request_notes_to_append)
 
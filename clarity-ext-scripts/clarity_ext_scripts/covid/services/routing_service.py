@@ -0,0 +1,93 @@
+"""
+Assigns artifacts to workflows with route/artifacts, for all artifacts of a run at once.
+"""
+
+import logging
+import time
+from requests import RequestException
+
+logger = logging.getLogger(__name__)
+
+# The number of artifacts routed with one request
+CHUNK_SIZE = 500
+
+
+class RoutingFailed(Exception):
+    pass
+
+
+class RoutingSummary(object):
+    def __init__(self):
+        self.routed = dict()  # Workflow name -> number of artifacts
+        self.failed = dict()  # Workflow name -> list of artifacts
+        self.requests = 0
+
+    def __str__(self):
+        parts = ["Routed {} artifacts to {} workflows in {} requests".format(
+            sum(self.routed.values()), len(self.routed), self.requests)]
+        for workflow_name, artifacts in sorted(self.failed.items()):
+            parts.append("failed to route {} artifacts to '{}'".format(len(artifacts), workflow_name))
+        return ", ".join(parts)
+
+
+class RoutingService(object):
+    """
+    Gathers the artifacts to route with `add`, and routes all of them with `route`, chunk_size
+    artifacts per request. Chunks that fail are retried up to `tries` times.
+    """
+
+    def __init__(self, lims, chunk_size=CHUNK_SIZE, tries=3, delay=2):
+        """
+        :lims: A genologics Lims, e.g. context.session.api
+        """
+        self.lims = lims
+        self.chunk_size = chunk_size
+        self.tries = tries
+        self.delay = delay
+        self.artifacts_by_workflow = dict()
+
+    def add(self, artifacts, workflow_name):
+        self.artifacts_by_workflow.setdefault(workflow_name, list()).extend(artifacts)
+
+    def route(self):
+        """
+        Routes all added artifacts. Returns a RoutingSummary, or raises RoutingFailed with the
+        summary as the message if any chunk failed all tries.
+        """
+        summary = RoutingSummary()
+        for workflow_name, artifacts in sorted(self.artifacts_by_workflow.items()):
+            workflow_uri = self._get_workflow_uri(workflow_name)
+            summary.routed[workflow_name] = 0
+            for start in range(0, len(artifacts), self.chunk_size):
+                chunk = artifacts[start:start + self.chunk_size]
+                if self._route_chunk(chunk, workflow_uri, summary):
+                    summary.routed[workflow_name] += len(chunk)
+                else:
+                    summary.failed.setdefault(workflow_name, list()).extend(chunk)
+        self.artifacts_by_workflow = dict()
+        logger.info(str(summary))
+        if summary.failed:
+            raise RoutingFailed(str(summary))
+        return summary
+
+    def _get_workflow_uri(self, workflow_name):
+        workflows = self.lims.get_workflows(name=workflow_name)
+        if len(workflows) != 1:
+            raise RoutingFailed("Expected one workflow called '{}', found {}".format(
+                workflow_name, len(workflows)))
+        return workflows[0].uri
+
+    def _route_chunk(self, chunk, workflow_uri, summary):
+        delay = self.delay
+        for attempt in range(1, self.tries + 1):
+            summary.requests += 1
+            try:
+                self.lims.route_artifacts(chunk, workflow_uri=workflow_uri)
+                return True
+            except RequestException as e:
+                logger.warning("Failed to route {} artifacts, attempt {} of {}: {}".format(
+                    len(chunk), attempt, self.tries, e))
+                if attempt < self.tries:
+                    time.sleep(delay)
+                    delay *= 2
+        return False
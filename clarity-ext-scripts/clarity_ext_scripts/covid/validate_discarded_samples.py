@@ -31,21 +31,12 @@ class Extension(BaseValidateRawSampleListExtension):
         raw_sample_list = RawSampleListFile.create_from_context(self.context)
 
         validated_sample_list = raw_sample_list.ValidatedSampleListFile()
-        unregistered = list()
-        for ix, row in validated_sample_list.csv.iterrows():
-            barcode = row[validated_sample_list.COLUMN_REFERENCE]
-            service_request_id, status, comment, org_uri = self._search_for_id(validated_sample_list,
-                                                                               client, ordering_org, row)
-            if status == "unregistered":
-                unregistered.append(barcode)
-            validated_sample_list.csv.loc[ix,
-                                          validated_sample_list.COLUMN_SERVICE_REQUEST_ID] = service_request_id
-            validated_sample_list.csv.loc[ix, validated_sample_list.COLUMN_COMMENT] = comment.replace(
-                ",", "<SC>")  # If we have the separator in the comment
-            validated_sample_list.csv.loc[ix,
-                                          validated_sample_list.COLUMN_ORG_URI] = org_uri
-            validated_sample_list.csv.loc[ix,
-                                          validated_sample_list.COLUMN_STATUS] = status
+        # The samples are searched for at KNM all at once, in parallel
+        search_results = self._search_for_ids(validated_sample_list, client, ordering_org,
+                                              validated_sample_list.csv)
+        validated_sample_list.set_search_results(search_results)
+        unregistered = validated_sample_list.references_with_status(
+            validated_sample_list.STATUS_UNREGISTERED)
 
         validated_sample_list_content = validated_sample_list.csv.to_csv(
             index=False, sep=",")
@@ -1,10 +1,11 @@
 import cStringIO
 import logging
 from datetime import datetime
+from clarity_ext_scripts.wells import COLON, InvalidWell, format_wells
 from clarity_ext_scripts.covid.controls import controls_barcode_generator
 from clarity_ext_scripts.covid.services.knm_service import KNMClientFromExtension
 from clarity_ext_scripts.covid.create_samples.common import (
-    BaseRawSampleListFile, ValidatedSampleListFile,
+    BaseRawSampleListFile,
     BaseValidateRawSampleListExtension, BUTTON_TEXT_ASSIGN_UNREGISTERED_TO_ANONYMOUS
 )
 
@@ -102,41 +103,31 @@ class Extension(BaseValidateRawSampleListExtension):
         validated_sample_list = raw_sample_list.ValidatedSampleListFile()
 
         # 4. Create the validated list
-        unregistered = list()
-        for ix, row in validated_sample_list.csv.iterrows():
-            barcode = row[validated_sample_list.COLUMN_REFERENCE]
-            well = row[validated_sample_list.COLUMN_POSITION]
-
-            # NOTE: The well is in the format "A01" etc
-            if len(well) != 3:
-                raise AssertionError(
-                    "Expected the Position in the raw sample list to be on the format A01. "
-                    "Got: {}".format(well))
-            plate_row = well[0]
-            plate_col = int(well[1:])
-            well = "{}:{}".format(plate_row, plate_col)
-            # TODO It seems that we always need controls here, which
-            #      we need to check if that will always be the case.
-            is_control = controls_barcode_generator.parse(barcode)
-
-            if not is_control:
-                service_request_id, status, comment, org_uri = self._search_for_id(
-                    validated_sample_list, client, ordering_org, row)
-                if status == "unregistered":
-                    unregistered.append(barcode)
-                validated_sample_list.csv.loc[ix,
-                                              validated_sample_list.COLUMN_ORG_URI] = org_uri
-            else:
-                service_request_id = ""
-                status = ValidatedSampleListFile.STATUS_OK
-                comment = ""
-
-            validated_sample_list.csv.loc[ix,
-                                          validated_sample_list.COLUMN_SERVICE_REQUEST_ID] = service_request_id
-            validated_sample_list.csv.loc[ix,
-                                          validated_sample_list.COLUMN_STATUS] = status
-            validated_sample_list.csv.loc[ix, validated_sample_list.COLUMN_COMMENT] = comment.replace(
-                ",", "<SC>")  # If we have the separator in the comment
+        # NOTE: The wells are in the format "A01" etc, they're all converted to "A:1" at once
+        try:
+            wells = format_wells(validated_sample_list.csv[validated_sample_list.COLUMN_POSITION], style=COLON)
+        except InvalidWell as e:
+            raise AssertionError(
+                "Expected the Position in the raw sample list to be on the format A01. {}".format(e))
+        csv = validated_sample_list.csv
+        # TODO It seems that we always need controls here, which
+        #      we need to check if that will always be the case.
+        is_sample = [not controls_barcode_generator.parse(barcode)
+                     for barcode in csv[validated_sample_list.COLUMN_REFERENCE].tolist()]
+        # The samples are searched for at KNM all at once, in parallel
+        search_results = self._search_for_ids(
+            validated_sample_list, client, ordering_org, csv[is_sample])
+
+        # Controls are ok without a service request. The columns of the samples are
+        # then set from the search results.
+        validated_sample_list.set_columns({
+            validated_sample_list.COLUMN_SERVICE_REQUEST_ID: "",
+            validated_sample_list.COLUMN_STATUS: validated_sample_list.STATUS_OK,
+            validated_sample_list.COLUMN_COMMENT: "",
+        })
+        validated_sample_list.set_search_results(search_results, rows=is_sample)
+        unregistered = validated_sample_list.references_with_status(
+            validated_sample_list.STATUS_UNREGISTERED)
 
         validated_sample_list_content = validated_sample_list.csv.to_csv(
             index=False, sep=",")
@@ -0,0 +1,182 @@
+from __future__ import division, print_function
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Well coordinates on 96 and 384 well plates.
+
+All spellings of all wells ('A1', 'A01', 'A:1', 'a1', ...) are put in a lookup
+table once, so that whole lists of wells are parsed into (row, column) pairs
+or integer indexes with a dict lookup per well instead of a regex.
+
+Indexes are columnwise by default (A1 -> 0, B1 -> 1, ..., A2 -> 8 on a 96 well
+plate and A2 -> 16 on a 384 well plate), or rowwise (A1 -> 0, A2 -> 1, ...).
+
+    >>> well_indexes(["A:1", "B01", "A2"])
+    [0, 1, 8]
+    >>> format_wells(["A:1", "B01"], style=PADDED)
+    ['A01', 'B01']
+    >>> all_wells(PLATE_96)[:3]
+    ['A1', 'B1', 'C1']
+
+Used by the scripts at the top level, and by clarity_ext_scripts through a copy
+of this file (clarity-ext-scripts/clarity_ext_scripts/wells.py). Change both
+copies together; the unit tests of clarity-ext-scripts check that they are equal.
+"""
+
+ROW_LETTERS = "ABCDEFGHIJKLMNOP"
+
+# Formatting styles
+PLAIN = "A1"
+PADDED = "A01"
+COLON = "A:1"
+STYLES = (PLAIN, PADDED, COLON)
+
+
+class InvalidWell(ValueError):
+    pass
+
+
+class PlateFormat(object):
+    def __init__(self, name, rows, columns):
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+
+    def __len__(self):
+        return self.rows * self.columns
+
+    def __contains__(self, row_column):
+        row, column = row_column
+        return row < self.rows and column < self.columns
+
+    def __repr__(self):
+        return "PlateFormat(%s)" % self.name
+
+
+PLATE_96 = PlateFormat("96", 8, 12)
+PLATE_384 = PlateFormat("384", 16, 24)
+PLATE_FORMATS = (PLATE_96, PLATE_384)
+# The names of the container types in Clarity
+CONTAINER_TYPE_FORMATS = {"96 well plate": PLATE_96, "384 well plate": PLATE_384}
+
+
+def _spellings(row, column):
+    letter = ROW_LETTERS[row]
+    number = column + 1
+    yield "%s%d" % (letter, number)
+    yield "%s%02d" % (letter, number)
+    yield "%s:%d" % (letter, number)
+    yield "%s:%02d" % (letter, number)
+
+
+def _build_lookup():
+    lookup = dict()
+    for row in range(PLATE_384.rows):
+        for column in range(PLATE_384.columns):
+            for spelling in _spellings(row, column):
+                lookup[spelling] = (row, column)
+                lookup[spelling.lower()] = (row, column)
+    return lookup
+
+
+# Every spelling of every well -> (row, column), zero based
+_LOOKUP = _build_lookup()
+# (row, column) -> the well in each style
+_FORMATTED = dict(((row, column), dict(zip(STYLES, (
+    "%s%d" % (ROW_LETTERS[row], column + 1),
+    "%s%02d" % (ROW_LETTERS[row], column + 1),
+    "%s:%d" % (ROW_LETTERS[row], column + 1)))))
+    for row in range(PLATE_384.rows) for column in range(PLATE_384.columns))
+
+
+def parse_well(well):
+    """'A:1' -> (0, 0), 'B12' -> (1, 11)"""
+    try:
+        return _LOOKUP[well]
+    except (KeyError, TypeError):
+        try:
+            return _LOOKUP[well.strip()]
+        except (KeyError, AttributeError):
+            raise InvalidWell("Invalid well '%s'" % (well,))
+
+
+def parse_wells(wells):
+    """The (row, column) of every well"""
+    lookup = _LOOKUP
+    try:
+        return [lookup[well] for well in wells]
+    except (KeyError, TypeError):
+        return [parse_well(well) for well in wells]
+
+
+def plate_format_of(coordinates):
+    """The smallest plate format the (row, column) coordinates fit on"""
+    for plate_format in PLATE_FORMATS:
+        if all(coordinate in plate_format for coordinate in coordinates):
+            return plate_format
+    return PLATE_384
+
+
+def plate_format_of_container_type(name):
+    """The plate format of a container type, e.g. '96 well plate' -> PLATE_96"""
+    try:
+        return CONTAINER_TYPE_FORMATS[name]
+    except KeyError:
+        raise ValueError("Unknown plate format of the container type '%s'" % (name,))
+
+
+def well_indexes(wells, plate_format=None, columnwise=True):
+    """The index of every well, columnwise or rowwise. If no plate format is given,
+    it's the smallest format all wells fit on."""
+    coordinates = parse_wells(wells)
+    if plate_format is None:
+        plate_format = plate_format_of(coordinates)
+    for coordinate in coordinates:
+        if coordinate not in plate_format:
+            raise InvalidWell("The well %s is not on a %s well plate" %
+                              (_FORMATTED[coordinate][PLAIN], plate_format.name))
+    if columnwise:
+        rows = plate_format.rows
+        return [row + column * rows for row, column in coordinates]
+    columns = plate_format.columns
+    return [row * columns + column for row, column in coordinates]
+
+
+def well_index(well, plate_format=None, columnwise=True):
+    return well_indexes([well], plate_format, columnwise)[0]
+
+
+def wells_from_indexes(indexes, plate_format=PLATE_96, columnwise=True, style=PLAIN):
+    """The wells at the indexes, formatted in the style"""
+    if columnwise:
+        rows = plate_format.rows
+        coordinates = [(index % rows, index // rows) for index in indexes]
+    else:
+        columns = plate_format.columns
+        coordinates = [(index // columns, index % columns) for index in indexes]
+    for index, coordinate in zip(indexes, coordinates):
+        if index < 0 or coordinate not in plate_format:
+            raise InvalidWell("There is no index %d on a %s well plate" % (index, plate_format.name))
+    return [_FORMATTED[coordinate][style] for coordinate in coordinates]
+
+
+def format_wells(wells, style=PLAIN):
+    """Reformats the wells, e.g. ['A:1', 'B01'] -> ['A1', 'B1']"""
+    return [_FORMATTED[coordinate][style] for coordinate in parse_wells(wells)]
+
+
+def format_well(well, style=PLAIN):
+    return format_wells([well], style)[0]
+
+
+def all_wells(plate_format=PLATE_96, columnwise=True, style=PLAIN):
+    """All wells of the plate format, in order"""
+    return wells_from_indexes(range(len(plate_format)), plate_format, columnwise, style)
+
+
+def sort_columnwise(items, well_of, plate_format=None):
+    """Sorts the items columnwise by their well, well_of(item) gives the well of an item"""
+    indexes = well_indexes([well_of(item) for item in items], plate_format)
+    order = sorted(range(len(items)), key=indexes.__getitem__)
+    return [items[i] for i in order]
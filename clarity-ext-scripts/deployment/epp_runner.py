@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+"""
+A pre-forked runner for EPP scripts, to avoid starting a new Python and importing
+pandas, numpy, lxml, genologics etc. every time a button is clicked in Clarity.
+
+The server imports the slow modules once and forks a pool of idle workers that
+wait on a Unix socket. The client sends the command and its working directory
+over the socket, and a worker runs the command in a fresh child process, streaming
+its stdout and stderr back to the client, which exits with the same exit status.
+Each worker runs one command and is then replaced with a new fork of the server,
+so the commands can't affect each other.
+
+Start the server in the environment the scripts run in, e.g. with
+
+    source /opt/gls/clarity/miniconda3/bin/activate clarity-ext
+    python epp_runner.py serve --socket /run/clarity-ext/runner.sock
+
+and run the commands through the client, with one of
+
+    python epp_runner.py run --socket ... --entryPoint clarity-ext -- <arguments>
+    python epp_runner.py run --socket ... --module some.module -- <arguments>
+    python epp_runner.py run --socket ... --script /path/to/script.py -- <arguments>
+
+With --fallback, the client runs the command in a new process itself if the server
+isn't running. The environment of the client is not passed on, the commands run in
+the environment of the server. Send SIGHUP to the server to restart it, e.g. after
+a deployment, so that the new code is imported.
+
+The requests contain the arguments of the commands, including the credentials, so
+the socket must be in a directory that only the user running the scripts can
+write to, e.g. /run/clarity-ext created with mode 0700 (RuntimeDirectory=clarity-ext
+in a systemd unit). The server refuses to listen in any other directory, and the
+client refuses to send anything to a server running as another user.
+
+The client only uses the standard library, so that it starts quickly.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+
+DEFAULT_SOCKET = "/run/clarity-ext/runner.sock"
+DEFAULT_PRELOAD = "pandas,numpy,lxml.etree,requests,genologics.lims,genologics.entities,clarity_ext.cli"
+STDOUT, STDERR, EXIT = b"1", b"2", b"x"
+HEADER = struct.Struct("!cI")
+# SO_PEERCRED is Linux only, and not in the socket module on Python 2
+SO_PEERCRED = getattr(socket, "SO_PEERCRED", 17 if sys.platform.startswith("linux") else None)
+PEER_CREDENTIALS = struct.Struct("3i")
+
+
+class UntrustedSocket(Exception):
+    pass
+
+
+def check_private_directory(path):
+    """Raises UntrustedSocket unless the directory is owned by this user and no one
+    else can write to it, so that no one else can have created the socket in it"""
+    status = os.stat(path)
+    if status.st_uid != os.getuid() or status.st_mode & 0o022:
+        raise UntrustedSocket("{} must be owned by uid {} and writable only by it".format(path, os.getuid()))
+
+
+def send_frame(sock, channel, data=b""):
+    sock.sendall(HEADER.pack(channel, len(data)) + data)
+
+
+def receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("The runner closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def receive_frame(sock):
+    channel, size = HEADER.unpack(receive_exactly(sock, HEADER.size))
+    return channel, receive_exactly(sock, size)
+
+
+# Server
+
+def native_str(value):
+    """json gives unicode on Python 2, where runpy and the scripts expect str"""
+    if sys.version_info[0] == 2 and isinstance(value, unicode):  # noqa: F821
+        return value.encode("utf-8")
+    return value
+
+
+def preload(modules):
+    """Imports the modules in the server, so that the workers inherit them"""
+    for module in modules:
+        try:
+            __import__(module)
+        except ImportError as e:
+            print("Could not preload {}: {}".format(module, e), file=sys.stderr)
+
+
+def run_command(request):
+    """Runs the command of the request in this process. Never returns."""
+    code = 0
+    try:
+        os.chdir(request["cwd"])
+        sys.argv = [request["target"]] + request["args"]
+        import runpy
+        if request["kind"] == "script":
+            sys.path.insert(0, os.path.dirname(os.path.abspath(request["target"])))
+            runpy.run_path(request["target"], run_name="__main__")
+        elif request["kind"] == "module":
+            runpy.run_module(request["target"], run_name="__main__", alter_sys=True)
+        else:
+            import pkg_resources
+            entry_points = list(pkg_resources.iter_entry_points("console_scripts", request["target"]))
+            if not entry_points:
+                raise RuntimeError("No console script named {}".format(request["target"]))
+            result = entry_points[0].load()()
+            code = result if isinstance(result, int) else 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    for output in (sys.stdout, sys.stderr):
+        try:
+            output.flush()
+        except (ValueError, IOError):
+            pass  # closed by the command
+    os._exit(code)
+
+
+def handle(connection):
+    """Runs one request in a child process and streams its output to the client"""
+    stream = connection.makefile("rb")
+    line = stream.readline()
+    stream.close()
+    if not line:
+        return  # the client didn't trust the server and hung up
+    request = json.loads(line.decode("utf-8"))
+    request = {key: native_str(value) for key, value in request.items()}
+    request["args"] = [native_str(arg) for arg in request["args"]]
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        connection.close()
+        os.close(stdout_read)
+        os.close(stderr_read)
+        os.dup2(stdout_write, 1)
+        os.dup2(stderr_write, 2)
+        os.close(stdout_write)
+        os.close(stderr_write)
+        run_command(request)
+    os.close(stdout_write)
+    os.close(stderr_write)
+    channels = {stdout_read: STDOUT, stderr_read: STDERR}
+    while channels:
+        readable, _, _ = select.select(list(channels), [], [])
+        for fd in readable:
+            data = os.read(fd, 65536)
+            if data:
+                send_frame(connection, channels[fd], data)
+            else:
+                os.close(fd)
+                del channels[fd]
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        code = 128 + os.WTERMSIG(status)
+    else:
+        code = os.WEXITSTATUS(status)
+    send_frame(connection, EXIT, struct.pack("!i", code))
+
+
+def worker(server):
+    """Waits for one request, handles it and exits. When the server stops, an idle
+    worker exits right away and a busy one finishes its request first."""
+    state = {"busy": False}
+
+    def stop(signum, frame):
+        if not state["busy"]:
+            os._exit(0)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    code = 0
+    try:
+        connection, _ = server.accept()
+        state["busy"] = True
+        try:
+            handle(connection)
+        finally:
+            connection.close()
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    os._exit(code)
+
+
+def spawn(server):
+    pid = os.fork()
+    if pid == 0:
+        worker(server)
+    return pid
+
+
+def serve(args):
+    preload([module.strip() for module in args.preload.split(",") if module.strip()])
+    directory = os.path.dirname(os.path.abspath(args.socket))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    check_private_directory(directory)
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(args.socket)
+    finally:
+        os.umask(old_umask)
+    server.listen(args.workers * 4)
+
+    workers = set(spawn(server) for _ in range(args.workers))
+    state = {"restart": False}
+
+    def stop(signum, frame):
+        state["restart"] = signum == signal.SIGHUP
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, stop)
+    print("Serving {} with {} workers".format(args.socket, args.workers), file=sys.stderr)
+    try:
+        while True:
+            pid, _ = os.wait()
+            if pid in workers:
+                workers.discard(pid)
+                workers.add(spawn(server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        server.close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+    if state["restart"]:
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+# Client
+
+def fallback_command(args):
+    if args.kind == "script":
+        return [sys.executable, args.target] + args.args
+    elif args.kind == "module":
+        return [sys.executable, "-m", args.target] + args.args
+    return [args.target] + args.args
+
+
+def check_server(client, path):
+    """Raises UntrustedSocket unless the server is run by this user, before the
+    arguments, which may contain credentials, are sent to it"""
+    check_private_directory(os.path.dirname(os.path.abspath(path)))
+    if os.stat(path).st_uid != os.getuid():
+        raise UntrustedSocket("{} is not owned by uid {}".format(path, os.getuid()))
+    if SO_PEERCRED is not None:
+        _, uid, _ = PEER_CREDENTIALS.unpack(
+            client.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, PEER_CREDENTIALS.size))
+        if uid != os.getuid():
+            raise UntrustedSocket("The server on {} runs as uid {}, not {}".format(path, uid, os.getuid()))
+
+
+def run(args):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(args.socket)
+        check_server(client, args.socket)
+    except (socket.error, OSError, UntrustedSocket) as e:
+        client.close()
+        if not args.fallback:
+            raise
+        if isinstance(e, UntrustedSocket):
+            print("Not using the runner: {}".format(e), file=sys.stderr)
+        command = fallback_command(args)
+        os.execvp(command[0], command)
+    request = {"kind": args.kind, "target": args.target, "args": args.args, "cwd": os.getcwd()}
+    client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+    outputs = {STDOUT: sys.stdout, STDERR: sys.stderr}
+    while True:
+        channel, data = receive_frame(client)
+        if channel == EXIT:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            return struct.unpack("!i", data)[0]
+        output = outputs[channel]
+        getattr(output, "buffer", output).write(data)
+        output.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser("serve", help="Start the server")
+    serve_parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    serve_parser.add_argument("--workers", type=int, default=4, help="Number of idle workers to keep")
+    serve_parser.add_argument("--preload", default=DEFAULT_PRELOAD, help="Comma separated modules to import in the server")
+    run_parser = commands.add_parser("run", help="Run a command in the server")
+    run_parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    run_parser.add_argument("--fallback", action="store_true", help="Run the command directly if the server isn't running")
+    target = run_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--script", dest="script")
+    target.add_argument("--module", dest="module")
+    target.add_argument("--entryPoint", dest="entry_point")
+    run_parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+    elif args.command == "run":
+        args.kind, args.target = next((kind, target) for kind, target in (
+            ("script", args.script), ("module", args.module), ("entry_point", args.entry_point)) if target)
+        if args.args and args.args[0] == "--":
+            args.args = args.args[1:]
+        sys.exit(run(args))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
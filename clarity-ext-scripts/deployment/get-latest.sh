@@ -21,6 +21,9 @@ cd clarity-ext-scripts
 source /opt/gls/clarity/miniconda3/bin/activate clarity-ext
 ./setup.sh
 
+# restart the pre-forked runner, if any, so that it imports the new code
+pkill -HUP -f "epp_runner.py serve" || true
+
 else
 echo "Nothing to do for $sha1"
 fi
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Benchmarks setting the validation results of a large validated sample list.
+
+A synthetic list of controls and samples gets the results of a KNM search, its statuses
+are counted, and its unregistered samples are assigned anonymous service requests. The
+whole column assignments of ValidatedSampleListFile are compared to the iterrows and
+per cell .loc writes that the validation extensions used before.
+
+Usage:
+    python benchmark_sample_list.py [--rows 10000] [--repeat 5]
+"""
+__author__ = "CTMR"
+__date__ = "2020"
+
+from argparse import ArgumentParser
+import random
+import timeit
+
+import pandas as pd
+
+from clarity_ext_scripts.covid.create_samples.sample_list import ValidatedSampleListFile
+
+ORG_URI = "http://uri.d-t.se/id/Identifier/i-referral-code"
+
+
+def synthetic_list(rows, seed=1):
+    """
+    A sample list with a control in every 48th row, and the search result of every sample:
+    mostly ok, some unregistered and a few errors
+    """
+    rng = random.Random(seed)
+    references = list()
+    is_sample = list()
+    search_results = list()
+    for ix in range(rows):
+        if ix % 48 == 0:
+            references.append("CONTROL-{}".format(ix))
+            is_sample.append(False)
+            continue
+        reference = str(rng.randint(1000000000, 9999999999))
+        references.append(reference)
+        is_sample.append(True)
+        draw = rng.random()
+        if draw < 0.1:
+            result = ("", ValidatedSampleListFile.STATUS_UNREGISTERED, "No matching request, was found", ORG_URI)
+        elif draw < 0.12:
+            result = ("", ValidatedSampleListFile.STATUS_ERROR, "Something was wrong", ORG_URI)
+        else:
+            result = ("sr-{}".format(reference), ValidatedSampleListFile.STATUS_OK, "", ORG_URI)
+        search_results.append(result)
+    csv = pd.DataFrame({ValidatedSampleListFile.COLUMN_REFERENCE: references}, dtype="string")
+    return csv, is_sample, search_results
+
+
+def row_by_row(csv, is_sample, search_results):
+    """The previous implementation: iterrows, and a .loc write per cell"""
+    f = ValidatedSampleListFile(csv.copy())
+    results = iter(search_results)
+    for (ix, row), sample in zip(list(f.csv.iterrows()), is_sample):
+        if sample:
+            service_request_id, status, comment, org_uri = next(results)
+            f.csv.loc[ix, f.COLUMN_ORG_URI] = org_uri
+        else:
+            service_request_id, status, comment = "", f.STATUS_OK, ""
+        f.csv.loc[ix, f.COLUMN_SERVICE_REQUEST_ID] = service_request_id
+        f.csv.loc[ix, f.COLUMN_STATUS] = status
+        f.csv.loc[ix, f.COLUMN_COMMENT] = comment.replace(",", "<SC>")
+
+    for ix, row in f.csv.iterrows():
+        if row[f.COLUMN_STATUS] == f.STATUS_UNREGISTERED:
+            f.csv.at[ix, f.COLUMN_SERVICE_REQUEST_ID] = "anonymous-{}".format(row[f.COLUMN_REFERENCE])
+            f.csv.at[ix, f.COLUMN_STATUS] = f.STATUS_OK
+            f.csv.at[ix, f.COLUMN_COMMENT] = "Fetched an anonymous request ID"
+
+    errors = list()
+    for ix, row in f.csv.iterrows():
+        if row[f.COLUMN_STATUS] == f.STATUS_ERROR:
+            errors.append(row[f.COLUMN_REFERENCE])
+    return f.csv, errors
+
+
+def whole_columns(csv, is_sample, search_results):
+    """The current implementation: whole columns assigned at once, and status masks"""
+    f = ValidatedSampleListFile(csv.copy())
+    f.set_columns({
+        f.COLUMN_SERVICE_REQUEST_ID: "",
+        f.COLUMN_STATUS: f.STATUS_OK,
+        f.COLUMN_COMMENT: "",
+    })
+    f.set_search_results(search_results, rows=is_sample)
+
+    unregistered = f.rows_with_status(f.STATUS_UNREGISTERED)
+    references = f.csv.loc[unregistered, f.COLUMN_REFERENCE].tolist()
+    f.set_columns({
+        f.COLUMN_SERVICE_REQUEST_ID: ["anonymous-{}".format(reference) for reference in references],
+        f.COLUMN_STATUS: f.STATUS_OK,
+        f.COLUMN_COMMENT: "Fetched an anonymous request ID",
+    }, rows=unregistered)
+
+    errors = f.references_with_status(f.STATUS_ERROR)
+    return f.csv, errors
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    csv, is_sample, search_results = synthetic_list(args.rows)
+
+    expected, expected_errors = row_by_row(csv, is_sample, search_results)
+    actual, actual_errors = whole_columns(csv, is_sample, search_results)
+    assert actual_errors == expected_errors
+    assert actual.astype(object).fillna("").equals(
+        expected[actual.columns].astype(object).fillna("")), "The implementations differ"
+
+    print("{} rows, {} errors, best of {} repeats".format(
+        args.rows, len(actual_errors), args.repeat))
+    timings = dict()
+    for name, implementation in (("row by row", row_by_row), ("whole columns", whole_columns)):
+        number = 1
+        timings[name] = min(timeit.repeat(lambda: implementation(csv, is_sample, search_results),
+                                          repeat=args.repeat, number=number)) / number
+        print("{:>14}: {:8.3f} s".format(name, timings[name]))
+    print("{:>14}: {:8.1f}x".format("speedup", timings["row by row"] / timings["whole columns"]))
+
+
+if __name__ == "__main__":
+    main()
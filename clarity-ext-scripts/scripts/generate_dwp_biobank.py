@@ -1,18 +1,31 @@
 #!/usr/bin/env python
-"""Generate deep well plate biobank substitute CSVs"""
+"""Generate deep well plate biobank substitute CSVs
+
+The plate IDs are reserved from a counter in an SQLite file, see
+clarity_ext_scripts/covid/barcode_allocator.py. They are only unique among the
+users of the same counter file, so everyone must pass the same shared --counters
+path. The script runs on Python 3 and needs the clarity_ext_scripts package on
+the path, e.g. PYTHONPATH=clarity-ext-scripts python3 scripts/generate_dwp_biobank.py
+"""
 __author__ = "Fredrik Boulund"
 
 from sys import argv, exit
 from datetime import datetime
-import time
 import argparse
 
+from clarity_ext_scripts.covid.barcode_allocator import BarcodeCounters
+
 def parse_args():
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument("NUM_CSV",
         type=int,
         default=100,
         help="Number of files to generate [%(default)s]")
+    parser.add_argument("--counters",
+        required=True,
+        help="Shared SQLite file with the counter of plate IDs. The IDs are only "
+             "unique among the users of the same file")
 
     if len(argv) < 2:
         parser.print_help()
@@ -21,13 +34,21 @@ def parse_args():
     return parser.parse_args()
 
 
-def generate_plate():
-    rows = "ABCDEFGH"
-    cols = [n+1 for n in range(12)]
+def reserve_plate_ids(counters, number_of_plates):
+    """
+    Plate IDs DWP<yymmdd><4 digits running that day>, unique among the users
+    of the counters' file
+    """
+    day = datetime.now().strftime('%y%m%d')
+    start = counters.reserve(f"DWP{day}", number_of_plates)
+    if start + number_of_plates > 10000:
+        raise AssertionError(f"There are not {number_of_plates} plate IDs left for {day}")
+    return [f"DWP{day}{running:04d}" for running in range(start, start + number_of_plates)]
 
-    date = datetime.now()
 
-    plate_id = f"DWP{date.strftime('%y%m%d%S%f')}"[:-4]
+def generate_plate(plate_id):
+    rows = "ABCDEFGH"
+    cols = [n+1 for n in range(12)]
 
     plate = {
         "plate_id": plate_id,
@@ -53,9 +74,8 @@ def write_csv(plate, filename):
 if __name__ == "__main__":
     args = parse_args()
 
-    for n in range(args.NUM_CSV):
-        time.sleep(1e-2)  # Wait to ensure unique IDs
-        plate = generate_plate()
+    for plate_id in reserve_plate_ids(BarcodeCounters(args.counters), args.NUM_CSV):
+        plate = generate_plate(plate_id)
         filename = f"{plate['plate_id']}.csv"
         write_csv(plate, filename)
         print(f"Wrote {filename}")
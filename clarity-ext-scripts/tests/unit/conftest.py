@@ -0,0 +1,129 @@
+import json
+import threading
+
+import pytest
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import urlencode
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, urlencode
+
+
+class FHIRStandIn(ThreadingMixIn, HTTPServer):
+    """
+    A local stand-in for the FHIR API of the test partner. Supports reading resources by
+    reference, e.g. Patient/123, and searching for ServiceRequests by identifier, with
+    comma separated OR values, paging, and including the Patient and its Organization.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), FHIRRequestHandler)
+        self.resources = dict()
+        self.requests = list()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def add(self, resource):
+        self.resources[(resource["resourceType"], resource["id"])] = resource
+        return resource
+
+    def add_patient(self, id, organization):
+        return self.add({"resourceType": "Patient", "id": id,
+                         "managingOrganization": {"reference": "Organization/{}".format(organization)}})
+
+    def add_service_request(self, id, org, org_referral_code, patient=None):
+        resource = {"resourceType": "ServiceRequest", "id": id,
+                    "identifier": [{"system": org, "value": org_referral_code}]}
+        if patient:
+            resource["subject"] = {"reference": "Patient/{}".format(patient)}
+        return self.add(resource)
+
+    def search(self, resource_type, params):
+        identifiers = set()
+        for value in params.get("identifier", []):
+            identifiers.update(tuple(identifier.split("|", 1)) for identifier in value.split(","))
+        return [resource for (type_, _), resource in sorted(self.resources.items())
+                if type_ == resource_type and any(
+                    (identifier["system"], identifier["value"]) in identifiers
+                    for identifier in resource.get("identifier", []))]
+
+    def includes(self, params, matches):
+        included = list()
+        if params.get("_include") == ["ServiceRequest:subject"]:
+            for resource in matches:
+                included.append(resource["subject"]["reference"])
+        if params.get("_include:iterate") == ["Patient:organization"]:
+            for reference in list(included):
+                patient = self.resources.get(tuple(reference.split("/")))
+                if patient:
+                    included.append(patient["managingOrganization"]["reference"])
+        resources = [self.resources.get(tuple(reference.split("/")))
+                     for reference in sorted(set(included))]
+        return [resource for resource in resources if resource]
+
+    def bundle(self, path, params, matches):
+        count = int(params.get("_count", ["10"])[0])
+        offset = int(params.get("_getpagesoffset", ["0"])[0])
+        page = matches[offset:offset + count]
+        bundle = {"resourceType": "Bundle", "type": "searchset", "total": len(matches),
+                  "entry": [{"resource": resource, "search": {"mode": "match"}}
+                            for resource in page] +
+                           [{"resource": resource, "search": {"mode": "include"}}
+                            for resource in self.includes(params, page)],
+                  "link": []}
+        if offset + count < len(matches):
+            next_params = dict((key, value[0]) for key, value in params.items())
+            next_params["_getpagesoffset"] = offset + count
+            bundle["link"].append({"relation": "next", "url": "{}{}?{}".format(
+                self.base_url, path, urlencode(next_params))})
+        return bundle
+
+
+class FHIRRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        with server.lock:
+            server.requests.append(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) == 1:
+            body = server.bundle(url.path, params, server.search(parts[0], params))
+        elif tuple(parts) in server.resources:
+            body = server.resources[tuple(parts)]
+        else:
+            self.respond(404, {"resourceType": "OperationOutcome"})
+            return
+        self.respond(200, body)
+
+    def respond(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/fhir+json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fhir_server():
+    server = FHIRStandIn()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
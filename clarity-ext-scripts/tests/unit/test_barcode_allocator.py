@@ -0,0 +1,56 @@
+import threading
+from clarity_ext_scripts.covid.barcode_allocator import *
+
+
+class TestBarcodeAllocator(object):
+
+    def allocator(self, tmpdir, block_size=BLOCK_SIZE):
+        return BarcodeAllocator("x", BarcodeCounters(str(tmpdir.join("counters.sqlite"))), block_size)
+
+    def test_generates_barcodes_that_can_be_parsed(self):
+        # A barcode generated by the earlier generator
+        assert BarcodeAllocator("x").parse("x015e8a1b2c042") == (1, datetime.fromtimestamp(0x5e8a1b2c), 42)
+        assert BarcodeAllocator("x").parse("y015e8a1b2c042") is None
+
+    def test_barcodes_fit_the_format(self, tmpdir):
+        allocator = self.allocator(tmpdir)
+
+        barcodes = list(allocator.generate(5, 2500))
+
+        assert len(set(barcodes)) == 2500
+        assert all(len(barcode) == 14 for barcode in barcodes)
+        parsed = [allocator.parse(barcode) for barcode in barcodes]
+        assert all(type_id == 5 for type_id, _, _ in parsed)
+        assert [running for _, _, running in parsed[:3]] == [0, 1, 2]
+
+    def test_allocators_sharing_the_counters_never_collide(self, tmpdir):
+        allocators = [self.allocator(tmpdir, block_size=100) for _ in range(4)]
+        barcodes = list()
+        lock = threading.Lock()
+
+        def generate(allocator):
+            for _ in range(50):
+                generated = list(allocator.generate(1, 7))
+                with lock:
+                    barcodes.extend(generated)
+        threads = [threading.Thread(target=generate, args=(allocator,)) for allocator in allocators]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(barcodes) == 4 * 50 * 7
+        assert len(set(barcodes)) == len(barcodes)
+
+    def test_reserves_a_block_at_a_time(self, tmpdir):
+        counters = BarcodeCounters(str(tmpdir.join("counters.sqlite")))
+        allocator = BarcodeAllocator("x", counters, block_size=1000)
+
+        first = next(allocator.generate(1, 1))
+        second = next(allocator.generate(1, 1))
+        after_block = counters.reserve("x01", 1)
+
+        def serial(barcode):
+            return int(barcode[3:11], 16) * 1000 + int(barcode[11:])
+        assert serial(second) == serial(first) + 1
+        assert after_block == serial(first) + 1000
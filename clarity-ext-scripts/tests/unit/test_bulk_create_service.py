@@ -0,0 +1,105 @@
+import threading
+from xml.etree import ElementTree
+from clarity_ext_scripts.covid.services.bulk_create_service import *
+from mock import MagicMock, patch
+
+
+class FakeLims(object):
+    """Answers the batch create requests with links to the created entities, in the order
+    of the request or reversed"""
+
+    def __init__(self, reverse_links=False):
+        self.posts = list()
+        self.names_by_uri = dict()
+        self.reverse_links = reverse_links
+        self.lock = threading.Lock()
+
+    def get_uri(self, *segments):
+        return "http://lims/api/v2/" + "/".join(segments)
+
+    def post(self, uri, data):
+        details = ElementTree.fromstring(data)
+        with self.lock:
+            self.posts.append((uri, details))
+            number = len(self.posts)
+        endpoint = uri.split("/")[-3]
+        links = ElementTree.Element("{http://genologics.com/ri}links")
+        created = list(enumerate(details))
+        if self.reverse_links:
+            created.reverse()
+        for i, node in created:
+            link = "http://lims/api/v2/{}/{}-{}".format(endpoint, number, i)
+            with self.lock:
+                self.names_by_uri[link] = node.find("name").text
+            ElementTree.SubElement(links, "link", uri=link, rel=endpoint)
+        return links
+
+    def names(self, endpoint, links):
+        return [self.names_by_uri[link] for link in links]
+
+
+class TestBulkCreateService(object):
+
+    def create(self, containers, chunk_size=CHUNK_SIZE, reverse_links=False):
+        lims = FakeLims(reverse_links)
+        lims.get_projects = MagicMock(return_value=[MagicMock(uri="http://lims/api/v2/projects/1")])
+        lims.get_container_types = MagicMock(return_value=[MagicMock(uri="http://lims/api/v2/containertypes/2")])
+        with patch.object(BulkCreateService, "_fetch_artifacts"), \
+                patch.object(BulkCreateService, "_names", lims.names):
+            BulkCreateService(lims, chunk_size=chunk_size).create(containers, "Covid19")
+        return lims
+
+    def test_creates_plates_with_samples_in_wells(self):
+        plate = NewContainer("COVID_PREXT")
+        plate["A01"] = NewSample("sample1", udf={"Control": "False"})
+        plate["B:1"] = NewSample("sample2")
+
+        lims = self.create([plate])
+
+        assert [uri for uri, _ in lims.posts] == ["http://lims/api/v2/containers/batch/create",
+                                                  "http://lims/api/v2/samples/batch/create"]
+        assert plate.uri == "http://lims/api/v2/containers/1-0"
+        assert plate.id == "1-0"
+        assert [sample.uri for sample in plate.samples] == ["http://lims/api/v2/samples/2-0",
+                                                            "http://lims/api/v2/samples/2-1"]
+        containers, samples = [details for _, details in lims.posts]
+        assert containers.tag == samples.tag == "{http://genologics.com/ri}details"
+        assert [node.tag for node in containers] == ["{http://genologics.com/ri/container}container"]
+        assert [node.tag for node in samples] == ["{http://genologics.com/ri/sample}samplecreation"] * 2
+        assert containers[0].find("name").text == "COVID_PREXT"
+        assert [node.find("location/value").text for node in samples] == ["A:1", "B:1"]
+        assert samples[0].find("location/container").get("uri") == plate.uri
+        udf = samples[0].find("{http://genologics.com/ri/userdefined}field")
+        assert (udf.get("name"), udf.get("type"), udf.text) == ("Control", "String", "False")
+
+    def test_matches_the_created_samples_by_name(self):
+        plate = NewContainer("COVID_PREXT")
+        plate["A:1"] = NewSample("sample1")
+        plate["B:1"] = NewSample("sample2")
+
+        self.create([plate], reverse_links=True)
+
+        assert [sample.uri for sample in plate.samples] == ["http://lims/api/v2/samples/2-0",
+                                                            "http://lims/api/v2/samples/2-1"]
+
+    def test_udf_types(self):
+        assert udf_type_and_text(True) == ("Boolean", "true")
+        assert udf_type_and_text(1.5) == ("Numeric", "1.5")
+        assert udf_type_and_text("BB0001") == ("String", "BB0001")
+
+    def test_creates_tubes_in_chunks(self):
+        tubes = list()
+        for i in range(5):
+            tube = NewContainer("COVID_DISCARD_{}".format(i), container_type=CONTAINER_TYPE_TUBE)
+            tube.append(NewSample("sample{}".format(i)))
+            tubes.append(tube)
+
+        lims = self.create(tubes, chunk_size=2)
+
+        # The samples of a chunk of tubes may be created before or after the next chunk of tubes
+        sizes = [(uri.split("/")[-3], len(details)) for uri, details in lims.posts]
+        assert sorted(sizes) == [("containers", 1), ("containers", 2), ("containers", 2),
+                                 ("samples", 1), ("samples", 2), ("samples", 2)]
+        assert len(set(tube.uri for tube in tubes)) == 5
+        assert len(set(tube.samples[0].uri for tube in tubes)) == 5
+        assert [tube.samples[0].well for tube in tubes] == ["1:1"] * 5
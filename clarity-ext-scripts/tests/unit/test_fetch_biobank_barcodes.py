@@ -0,0 +1,109 @@
+import io
+from mock import MagicMock
+import pytest
+
+pytest.importorskip("clarity_ext")
+
+from clarity_ext.domain.validation import UsageError
+from clarity_ext_scripts.covid.fetch_biobank_barcodes import *
+
+# Two destination plates, in the 4 column format
+BIOBANK_LIST = u"""Well,Biobank barcode,Some text,Plate barcode
+A01,BB0001,x,DWP200601
+B01,BB0002,x,DWP200601
+C01,NO TUBE,x,DWP200601
+A01,BB0101,x,DWP200602
+B01,BB0102,x,DWP200602
+"""
+
+SAMPLE_LIST_HEADER = u"Position,Sample Id\n"
+SAMPLE_LIST_FOOTER = u"Sample Tracking Report Name,report\n"
+
+
+class FakeContext(object):
+    """Serves the shared files of a run, and counts how often they are read"""
+
+    def __init__(self, sample_rows, sample_list_filename="DWP200602_sample_list.csv",
+                 biobank_list=BIOBANK_LIST):
+        self.files = {
+            RAW_BIOANK_LIST: biobank_list,
+            RAW_SAMPLE_LIST: SAMPLE_LIST_HEADER + u"".join(
+                u"{},{}\n".format(position, sample_id) for position, sample_id in sample_rows) +
+            SAMPLE_LIST_FOOTER,
+        }
+        self.reads = list()
+        self.file_service = MagicMock()
+        self.file_service.list_filenames.return_value = [sample_list_filename]
+
+    def local_shared_file(self, name):
+        self.reads.append(name)
+        return io.StringIO(self.files[name])
+
+
+class TestFetchBiobankBarcodes(object):
+
+    def test_maps_the_samples_of_the_plate_in_the_file_name(self):
+        context = FakeContext([("A01", "1234"), ("B01", "5678")])
+
+        barcodes = FetchBiobankBarcodes(context).biobank_barcode_by_sample_referral_code()
+
+        assert barcodes == {"1234": "BB0101", "5678": "BB0102"}
+
+    def test_model_has_the_tubes_of_all_plates(self):
+        model = FetchBiobankBarcodes(FakeContext([])).model
+
+        assert model.plate_barcodes == frozenset(["DWP200601", "DWP200602"])
+        assert model.plate_barcode == "DWP200602"
+        assert model.tube("A1").biobank_barcode == "BB0101"
+        assert model.tube("A1", plate_barcode="DWP200601").biobank_barcode == "BB0001"
+        assert model.tube("C1") is None
+
+    def test_sample_list_matching_no_plate(self):
+        context = FakeContext([("A01", "1234")], sample_list_filename="DWP200699_sample_list.csv")
+
+        with pytest.raises(UsageError) as error:
+            FetchBiobankBarcodes(context).validate()
+        assert "not matching" in str(error.value)
+
+    def test_sample_list_matching_two_plates(self):
+        biobank_list = BIOBANK_LIST + u"A01,BB0201,x,DWP20060\n"
+        context = FakeContext([("A01", "1234")], biobank_list=biobank_list)
+
+        with pytest.raises(UsageError) as error:
+            FetchBiobankBarcodes(context).validate()
+        assert "DWP20060, DWP200602" in str(error.value)
+
+    def test_filled_well_without_a_tube_is_a_usage_error(self):
+        context = FakeContext([("A01", "1234")], sample_list_filename="DWP200601_sample_list.csv")
+        FetchBiobankBarcodes(context).validate()
+
+        context = FakeContext([("A01", "1234"), ("C01", "5678")],
+                              sample_list_filename="DWP200601_sample_list.csv")
+        with pytest.raises(UsageError) as error:
+            FetchBiobankBarcodes(context).validate()
+        assert "sample list well: C01" in str(error.value)
+
+    def test_empty_well_without_a_tube_is_skipped(self):
+        context = FakeContext([("A01", "1234"), ("C01", "")],
+                              sample_list_filename="DWP200601_sample_list.csv")
+        fetch = FetchBiobankBarcodes(context)
+
+        fetch.validate()
+        assert fetch.biobank_barcode_by_sample_referral_code() == {"1234": "BB0001"}
+
+    def test_sample_well_missing_from_the_biobank_list(self):
+        context = FakeContext([("A01", "1234"), ("D01", "5678")])
+
+        with pytest.raises(UsageError) as error:
+            FetchBiobankBarcodes(context).biobank_barcode_by_sample_referral_code()
+        assert "well D01 of the plate DWP200602" in str(error.value)
+
+    def test_files_are_parsed_once_per_context(self):
+        context = FakeContext([("A01", "1234")])
+
+        FetchBiobankBarcodes(context).validate()
+        FetchBiobankBarcodes(context).biobank_barcode_by_sample_referral_code()
+        FetchBiobankBarcodes(context).biobank_barcode_by_sample_referral_code()
+
+        assert sorted(context.reads) == [RAW_BIOANK_LIST, RAW_SAMPLE_LIST]
+        assert FetchBiobankBarcodes(FakeContext([])).model is not getattr(context, CONTEXT_CACHE_ATTRIBUTE)
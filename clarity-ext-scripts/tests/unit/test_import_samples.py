@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from mock import MagicMock, call
+import pytest
+
+pytest.importorskip("clarity_ext")
+
+from clarity_ext_scripts.covid import import_samples
+from clarity_ext_scripts.covid.create_samples import common
+from clarity_ext_scripts.covid.create_samples.sample_list import ValidatedSampleListFile
+from clarity_ext_scripts.covid.partner_api_client import KARLSSON_AND_NOVAK, ORG_URI_BY_NAME
+from clarity_ext_scripts.covid.services.bulk_create_service import NewContainer, NewSample
+
+ORG_URI = ORG_URI_BY_NAME[KARLSSON_AND_NOVAK]
+
+
+class FakeCsv(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def iterrows(self):
+        return enumerate(self.rows)
+
+
+class FakeSampleList(object):
+    COLUMN_REFERENCE = ValidatedSampleListFile.COLUMN_REFERENCE
+    COLUMN_ORG_URI = ValidatedSampleListFile.COLUMN_ORG_URI
+
+    def __init__(self, referral_codes):
+        self.csv = FakeCsv([{self.COLUMN_REFERENCE: code, self.COLUMN_ORG_URI: ORG_URI}
+                            for code in referral_codes])
+
+
+class TestReferringClinicBySample(object):
+
+    def referring_clinic_by_sample(self, monkeypatch, patients):
+        providers = dict((code, MagicMock(patient=patient)) for code, patient in patients.items())
+        monkeypatch.setattr(import_samples.ServiceRequestProvider, "create_many",
+                            classmethod(lambda cls, client, org_uri, codes: providers))
+        extension = import_samples.Extension(MagicMock())
+        extension.client = None
+        return extension.referring_clinic_by_sample(FakeSampleList(sorted(patients)))
+
+    def test_patient_without_managing_organization(self, monkeypatch):
+        clinics = self.referring_clinic_by_sample(monkeypatch, {
+            "1234": {"managingOrganization": {"display": u"Vårdcentralen Solna"}},
+            "5678": {"resourceType": "Patient"},
+            "9012": None,
+        })
+
+        assert clinics == {(ORG_URI, "1234"): "Vrdcentralen Solna",
+                           (ORG_URI, "5678"): "",
+                           (ORG_URI, "9012"): ""}
+
+
+class TestCreateContainers(object):
+
+    def extension(self, config):
+        extension = import_samples.Extension(MagicMock())
+        extension.config = config
+        extension.context.current_step.udf_assign_to_workflow = "Covid19"
+        return extension
+
+    def plates(self):
+        prext, biobank = NewContainer("COVID_PREXT"), NewContainer("COVID_BIOBANK")
+        prext["A:1"] = NewSample("sample1")
+        biobank["A:1"] = NewSample("sample1_BIOBANK")
+        return prext, biobank
+
+    def test_creates_the_containers_one_at_a_time_by_default(self, monkeypatch):
+        monkeypatch.setattr(common, "domain_container", lambda container, project: container.name)
+        extension = self.extension({})
+        prext, biobank = self.plates()
+
+        created = extension.create_containers([prext, biobank], assign_to_workflow=[prext])
+
+        create_container = extension.context.clarity_service.create_container
+        assert create_container.call_args_list == [
+            call("COVID_PREXT", with_samples=True, assign_to="Covid19"),
+            call("COVID_BIOBANK", with_samples=True)]
+        assert created == [create_container.return_value] * 2
+
+    def test_creates_the_containers_in_bulk_if_configured(self, monkeypatch):
+        bulk_create_service = MagicMock()
+        routing_service = MagicMock()
+        monkeypatch.setattr(common, "BulkCreateService", lambda lims: bulk_create_service)
+        monkeypatch.setattr(common, "RoutingService", lambda lims: routing_service)
+        extension = self.extension({"covid.bulk_create": True})
+        prext, biobank = self.plates()
+
+        created = extension.create_containers([prext, biobank], assign_to_workflow=[prext])
+
+        bulk_create_service.create.assert_called_once_with([prext, biobank], extension.context.current_step.udf_project)
+        routing_service.add.assert_called_once_with([prext.samples[0].artifact], "Covid19")
+        routing_service.route.assert_called_once_with()
+        assert created == [prext, biobank]
+        assert not extension.context.clarity_service.create_container.called
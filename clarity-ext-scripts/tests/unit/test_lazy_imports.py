@@ -0,0 +1,64 @@
+import json
+import pkgutil
+import subprocess
+import sys
+
+import pytest
+
+import clarity_ext_scripts
+
+
+# Every button press in Clarity imports the extension module in a new process, so the
+# modules that are slow to import must only be imported when they're used. genologics
+# isn't listed, since clarity-ext imports it before any extension anyway
+HEAVY_MODULES = ["pandas", "numpy", "suds", "yaml", "lxml"]
+
+# Imported before the measurement, since clarity-ext imports these before the extension
+BASELINE_MODULES = ["clarity_ext.extensions", "clarity_ext_scripts"]
+
+IMPORT = """
+import json, sys
+for module in {baseline!r}:
+    try:
+        __import__(module)
+    except ImportError:
+        pass
+before = set(sys.modules)
+try:
+    __import__({module!r})
+except ImportError as e:
+    print(json.dumps({{"import_error": str(e)}}))
+    sys.exit(0)
+heavy = [module for module in {heavy!r} if module in sys.modules and module not in before]
+print(json.dumps({{"heavy": heavy}}))
+"""
+
+
+def extension_modules():
+    return sorted(name for _, name, _ in pkgutil.walk_packages(
+        clarity_ext_scripts.__path__, clarity_ext_scripts.__name__ + "."))
+
+
+def import_in_new_process(module):
+    script = IMPORT.format(baseline=BASELINE_MODULES, module=module, heavy=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, "-c", script])
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+class TestLazyImports(object):
+
+    @pytest.mark.parametrize("module", extension_modules())
+    def test_import_does_not_import_heavy_modules(self, module):
+        result = import_in_new_process(module)
+        if "import_error" in result:
+            if "clarity_ext_scripts" in result["import_error"]:
+                pytest.fail(result["import_error"])
+            pytest.skip("Dependency not installed: {}".format(result["import_error"]))
+        assert result["heavy"] == [], "Importing {} imports {}".format(module, result["heavy"])
+
+    def test_label_printer_is_created_on_first_use(self):
+        from clarity_ext_scripts.covid import label_printer
+        printer = label_printer.LazyLabelPrinterService()
+        assert printer._service is None
+        assert printer.printer.contents == []
+        assert isinstance(printer._service, label_printer.LabelPrinterService)
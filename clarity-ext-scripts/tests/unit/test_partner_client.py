@@ -328,3 +328,114 @@ class TestPartnerAPIV7Client(object):
                 res = self.client.create_anonymous_service_request(
                     referral_code="123")
                 mock_post_response_ctl.assert_called_once()
+
+
+class TestPartnerAPIV7ClientSearch(object):
+    """
+    Searches for ServiceRequests against a local stand-in for the FHIR API
+    """
+    ORG = "http://example.com/id/Identifier/i-external-lab-id/region-stockholm-karolinska"
+
+    def client(self, fhir_server):
+        return PartnerAPIV7Client(test_partner_base_url=fhir_server.base_url,
+                                  test_partner_code_system_base_url="http://uri.example.com",
+                                  test_partner_user="api-1",
+                                  test_partner_password="1337")
+
+    def test_bulk_search_finds_many_identifiers_in_one_request(self, fhir_server):
+        for i in range(5):
+            fhir_server.add_service_request(str(i), self.ORG, "ABC{}".format(i))
+        fhir_server.add_service_request("other", "http://example.com/other-org", "ABC1")
+
+        results = self.client(fhir_server).bulk_search_for_service_requests(
+            self.ORG, ["ABC{}".format(i) for i in range(5)])
+
+        assert len(fhir_server.requests) == 1
+        assert dict((code, entry["resource"]["id"]) for code, entry in results.items()) == \
+            {"ABC0": "0", "ABC1": "1", "ABC2": "2", "ABC3": "3", "ABC4": "4"}
+
+    def test_bulk_search_classifies_not_found_and_duplicates(self, fhir_server):
+        fhir_server.add_service_request("1", self.ORG, "ABC1")
+        fhir_server.add_service_request("2", self.ORG, "ABC2")
+        fhir_server.add_service_request("3", self.ORG, "ABC2")
+
+        results = self.client(fhir_server).bulk_search_for_service_requests(
+            self.ORG, ["ABC1", "ABC2", "ABC3"])
+
+        assert results["ABC1"]["resource"]["id"] == "1"
+        assert isinstance(results["ABC2"], MoreThanOneOrganizationReferralCodeFound)
+        assert isinstance(results["ABC3"], OrganizationReferralCodeNotFound)
+
+    def test_bulk_search_follows_the_next_links(self, fhir_server):
+        fhir_server.add_service_request("1", self.ORG, "ABC1")
+        fhir_server.add_service_request("2", self.ORG, "ABC1")
+        fhir_server.add_service_request("3", self.ORG, "ABC2")
+
+        # The duplicate makes the server return three ServiceRequests for two identifiers,
+        # which don't fit on one page
+        results = self.client(fhir_server).bulk_search_for_service_requests(
+            self.ORG, ["ABC1", "ABC2"])
+
+        assert len(fhir_server.requests) == 2
+        assert isinstance(results["ABC1"], MoreThanOneOrganizationReferralCodeFound)
+        assert results["ABC2"]["resource"]["id"] == "3"
+
+    def test_bulk_search_raises_when_the_search_fails(self, fhir_server):
+        client = PartnerAPIV7Client(test_partner_base_url=fhir_server.base_url + "/missing",
+                                    test_partner_code_system_base_url="http://uri.example.com",
+                                    test_partner_user="api-1",
+                                    test_partner_password="1337")
+        with pytest.raises(FailedInContactingTestPartner):
+            client.bulk_search_for_service_requests(self.ORG, ["ABC1"])
+
+    def test_can_search_for_a_plate_in_order(self, fhir_server):
+        codes = ["ABC{}".format(i) for i in range(94)]
+        for i, code in enumerate(codes):
+            if i != 3:
+                fhir_server.add_service_request(str(i), self.ORG, code)
+
+        results = self.client(fhir_server).search_for_service_requests(self.ORG, codes)
+
+        assert len(fhir_server.requests) == 5
+        assert [result["resource"]["id"] for result in results if isinstance(result, dict)] == \
+            [str(i) for i in range(94) if i != 3]
+        assert isinstance(results[3], OrganizationReferralCodeNotFound)
+
+    def test_bulk_search_can_include_the_patients_and_organizations(self, fhir_server):
+        fhir_server.add({"resourceType": "Organization", "id": "1", "name": "Clinic"})
+        fhir_server.add({"resourceType": "Organization", "id": "2", "name": "Unused"})
+        fhir_server.add_patient("10", organization="1")
+        fhir_server.add_patient("11", organization="1")
+        fhir_server.add_service_request("100", self.ORG, "ABC1", patient="10")
+        fhir_server.add_service_request("101", self.ORG, "ABC2", patient="11")
+
+        included = dict()
+        results = self.client(fhir_server).bulk_search_for_service_requests(
+            self.ORG, ["ABC1", "ABC2"], included)
+
+        assert len(fhir_server.requests) == 1
+        assert results["ABC1"]["resource"]["id"] == "100"
+        assert sorted(included) == ["Organization/1", "Patient/10", "Patient/11"]
+        assert included["Organization/1"]["name"] == "Clinic"
+
+    def test_resources_and_searches_are_cached(self, fhir_server, tmpdir):
+        fhir_server.add({"resourceType": "Organization", "id": "1", "name": "Clinic"})
+        fhir_server.add_patient("10", organization="1")
+        fhir_server.add_service_request("100", self.ORG, "ABC1", patient="10")
+        client = PartnerAPIV7Client(test_partner_base_url=fhir_server.base_url,
+                                    test_partner_code_system_base_url="http://uri.example.com",
+                                    test_partner_user="api-1",
+                                    test_partner_password="1337",
+                                    test_partner_cache_path=str(tmpdir.join("cache.sqlite")))
+
+        for _ in range(2):
+            client.get_by_reference("Organization/1")
+            client.search_for_service_request(self.ORG, "ABC1")
+        assert client.bulk_search_for_service_requests(self.ORG, ["ABC1"])["ABC1"]["resource"]["id"] == "100"
+        assert len(fhir_server.requests) == 2
+        assert client.cache.hits == {"Organization": 1, "ServiceRequest": 2}
+
+        with patch.object(Session, "post", return_value=TestPartnerAPIV7Client.MockOkPostResponse()):
+            client.post_diagnosis_report("100", COVID_RESPONSE_NEGATIVE, [{"value": 0}])
+        client.search_for_service_request(self.ORG, "ABC1")
+        assert len(fhir_server.requests) == 3
@@ -0,0 +1,71 @@
+import logging
+import os
+import stat
+import time
+from clarity_ext_scripts.covid.resource_cache import ResourceCache
+from mock import patch
+
+
+class TestResourceCache(object):
+
+    def cache(self, tmpdir, **kwargs):
+        return ResourceCache(str(tmpdir.join("cache", "resources.sqlite")), **kwargs)
+
+    def test_resources_are_shared_between_caches_of_the_same_file(self, tmpdir):
+        organization = {"resourceType": "Organization", "id": "1", "alias": ["AB"]}
+        self.cache(tmpdir).set_resource(organization)
+
+        cache = self.cache(tmpdir)
+        assert cache.get("Organization/1", "Organization") == organization
+        assert cache.get("Organization/2", "Organization") is None
+        assert cache.stats() == {"hits": {"Organization": 1}, "misses": {"Organization": 1}}
+
+    def test_resources_expire_by_type(self, tmpdir):
+        cache = self.cache(tmpdir, ttl_by_resource_type={"Organization": 100, "ServiceRequest": 10})
+        cache.set_resource({"resourceType": "Organization", "id": "1"})
+        cache.set_resource({"resourceType": "ServiceRequest", "id": "2"})
+        cache.set_resource({"resourceType": "Consent", "id": "3"})
+
+        now = time.time()
+        with patch("time.time", return_value=now + 50):
+            assert cache.get("Organization/1", "Organization") is not None
+            assert cache.get("ServiceRequest/2", "ServiceRequest") is None
+        assert cache.get("Consent/3", "Consent") is None
+
+    def test_invalidate_removes_the_resource_and_its_searches(self, tmpdir):
+        cache = self.cache(tmpdir)
+        service_request = {"resource": {"resourceType": "ServiceRequest", "id": "2"}}
+        cache.set("ServiceRequest?identifier=org|ABC1", "ServiceRequest", "2", service_request)
+        cache.set_resource(service_request["resource"])
+
+        cache.invalidate("ServiceRequest", "2")
+
+        assert cache.get("ServiceRequest?identifier=org|ABC1", "ServiceRequest") is None
+        assert cache.get("ServiceRequest/2", "ServiceRequest") is None
+
+    def test_only_the_owner_can_read_the_cache(self, tmpdir):
+        cache = self.cache(tmpdir)
+        cache.set_resource({"resourceType": "Patient", "id": "10"})
+
+        assert stat.S_IMODE(os.stat(str(tmpdir.join("cache"))).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o600
+
+    def test_an_existing_file_is_made_private(self, tmpdir):
+        path = tmpdir.join("resources.sqlite")
+        path.write("")
+        os.chmod(str(path), 0o644)
+
+        ResourceCache(str(path))
+
+        assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o600
+
+    def test_stats_are_logged_when_closed(self, tmpdir, caplog):
+        cache = self.cache(tmpdir)
+        cache.get("Organization/1", "Organization")
+
+        with caplog.at_level(logging.INFO):
+            cache.close()
+            cache.close()
+
+        assert caplog.text.count("Resource cache stats") == 1
+        assert "'misses': {'Organization': 1}" in caplog.text
@@ -0,0 +1,51 @@
+from requests import HTTPError
+from clarity_ext_scripts.covid.services.routing_service import *
+from mock import MagicMock
+import pytest
+
+
+class TestRoutingService(object):
+
+    def lims(self, fail=0):
+        lims = MagicMock()
+        lims.get_workflows.side_effect = lambda name: [MagicMock(uri="http://lims/workflows/" + name)]
+        errors = [HTTPError("500")] * fail
+
+        def route(artifacts, workflow_uri):
+            if errors:
+                raise errors.pop()
+        lims.route_artifacts.side_effect = route
+        return lims
+
+    def test_routes_all_artifacts_of_a_run_in_chunks(self):
+        lims = self.lims()
+        service = RoutingService(lims, chunk_size=1000)
+        service.add(range(1500), "COVID")
+        service.add(range(1500, 2500), "COVID")
+        service.add(range(10), "Biobank")
+
+        summary = service.route()
+
+        assert summary.routed == {"COVID": 2500, "Biobank": 10}
+        assert summary.requests == 4
+        calls = [(len(call[0][0]), call[1]["workflow_uri"]) for call in lims.route_artifacts.call_args_list]
+        assert calls == [(10, "http://lims/workflows/Biobank"), (1000, "http://lims/workflows/COVID"),
+                         (1000, "http://lims/workflows/COVID"), (500, "http://lims/workflows/COVID")]
+
+    def test_retries_failed_chunks(self):
+        service = RoutingService(self.lims(fail=2), tries=3, delay=0)
+        service.add(range(10), "COVID")
+
+        summary = service.route()
+
+        assert summary.routed == {"COVID": 10}
+        assert summary.requests == 3
+
+    def test_raises_with_a_summary_when_a_chunk_fails_all_tries(self):
+        service = RoutingService(self.lims(fail=3), chunk_size=5, tries=3, delay=0)
+        service.add(range(10), "COVID")
+
+        with pytest.raises(RoutingFailed) as e:
+            service.route()
+        assert str(e.value) == "Routed 5 artifacts to 1 workflows in 4 requests, " \
+                               "failed to route 5 artifacts to 'COVID'"
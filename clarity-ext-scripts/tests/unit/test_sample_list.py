@@ -0,0 +1,37 @@
+import pytest
+from clarity_ext_scripts.covid.create_samples.sample_list import ValidatedSampleListFile
+
+pd = pytest.importorskip("pandas")
+
+
+class TestValidatedSampleListFile(object):
+
+    def sample_list(self):
+        return ValidatedSampleListFile(pd.DataFrame(
+            {ValidatedSampleListFile.COLUMN_REFERENCE: ["CONTROL", "1234", "5678", "9012"]}, dtype="string"))
+
+    def test_sets_the_search_results_of_the_samples_only(self):
+        f = self.sample_list()
+        is_sample = [False, True, True, True]
+        f.set_columns({f.COLUMN_SERVICE_REQUEST_ID: "", f.COLUMN_STATUS: f.STATUS_OK, f.COLUMN_COMMENT: ""})
+
+        f.set_search_results([("sr-1234", f.STATUS_OK, "", "org"),
+                              ("", f.STATUS_UNREGISTERED, "Not found, anonymous", "knm"),
+                              ("", f.STATUS_ERROR, "Failed", "org")], rows=is_sample)
+
+        assert f.csv[f.COLUMN_SERVICE_REQUEST_ID].tolist() == ["", "sr-1234", "", ""]
+        assert f.csv[f.COLUMN_STATUS].tolist() == ["ok", "ok", "unregistered", "error"]
+        assert f.csv[f.COLUMN_COMMENT].tolist() == ["", "", "Not found<SC> anonymous", "Failed"]
+        assert f.csv[f.COLUMN_ORG_URI].isna().tolist() == [True, False, False, False]
+        assert f.csv[f.COLUMN_ORG_URI].tolist()[1:] == ["org", "knm", "org"]
+
+    def test_statuses(self):
+        f = self.sample_list()
+        f.set_columns({f.COLUMN_STATUS: [f.STATUS_OK, f.STATUS_ERROR, f.STATUS_UNREGISTERED, f.STATUS_ERROR]})
+
+        assert f.references_with_status(f.STATUS_ERROR) == ["1234", "9012"]
+        assert f.rows_with_status(f.STATUS_UNREGISTERED).tolist() == [False, False, True, False]
+        assert f.unexpected_statuses() == []
+
+        f.csv.loc[0, f.COLUMN_STATUS] = None
+        assert len(f.unexpected_statuses()) == 1
@@ -0,0 +1,61 @@
+from clarity_ext_scripts.wells import (PLATE_96, PLATE_384, PADDED, COLON, InvalidWell, all_wells,
+                                       format_wells, parse_wells, plate_format_of_container_type,
+                                       sort_columnwise, well_indexes, wells_from_indexes)
+import clarity_ext_scripts.wells
+import io
+import os
+import pytest
+
+# The copy that the scripts at the top level of the repository use
+TOP_LEVEL_WELLS = os.path.join(os.path.dirname(__file__), "..", "..", "..", "wells.py")
+
+
+class TestWells(object):
+
+    def test_parse_all_spellings(self):
+        assert parse_wells(["A1", "A01", "A:1", "a:01", " B12 "]) == [(0, 0), (0, 0), (0, 0), (0, 0), (1, 11)]
+
+    def test_indexes_on_96_well_plate(self):
+        assert well_indexes(["A:1", "B:1", "A:2", "H:12"]) == [0, 1, 8, 95]
+
+    def test_indexes_on_384_well_plate(self):
+        assert well_indexes(["A1", "P1", "A2", "P24"]) == [0, 15, 16, 383]
+
+    def test_indexes_on_384_well_plate_in_the_96_well_corner(self):
+        assert well_indexes(["A1", "B1", "A2"], PLATE_384) == [0, 1, 16]
+
+    def test_plate_format_of_container_type(self):
+        assert plate_format_of_container_type("96 well plate") is PLATE_96
+        assert plate_format_of_container_type("384 well plate") is PLATE_384
+        with pytest.raises(ValueError):
+            plate_format_of_container_type("Tube")
+
+    def test_rowwise_indexes(self):
+        assert well_indexes(["A1", "A2", "B1"], PLATE_96, columnwise=False) == [0, 1, 12]
+
+    def test_well_outside_plate_format(self):
+        with pytest.raises(InvalidWell):
+            well_indexes(["I1"], PLATE_96)
+
+    def test_invalid_well(self):
+        with pytest.raises(InvalidWell):
+            parse_wells(["A1", "Q1"])
+
+    def test_format_wells(self):
+        assert format_wells(["A1", "B:12"], style=PADDED) == ["A01", "B12"]
+        assert format_wells(["A01", "B12"], style=COLON) == ["A:1", "B:12"]
+
+    def test_indexes_round_trip(self):
+        wells = all_wells(PLATE_384)
+        assert wells_from_indexes(well_indexes(wells), PLATE_384) == wells
+
+    def test_sort_columnwise(self):
+        assert sort_columnwise(["A:2", "B:1", "A:1"], lambda well: well) == ["A:1", "B:1", "A:2"]
+
+    def test_is_the_same_as_the_top_level_copy(self):
+        if not os.path.exists(TOP_LEVEL_WELLS):
+            pytest.skip("Not run from a checkout of the repository")
+        package_wells = os.path.splitext(clarity_ext_scripts.wells.__file__)[0] + ".py"
+        with io.open(TOP_LEVEL_WELLS, "rb") as top_level, io.open(package_wells, "rb") as package:
+            assert package.read() == top_level.read(), \
+                "clarity_ext_scripts/wells.py differs from wells.py at the top level of the repository"
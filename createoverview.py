@@ -6,10 +6,11 @@ from genologics.entities import Process
 from genologics.lims import Lims
 import genologics
 import logging
-import re
 import sys
 import xlwt
 
+from wells import sort_columnwise
+
 fields = {
     "Sample Name": None,
     "Original DNA Plate LIMS ID": None,
@@ -46,22 +47,6 @@ def get_field_style(field, red_threshold, orange_threshold):
             style = xlwt.Style.easyxf('pattern: pattern solid, fore_colour orange;')
     return style
 
-def sort_samples_columnwise(output, well_re):
-    """A1 -> 0, B1 -> 1, A2 -> 8, B2 -> 9
-        Column number is worth x * 8
-        Row letter is worth +y
-    """
-    row_letters = "ABCDEFGH"
-    match = re.search(well_re, output.location[1])
-    if not match:
-        raise(RuntimeError("No valid well position found for output '%s'!" % output.name))
-    row = match.group(1)
-    col = match.group(2)
-    row_index = row_letters.index(row)
-    col_value = (int(col) - 1) * 8
-
-    return col_value + row_index
-
 def find_output_artifact(name, p):
     for i, artifact in enumerate(p.all_outputs(unique=True)):
         if artifact.name == name:
@@ -76,9 +61,7 @@ def main(lims, args, epp_logger):
     for col, heading in enumerate(fields.keys()):
         new_sheet.write(0, col, heading)
     
-    well_re = re.compile("([A-Z]):*([0-9]{1,2})")
-    artifacts = p.all_inputs(unique=True)
-    artifacts.sort(key=lambda sample: sort_samples_columnwise(sample, well_re)) # wrap the call in a lambda to be able to pass in the regex
+    artifacts = sort_columnwise(p.all_inputs(unique=True), lambda sample: sample.location[1])
 
     if args.udfsOnOutput:
         outputs = [find_output_artifact(s.name, p) for s in artifacts] # required for the WGS step
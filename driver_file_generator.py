@@ -0,0 +1,301 @@
+from argparse import ArgumentParser
+import logging
+import re
+
+from genologics.entities import Process
+from genologics.lims import Lims
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Creates a driver file for an instrument from a DriverFileGenerator template,
+in place of DriverFileGenerator.jar so that no JVM is started.
+
+Only the part of the template language that our templates use is supported,
+see below. The output has not been compared byte for byte with the output of
+the jar: tests/fixtures/Fluent_input.csv was written by hand. The Create Fluent
+Input File automation keeps running the jar until a driver file produced by the
+jar has been committed as the fixture of tests/test_driver_file_generator.py.
+
+The template is compiled once into a list of literal strings and token lookups,
+and all data of the process (inputs, outputs and containers) is fetched with
+batch requests before the rows are rendered.
+
+Supported template directives:
+    INCLUDE.OUTPUT.RESULTFILES      Also make rows for the per input result files
+    OUTPUT.SEPARATOR,<separator>    COMMA, TAB or a literal separator
+    SORT.BY.<tokens>                Sort the rows on the rendered tokens, with
+                                    numbers compared by value (A2 before A10)
+    SORT.VERTICAL                   Sort the rows columnwise on the placement
+    <HEADER_BLOCK>...</HEADER_BLOCK> Lines written once before the data
+    <DATA>...</DATA>                Lines written once for every row
+    <PLACEMENT>...</PLACEMENT>      The placement script, see compile_placement
+
+Supported tokens:
+    ${INPUT.NAME} ${INPUT.LIMSID} ${INPUT.UDF.<name>}
+    ${INPUT.CONTAINER.NAME} ${INPUT.CONTAINER.LIMSID} ${INPUT.CONTAINER.TYPE}
+    ${INPUT.CONTAINER.ROW} ${INPUT.CONTAINER.COLUMN} ${INPUT.CONTAINER.PLACEMENT}
+    ${OUTPUT.NAME} ${OUTPUT.LIMSID} ${OUTPUT.UDF.<name>}
+    ${PROCESS.NAME} ${PROCESS.LIMSID}
+
+UDF values are written as they are stored in the LIMS, without reformatting.
+
+Usage, with the same options as DriverFileGenerator.jar (not in production yet, see above):
+    bash -c "/opt/gls/clarity/miniconda3/bin/python /opt/gls/clarity/customextensions/driver_file_generator.py
+    -i {processURI:v2:http} -u {username} -p {password}
+    -t /opt/gls/clarity/customextensions/driver_templates/Fluent_template.csv
+    -o {compoundOutputFileLuid4}.csv -l {compoundOutputFileLuid1}"
+"""
+
+UDF_NAMESPACE = "{http://genologics.com/ri/userdefined}"
+SEPARATORS = {"COMMA": ",", "TAB": "\t"}
+TOKEN_RE = re.compile(r"\$\{([^}]+)\}")
+BLOCKS = ("HEADER_BLOCK", "DATA", "PLACEMENT")
+
+
+class Row(object):
+    """An input and its output, with the container the input is placed in"""
+
+    def __init__(self, process, input_, output, container):
+        self.process = process
+        self.input = input_
+        self.output = output
+        self.container = container
+        self.container_row, _, self.container_column = input_.location[1].partition(":")
+
+
+class Template(object):
+    """A compiled DriverFileGenerator template"""
+
+    def __init__(self, header, data, placement, separator=",", include_result_files=False,
+                 sort_by=None, sort_vertical=False):
+        self.header = header
+        self.data = data
+        self.placement = placement
+        self.separator = separator
+        self.include_result_files = include_result_files
+        self.sort_by = sort_by
+        self.sort_vertical = sort_vertical
+
+    def render(self, rows):
+        """Renders the rows into the lines of the driver file"""
+        if self.sort_by is not None:
+            rows = sorted(rows, key=lambda row: natural_key(render_fragments(self.sort_by, row, self.placement)))
+        elif self.sort_vertical:
+            rows = sorted(rows, key=lambda row: (row.container.id, int_or_zero(row.container_column), row.container_row))
+        lines = [render_line(line, None, self.placement, self.separator) for line in self.header]
+        for row in rows:
+            lines.extend(render_line(line, row, self.placement, self.separator) for line in self.data)
+        return lines
+
+
+def natural_key(value):
+    """'A10' -> ['a', 10, ''], so that A2 sorts before A10"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", value)]
+
+
+def int_or_zero(value):
+    return int(value) if value.isdigit() else 0
+
+
+def udf_text(entity, name):
+    """The UDF value as stored in the LIMS, '' if not set"""
+    for field in entity.root.iter(UDF_NAMESPACE + "field"):
+        if field.get("name") == name:
+            return field.text or ""
+    return ""
+
+
+def container_type(container):
+    """The name of the container type, which is inlined in the container XML"""
+    node = container.root.find("type")
+    return node.get("name") if node is not None else ""
+
+
+def udf_token(entity_of_row, name):
+    return lambda row, placement: udf_text(entity_of_row(row), name)
+
+
+TOKENS = {
+    "INPUT.NAME": lambda row, placement: row.input.name,
+    "INPUT.LIMSID": lambda row, placement: row.input.id,
+    "INPUT.CONTAINER.NAME": lambda row, placement: row.container.name,
+    "INPUT.CONTAINER.LIMSID": lambda row, placement: row.container.id,
+    "INPUT.CONTAINER.TYPE": lambda row, placement: container_type(row.container),
+    "INPUT.CONTAINER.ROW": lambda row, placement: row.container_row,
+    "INPUT.CONTAINER.COLUMN": lambda row, placement: row.container_column,
+    "INPUT.CONTAINER.PLACEMENT": lambda row, placement: placement(row.container_row, row.container_column,
+                                                                  container_type(row.container)),
+    "OUTPUT.NAME": lambda row, placement: row.output.name,
+    "OUTPUT.LIMSID": lambda row, placement: row.output.id,
+    "PROCESS.NAME": lambda row, placement: row.process.type.name,
+    "PROCESS.LIMSID": lambda row, placement: row.process.id,
+}
+UDF_TOKENS = {
+    "INPUT.UDF.": lambda row: row.input,
+    "OUTPUT.UDF.": lambda row: row.output,
+}
+
+
+def compile_token(token):
+    if token in TOKENS:
+        return TOKENS[token]
+    for prefix, entity_of_row in UDF_TOKENS.items():
+        if token.startswith(prefix):
+            return udf_token(entity_of_row, token[len(prefix):])
+    raise(RuntimeError("Unsupported token '${%s}' in the template" % token))
+
+
+def compile_line(line):
+    """A template line -> a list of literal strings and token functions"""
+    fragments = []
+    position = 0
+    for match in TOKEN_RE.finditer(line):
+        if match.start() > position:
+            fragments.append(line[position:match.start()])
+        fragments.append(compile_token(match.group(1)))
+        position = match.end()
+    if position < len(line):
+        fragments.append(line[position:])
+    return fragments
+
+
+def render_fragments(fragments, row, placement):
+    return "".join(fragment if isinstance(fragment, str) else fragment(row, placement) for fragment in fragments)
+
+
+def render_line(columns, row, placement, separator):
+    return separator.join(render_fragments(fragments, row, placement) for fragments in columns)
+
+
+def compile_expression(expression):
+    """row + ":" + column -> a function of (row, column)"""
+    terms = []
+    for term in re.findall(r'"[^"]*"|[^+\s]+', expression):
+        if term.startswith('"'):
+            terms.append(lambda row, column, literal=term[1:-1]: literal)
+        elif term == "row":
+            terms.append(lambda row, column: row)
+        elif term == "column":
+            terms.append(lambda row, column: column)
+        else:
+            raise(RuntimeError("Unsupported term '%s' in the placement script" % term))
+    return lambda row, column: "".join(term(row, column) for term in terms)
+
+
+def compile_placement(lines):
+    """Compiles the Groovy placement script of the templates we use, i.e. a chain of
+
+        if (containerTypeNode.@name == "<container type>") return <expression>
+        else if (containerTypeNode.@name == "<container type>") return <expression>
+        else return <expression>
+
+    where an expression concatenates row, column and string literals with +.
+    Returns a function of (row, column, container type name).
+    """
+    script = " ".join(line.split("//")[0].strip() for line in lines).strip()
+    if not script:
+        return lambda row, column, type_name: row + ":" + column
+    branches = []
+    default = None
+    statement_re = re.compile(
+        r'(?:else\s+)?(?:if\s*\(\s*containerTypeNode\.@name\s*==\s*"([^"]*)"\s*\)\s*)?return\s+(.+?)'
+        r'(?=\s+else\b|$)')
+    position = 0
+    for match in statement_re.finditer(script):
+        if script[position:match.start()].strip():
+            break
+        type_name, expression = match.groups()
+        if type_name is None:
+            default = compile_expression(expression)
+        else:
+            branches.append((type_name, compile_expression(expression)))
+        position = match.end()
+    if script[position:].strip():
+        raise(RuntimeError("Unsupported placement script: %s" % script))
+
+    def placement(row, column, type_name):
+        for branch_type, expression in branches:
+            if type_name == branch_type:
+                return expression(row, column)
+        if default is None:
+            raise(RuntimeError("No placement for container type '%s'" % type_name))
+        return default(row, column)
+    return placement
+
+
+def compile_template(text):
+    """Parses and compiles a DriverFileGenerator template"""
+    blocks = {block: [] for block in BLOCKS}
+    options = {}
+    block = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if block is not None:
+            if stripped == "</%s>" % block:
+                block = None
+            else:
+                blocks[block].append(line)
+            continue
+        if not stripped:
+            continue
+        match = re.match(r"<(\w+)>$", stripped)
+        if match:
+            block = match.group(1)
+            if block not in BLOCKS:
+                raise(RuntimeError("Unsupported template block <%s>" % block))
+        elif stripped == "INCLUDE.OUTPUT.RESULTFILES":
+            options["include_result_files"] = True
+        elif stripped.startswith("OUTPUT.SEPARATOR,"):
+            separator = stripped.split(",", 1)[1]
+            options["separator"] = SEPARATORS.get(separator, separator)
+        elif stripped.startswith("SORT.BY."):
+            options["sort_by"] = compile_line(stripped[len("SORT.BY."):])
+        elif stripped == "SORT.VERTICAL":
+            options["sort_vertical"] = True
+        else:
+            raise(RuntimeError("Unsupported template directive '%s'" % stripped))
+    if block is not None:
+        raise(RuntimeError("The template block <%s> is never closed" % block))
+
+    # the columns of the template lines are separated by commas and joined with the output separator
+    compile_columns = lambda lines: [[compile_line(column) for column in line.split(",")] for line in lines]
+    return Template(compile_columns(blocks["HEADER_BLOCK"]), compile_columns(blocks["DATA"]),
+                    compile_placement(blocks["PLACEMENT"]), **options)
+
+
+def get_rows(lims, process, include_result_files):
+    """The rows of the process, with all artifacts and containers fetched in batches"""
+    output_types = ("Analyte", "ResultFile") if include_result_files else ("Analyte",)
+    pairs = [(input_["uri"], output["uri"]) for input_, output in process.input_output_maps
+             if output and output["output-generation-type"] == "PerInput" and output["output-type"] in output_types]
+    lims.get_batch(set(artifact for pair in pairs for artifact in pair))
+    containers = set(input_.location[0] for input_, _ in pairs)
+    lims.get_batch(containers)
+    return [Row(process, input_, output, input_.location[0]) for input_, output in pairs]
+
+
+def main(lims, args):
+    with open(args.template) as template_file:
+        template = compile_template(template_file.read())
+    process = Process(lims, uri=args.processURI)
+    rows = get_rows(lims, process, template.include_result_files)
+    lines = template.render(rows)
+    with open(args.outputFile, "w", newline="") as output_file:
+        output_file.write("".join(line + "\n" for line in lines))
+    logging.info("Wrote %d rows for %s to %s", len(rows), process.id, args.outputFile)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-i', '--processURI', required=True, help='URI of the current process')
+    parser.add_argument('-u', '--username', required=True, help='username')
+    parser.add_argument('-p', '--password', required=True, help='password')
+    parser.add_argument('-t', '--template', required=True, help='The DriverFileGenerator template')
+    parser.add_argument('-o', '--outputFile', required=True, help='The driver file to write')
+    parser.add_argument('-l', '--log', help='The log file to write')
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=args.log, level=logging.INFO)
+    lims = Lims(args.processURI.split("/api/")[0], args.username, args.password)
+    main(lims, args)
@@ -1,35 +1,166 @@
-DESC = """Create an overview excel file on the Aggregate QC step""" 
+DESC = """Export the samples in a list of containers, the containers of a list of projects,
+or the containers modified since a date, to a CSV, xlsx or Parquet file.
+
+Usage:
+    python export_samples.py --containers 27-1449 27-1967 --output samples.csv
+    python export_samples.py --projects CTM101 --output samples.xlsx
+    python export_samples.py --since 2020-05-01 --until 2020-06-01 --output samples.parquet
+
+The containers are fetched concurrently, with one batch request for the artifacts
+of each container, and the rows are streamed to the output file in container order
+as soon as they are available.
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import os
+import sys
 
 from genologics.config import BASEURI, USERNAME, PASSWORD
+from genologics.entities import Container
 from genologics.lims import Lims
-import genologics
-import sys
-import xlwt
-
-def main(lims):
-    containers = [
-        "27-1449",
-        "27-1967",
-        "27-1453",
-        "27-2014",
-        "27-1988",
-    ]
-    for container in containers:
-        arts = lims.get_artifacts(containerlimsid=container)
-        new_workbook = xlwt.Workbook()
-        new_sheet = new_workbook.add_sheet('Sheet 1')
-        new_sheet.write(0, 0, container)
-        for i, artifact in enumerate(arts):
-            sample_name = artifact.name
-            container_name = artifact.location[0].name
-            well = artifact.location[1]
-            #print("%s / %s" % (container_name, container))
-            print("%s,%s" % (sample_name, well))
-            for col, field in enumerate([sample_name, container_name, well]):
-                new_sheet.write(i + 1, col, field)
-        new_workbook.save("sample_list_%s.xls" % container)
+
+COLUMNS = ["Container LIMS ID", "Container Name", "Well", "Sample Name", "Artifact LIMS ID"]
+
+
+def container_rows(lims, container_id):
+    """The rows of all artifacts in the container, fetched with one batch request"""
+    container = Container(lims, id=container_id)
+    container_name = container.name
+    arts = lims.get_artifacts(containerlimsid=container_id, resolve=True)
+    rows = [[container_id, container_name, artifact.location[1], artifact.name, artifact.id]
+            for artifact in arts]
+    rows.sort(key=lambda row: well_key(row[2]))
+    return rows
+
+
+def well_key(well):
+    """Columnwise order, 'B:1' before 'A:2'"""
+    row, _, col = well.partition(":")
+    return (int(col) if col.isdigit() else 0, row)
+
+
+def containers_in_projects(lims, projects):
+    """The containers of the analytes of all samples in the projects (names or LIMS IDs)"""
+    sample_ids = []
+    for project in projects:
+        samples = lims.get_samples(projectlimsid=project) or lims.get_samples(projectname=project)
+        sample_ids.extend(sample.id for sample in samples)
+    if not sample_ids:
+        return []
+    arts = lims.get_artifacts(samplelimsid=sample_ids, type="Analyte", resolve=True)
+    return unique([artifact.location[0].id for artifact in arts if artifact.location and artifact.location[0]])
+
+
+def containers_modified_between(lims, since, until=None):
+    """The containers last modified in the date range. The API can only filter on the
+    start of the range, so the containers modified since until are subtracted."""
+    containers = [container.id for container in lims.get_containers(last_modified=since + "T00:00:00Z")]
+    if until:
+        later = set(container.id for container in lims.get_containers(last_modified=until + "T00:00:00Z"))
+        containers = [container for container in containers if container not in later]
+    return containers
+
+
+def unique(items):
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
+
+
+class CsvWriter(object):
+    def __init__(self, filename):
+        self.file = open(filename, "w", newline="") if filename != "-" else sys.stdout
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class XlsxWriter(object):
+    def __init__(self, filename):
+        from openpyxl import Workbook
+        self.filename = filename
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Samples")
+        self.sheet.append(COLUMNS)
+
+    def write(self, rows):
+        for row in rows:
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.filename)
+
+
+class ParquetWriter(object):
+    def __init__(self, filename):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in COLUMNS])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = [list(column) for column in zip(*rows)]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+writers = {
+    ".csv": CsvWriter,
+    ".xlsx": XlsxWriter,
+    ".parquet": ParquetWriter,
+}
+
+
+def get_writer(filename):
+    extension = os.path.splitext(filename)[1].lower() if filename != "-" else ".csv"
+    if extension not in writers:
+        raise(RuntimeError("Unknown output format '%s'! Use one of: %s" % (extension, ", ".join(sorted(writers)))))
+    return writers[extension](filename)
+
+
+def main(lims, args):
+    containers = list(args.containers)
+    if args.projects:
+        containers.extend(containers_in_projects(lims, args.projects))
+    if args.since:
+        containers.extend(containers_modified_between(lims, args.since, args.until))
+    containers = unique(containers)
+    if not containers:
+        raise(RuntimeError("No containers to export, use --containers, --projects or --since"))
+
+    writer = get_writer(args.output)
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            # map yields the results in container order, as soon as each one is done
+            for container, rows in zip(containers, executor.map(lambda c: container_rows(lims, c), containers)):
+                print("%s: %d samples" % (container, len(rows)), file=sys.stderr)
+                writer.write(rows)
+    finally:
+        writer.close()
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('--containers', nargs='*', default=[], help='LIMS IDs of the containers to export')
+    parser.add_argument('--projects', nargs='*', default=[], help='Names or LIMS IDs of projects whose containers to export')
+    parser.add_argument('--since', help='Export the containers modified since this date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='Together with --since, skip the containers modified on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--output', default='-', help='The file to write to, the format is given by the extension (.csv, .xlsx or .parquet). Defaults to CSV on stdout.')
+    parser.add_argument('--workers', type=int, default=8, help='Number of containers to fetch concurrently')
+    args = parser.parse_args()
+
     lims = Lims(BASEURI, USERNAME, PASSWORD)
     lims.check_version()
-    main(lims)
+    main(lims, args)
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import re
+
+import numpy as np
+
+from wells import PLATE_96, format_wells, plate_format_of_container_type, well_indexes
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Shared normalization engine for the Tecan robots.
+
+The concentrations of a whole plate are loaded once into a NormalizationPlate,
+the sample and water volumes are calculated for all wells in one vectorized
+pass, and every robot file is rendered from that same in-memory result with
+a single write per file.
+
+Used by normalizationcsv780.py (Tecan Freedom EVO) and normalizationcsv480.py
+(Tecan Fluent 480).
+"""
+
+TOO_LOW_VOLUME = 1.5  # the volume which is too low for pipetting
+MIN_CONCENTRATION = 0.000001  # don't want to divide by zero :)
+
+control_re = re.compile("neg|pos", re.IGNORECASE)
+
+
+class NormalizationPlate(object):
+    """The artifacts of a step, sorted columnwise, with their wells, names
+    and concentrations as parallel arrays.
+
+    positions are the columnwise well indexes (A1 -> 0, B1 -> 1, A2 -> 8 on a
+    96 well plate, rows is the number of rows of the plate format) and containers the LIMS IDs of the plates the wells are on. source_racks are the
+    robot racks the samples are pipetted from, if not from the original plate
+    (see normalization_dilution.py).
+    """
+
+    def __init__(self, wells, names, concentrations, is_control, positions=None, containers=None,
+                 source_racks=None, rows=8):
+        self.wells = list(wells)
+        self.names = list(names)
+        self.concentrations = np.asarray(concentrations, dtype=float)
+        self.is_control = np.asarray(is_control, dtype=bool)
+        if positions is None:
+            positions = range(len(self.wells))
+        self.positions = np.asarray(positions, dtype=int)
+        if containers is None:
+            containers = [None] * len(self.wells)
+        self.containers = list(containers)
+        if source_racks is None:
+            source_racks = [None] * len(self.wells)
+        self.source_racks = list(source_racks)
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.wells)
+
+
+class NormalizationResult(object):
+    """Sample and water volumes calculated for a NormalizationPlate."""
+
+    def __init__(self, plate, sample_volumes=None, water_volumes=None):
+        self.plate = plate
+        self.sample_volumes = sample_volumes
+        self.water_volumes = water_volumes
+
+
+def is_control(sample_name):
+    """Try to deduce if the sample is a control or not from the sample name.
+    Just checks for 'neg' or 'pos' in the sample name, which could possibly
+    return false positives...
+    """
+    return re.search(control_re, sample_name) is not None
+
+
+def get_udf_if_exists(artifact, udf, default=""):
+    if udf in artifact.udf:
+        return artifact.udf[udf]
+    else:
+        return default
+
+
+def load_plate(process, concentration_udf, conc_on_output=False, analytes_only=False):
+    """Loads the concentrations of all the inputs of the process in one go.
+
+    The well positions are always read from the inputs. If conc_on_output is set,
+    the concentrations are read from the output with the same name as the input
+    (required for the WGS step). If analytes_only is set, inputs that aren't
+    analytes are skipped (unless the concentrations are on the outputs).
+    """
+    samples_in = process.all_inputs(unique=True)
+    # the wells of all samples are parsed in one go, on the plate format of their container
+    # type, since a 384 well plate may only have samples in the wells of a 96 well plate
+    container_types = set(sample.location[0].type.name for sample in samples_in)
+    plate_formats = set(plate_format_of_container_type(name) for name in container_types)
+    if len(plate_formats) > 1:
+        raise(RuntimeError("The samples are on plates of different formats: %s" % ", ".join(sorted(container_types))))
+    plate_format = plate_formats.pop() if plate_formats else PLATE_96
+    locations = [sample.location[1] for sample in samples_in]
+    all_positions = well_indexes(locations, plate_format)
+    order = sorted(range(len(samples_in)), key=all_positions.__getitem__)
+    samples_in = [samples_in[i] for i in order]
+    all_positions = [all_positions[i] for i in order]
+
+    if conc_on_output:
+        outputs_by_name = dict()
+        for artifact in process.all_outputs(unique=True):
+            outputs_by_name.setdefault(artifact.name, artifact)
+        samples = list()
+        for sample in samples_in:
+            if sample.name not in outputs_by_name:
+                raise(RuntimeError("Could not find output artifact for sample '%s'!" % sample.name))
+            samples.append(outputs_by_name[sample.name])
+    else:
+        samples = samples_in
+
+    wells = list()
+    names = list()
+    concentrations = list()
+    positions = list()
+    containers = list()
+    for sample_in, sample, position in zip(samples_in, samples, all_positions):
+        if analytes_only and not conc_on_output and sample.type != "Analyte":
+            # if 16S, only work on analytes (not result files)
+            # but WGS should work on result files
+            continue
+        concentration = get_udf_if_exists(sample, concentration_udf, default=None)
+        if concentration is None:
+            raise RuntimeError("Could not find UDF '%s' of sample '%s'" % (concentration_udf, sample.name))
+        wells.append(sample_in.location[1])
+        names.append(sample.name)
+        concentrations.append(float(concentration))
+        positions.append(position)
+        containers.append(sample_in.location[0].id)
+
+    return NormalizationPlate(format_wells(wells), names, concentrations, [is_control(name) for name in names],
+                              positions=positions, containers=containers, rows=plate_format.rows)
+
+
+def calculate_volumes(concentrations, target_concentration, target_volume,
+                      threshold_conc_no_normalization, is_control=None):
+    """Vectorized version of the classic C1V1 = C2V2 calculation for a whole plate.
+
+    Returns a tuple of arrays with the sample volumes and the water volumes which
+    should be input into the robot:
+
+    * Samples with a concentration below the threshold are not normalized (0, 0),
+      unless they are controls. If the threshold is 0, then all samples will be normalized.
+    * If the sample concentration is too low, all of the sample is taken (target_volume).
+    * If the sample volume is too low for pipetting, both the sample and water volumes
+      are doubled, tripled or quadrupled.
+    """
+    concentrations = np.asarray(concentrations, dtype=float)
+    if is_control is None:
+        is_control = np.zeros(concentrations.shape, dtype=bool)
+    else:
+        is_control = np.asarray(is_control, dtype=bool)
+
+    divisor = np.where(concentrations == 0.0, MIN_CONCENTRATION, concentrations)
+    sample_required = (target_concentration * target_volume) / divisor
+    water_required = target_volume - sample_required
+
+    factor = np.ones(concentrations.shape)
+    too_low = sample_required < TOO_LOW_VOLUME
+    factor[too_low] = np.select(
+        [sample_required[too_low] * 2.0 > TOO_LOW_VOLUME,
+         sample_required[too_low] * 3.0 > TOO_LOW_VOLUME],
+        [2.0, 3.0], 4.0)
+
+    too_concentrated = sample_required > target_volume
+    sample_volumes = np.where(too_concentrated, target_volume, sample_required * factor)
+    water_volumes = np.where(too_concentrated, 0.0, water_required * factor)
+
+    skipped = (concentrations < threshold_conc_no_normalization) & ~is_control
+    sample_volumes[skipped] = 0.0
+    water_volumes[skipped] = 0.0
+    return sample_volumes, water_volumes
+
+
+def normalize(plate, target_concentration, target_volume, threshold_conc_no_normalization):
+    sample_volumes, water_volumes = calculate_volumes(
+        plate.concentrations, target_concentration, target_volume,
+        threshold_conc_no_normalization, plate.is_control)
+    return NormalizationResult(plate, sample_volumes, water_volumes)
+
+
+def format_volumes(volumes, decimal_sep='.'):
+    """Formats all volumes to 2 decimal places"""
+    return [("%.2f" % volume).replace('.', decimal_sep) for volume in volumes.tolist()]
+
+
+def tecan_780_rows(result):
+    """Rows in the format `well  water  sample`, tab separated"""
+    return zip(result.plate.wells,
+               format_volumes(result.water_volumes),
+               format_volumes(result.sample_volumes))
+
+
+def fluent_480_rows(result):
+    """Rows in the format `well;concentration`. The Fluent calculates the volumes itself,
+    so a zero concentration is replaced by 0.01.
+    """
+    concentrations = np.where(result.plate.concentrations == 0.0, 0.01, result.plate.concentrations)
+    return zip(result.plate.wells, concentrations.tolist())
+
+
+def overview_rows(result):
+    """Comma separated rows with a header, for humans rather than robots"""
+    rows = [["Well", "Sample Name", "Concentration", "Sample Volume", "Water Volume"]]
+    rows.extend(zip(result.plate.wells,
+                    result.plate.names,
+                    result.plate.concentrations.tolist(),
+                    format_volumes(result.sample_volumes),
+                    format_volumes(result.water_volumes)))
+    return rows
+
+
+# Output format name -> (row generator, csv delimiter)
+output_formats = {
+    "tecan780": (tecan_780_rows, '\t'),
+    "fluent480": (fluent_480_rows, ';'),
+    "overview": (overview_rows, ','),
+}
+
+
+def write_output(result, output_format, filename):
+    """Writes the whole result to the file in one go"""
+    if output_format not in output_formats:
+        raise(RuntimeError("Unknown output format '%s'! Choose one of: %s" %
+                           (output_format, ", ".join(sorted(output_formats)))))
+    rows_func, delimiter = output_formats[output_format]
+    with open(filename, 'w', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile, delimiter=delimiter)
+        csv_writer.writerows(rows_func(result))
+
+
+def parse_extra_output(extra_output):
+    """'overview:92-1234.csv' -> ('overview', '92-1234.csv')"""
+    output_format, sep, filename = extra_output.partition(':')
+    if not sep or not filename:
+        raise(RuntimeError("Invalid extra output '%s'! Format as <format>:<filename>" % extra_output))
+    return output_format, filename
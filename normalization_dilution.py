@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import math
+
+import numpy as np
+
+import normalization
+from normalization_worklist import (WorklistOptions, aspirate_volume, format_record, group_multi_dispense,
+                                    plate_rack_type, serpentine_key)
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Intermediate dilution planner for over-concentrated samples.
+
+normalization.calculate_volumes doubles, triples or quadruples the volumes of
+samples that would need less than 1.5 ul, but past 4x the sample volume is still
+too low to pipette. This planner finds those samples for the whole plate at once
+and the dilution factor each of them needs, so that the diluted sample can be
+normalized without any scaling, i.e. needs between 1.5 ul and the target volume.
+
+The factors are grouped into as few dilution tiers as possible (a factor per tier
+that is valid for all samples in it) and the samples are diluted on intermediate
+plates, in the same wells as on the source plate. Factors that are too high for a
+single dilution are done serially over several intermediate plates.
+"""
+
+
+class DilutionTier(object):
+    def __init__(self, factor, indexes, step_factors):
+        self.factor = factor
+        self.indexes = indexes
+        # the factor of each serial dilution, one intermediate plate each
+        self.step_factors = step_factors
+
+    def __repr__(self):
+        return "%gx dilution (%s) of %d samples" % (
+            self.factor, " -> ".join("%gx" % step for step in self.step_factors), len(self.indexes))
+
+
+class DilutionPlan(object):
+    """Dilution tiers for a NormalizationPlate. The factors are 1.0 for the
+    samples that don't need an intermediate dilution."""
+
+    def __init__(self, plate, tiers, dilution_volume):
+        self.plate = plate
+        self.tiers = tiers
+        self.dilution_volume = dilution_volume
+        self.factors = np.ones(len(plate))
+        self.source_racks = list(plate.source_racks)
+        for tier in tiers:
+            self.factors[tier.indexes] = tier.factor
+            for ix in tier.indexes:
+                self.source_racks[ix] = dilution_rack(len(tier.step_factors))
+
+    def diluted_plate(self):
+        """The plate as it will look to the normalization after the dilutions"""
+        plate = self.plate
+        return normalization.NormalizationPlate(
+            plate.wells, plate.names, plate.concentrations / self.factors, plate.is_control,
+            positions=plate.positions, containers=plate.containers, source_racks=self.source_racks,
+            rows=plate.rows)
+
+
+def dilution_rack(step):
+    return "Dilution %d" % step
+
+
+def required_factor_ranges(concentrations, target_concentration, target_volume,
+                           threshold_conc_no_normalization, is_control):
+    """The range of dilution factors that brings the sample volume of each sample within
+    [TOO_LOW_VOLUME, target_volume], without diluting a sample below the threshold
+    concentration for normalization. Samples that don't need a dilution get NaN.
+    """
+    concentrations = np.asarray(concentrations, dtype=float)
+    divisor = np.where(concentrations == 0.0, normalization.MIN_CONCENTRATION, concentrations)
+    sample_required = (target_concentration * target_volume) / divisor
+    is_control = np.asarray(is_control, dtype=bool)
+    normalized = (concentrations >= threshold_conc_no_normalization) | is_control
+    # normalization.calculate_volumes scales up to 4x, after that the volume is too low
+    needs_dilution = normalized & (sample_required * 4.0 < normalization.TOO_LOW_VOLUME)
+    low = np.where(needs_dilution, normalization.TOO_LOW_VOLUME / sample_required, np.nan)
+    high = np.where(needs_dilution, target_volume / sample_required, np.nan)
+    if threshold_conc_no_normalization > 0:
+        # normalization.calculate_volumes skips samples below the threshold, but not controls
+        # (with a margin for the rounding of the diluted concentration)
+        highest = np.where(is_control, np.inf, concentrations / threshold_conc_no_normalization * (1 - 1e-9))
+        high = np.minimum(high, highest)
+    return low, high
+
+
+def group_tiers(low, high):
+    """Minimal number of factors so that every range contains one of them.
+
+    The classic greedy interval stabbing: sorted by upper bound, each new factor is
+    put as high as possible, which covers all the remaining ranges that start below it.
+    The factor is rounded down to an integer if it still covers the same ranges.
+    """
+    uncovered = np.ones(len(low), dtype=bool)
+    tiers = list()
+    for first in np.argsort(high):
+        if not uncovered[first]:
+            continue
+        factor = high[first]
+        # all the uncovered ranges end above the factor, since they're sorted by upper bound
+        covered = np.flatnonzero(uncovered & (low <= factor))
+        if not len(covered):
+            raise ValueError("There is no dilution factor in the range %g-%g" % (low[first], factor))
+        rounded = math.floor(factor)
+        if rounded >= low[covered].max():
+            factor = float(rounded)
+        uncovered[covered] = False
+        tiers.append((factor, covered.tolist()))
+    return tiers
+
+
+def serial_steps(factor, max_step_factor):
+    """Splits a dilution factor into equal serial dilutions that are each possible"""
+    steps = max(1, int(math.ceil(math.log(factor) / math.log(max_step_factor) - 1e-9)))
+    return [factor ** (1.0 / steps)] * steps
+
+
+def plan_dilutions(plate, target_concentration, target_volume, threshold_conc_no_normalization,
+                   dilution_volume=100.0):
+    """Plans the intermediate dilutions for a whole NormalizationPlate.
+
+    dilution_volume is the total volume in each well of the intermediate plates.
+    """
+    if target_volume < normalization.TOO_LOW_VOLUME:
+        raise(RuntimeError("The target volume %g ul is too low for pipetting, it must be at least %g ul" %
+                           (target_volume, normalization.TOO_LOW_VOLUME)))
+    low, high = required_factor_ranges(plate.concentrations, target_concentration, target_volume,
+                                       threshold_conc_no_normalization, plate.is_control)
+    impossible = np.flatnonzero(low > high)
+    if len(impossible):
+        raise(RuntimeError("The samples in %s can't be diluted to a volume of at least %g ul without "
+                           "diluting them below the threshold concentration %g" % (
+                               ", ".join(plate.wells[ix] for ix in impossible),
+                               normalization.TOO_LOW_VOLUME, threshold_conc_no_normalization)))
+    max_step_factor = dilution_volume / normalization.TOO_LOW_VOLUME
+    indexes = np.flatnonzero(~np.isnan(low))
+    tiers = list()
+    for factor, tier_indexes in group_tiers(low[indexes], high[indexes]):
+        tiers.append(DilutionTier(factor, indexes[tier_indexes].tolist(), serial_steps(factor, max_step_factor)))
+    return DilutionPlan(plate, tiers, dilution_volume)
+
+
+def dilution_records(plan, options=None):
+    """Tecan worklist (gwl) records that make the intermediate dilution plates.
+
+    The plates are diluted one at a time, just like in the normalization worklist, so that
+    the intermediate plates of each source plate are used for that plate only. Water is
+    multi-dispensed per intermediate plate, the sample (or the previous dilution) is
+    transferred with a new tip for each well and mixed by the liquid class.
+    """
+    options = options or WorklistOptions()
+    plate = plan.plate
+    tier_by_index = dict((ix, tier) for tier in plan.tiers for ix in tier.indexes)
+    tiers_by_container = OrderedDict()
+    for ix, container in enumerate(plate.containers):
+        if ix in tier_by_index:
+            tiers_by_container.setdefault(container, list()).append((tier_by_index[ix], ix))
+
+    records = list()
+    for container, tiers in tiers_by_container.items():
+        if records:
+            records.append("B;")  # break: the plates are processed one at a time
+        records.extend(container_dilution_records(plan, tiers, options))
+    return records
+
+
+def container_dilution_records(plan, tiers, options):
+    """The dilution records for one source plate, from its (tier, index) pairs"""
+    plate = plan.plate
+    rack_type = plate_rack_type(options, plate.rows)
+    records = list()
+    steps = max(len(tier.step_factors) for tier, _ in tiers)
+    for step in range(steps):
+        transfers = list()
+        for tier, ix in tiers:
+            if step >= len(tier.step_factors):
+                continue
+            sample_volume = plan.dilution_volume / tier.step_factors[step]
+            if step == 0:
+                source = plate.source_racks[ix] or options.source_rack
+            else:
+                source = dilution_rack(step)
+            transfers.append((int(plate.positions[ix]), sample_volume, source))
+        transfers.sort(key=lambda transfer: serpentine_key(transfer[0], plate.rows))
+        destination = dilution_rack(step + 1)
+
+        water = [(position, plan.dilution_volume - sample_volume) for position, sample_volume, _ in transfers]
+        for run in group_multi_dispense(water, options.tip_volume - options.dead_volume):
+            records.append(format_record("A", options.water_rack, options.water_rack_type, 0,
+                                         aspirate_volume(run, options.dead_volume), options.water_liquid_class))
+            for position, volume in run:
+                records.append(format_record("D", destination, rack_type, position,
+                                             volume, options.water_liquid_class))
+            records.append("W;")
+
+        for position, sample_volume, source in sorted(transfers):
+            records.append(format_record("A", source, rack_type, position,
+                                         sample_volume, options.sample_liquid_class))
+            records.append(format_record("D", destination, rack_type, position,
+                                         sample_volume, options.sample_liquid_class))
+            records.append("W;")
+    return records
+
+
+def write_dilution_worklist(plan, filename, options=None):
+    with open(filename, 'w', newline='') as gwl:
+        gwl.write("".join(record + "\r\n" for record in dilution_records(plan, options)))
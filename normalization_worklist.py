@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import math
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Pipetting worklist optimizer for the normalization transfers.
+
+The tab separated list from normalizationcsv780.py makes the robot do one water
+and one sample transfer per well in columnwise order, with a tip change after
+every transfer. This module turns a normalization.NormalizationResult into a
+Tecan worklist (gwl) where:
+
+* wells without any volume to pipette are skipped
+* the water is dispensed first, in serpentine order (down column 1, up column 2, ...),
+  as multi-dispense runs that fill the tip up to its usable volume
+* the samples are transferred afterwards, one tip each, in columnwise order, from
+  the source plate or from the intermediate dilution plate the sample was diluted in
+
+The robot time of both the naive and the optimized list is estimated with a simple
+timing model, so that the time saved can be reported for each plate.
+"""
+
+ROWS_PER_COLUMN = 8  # on a 96 well plate, the plates know their own (NormalizationPlate.rows)
+
+# The robot labware of the plates, by the number of rows of the plate format
+PLATE_RACK_TYPES = {
+    8: "96 Well Microplate",
+    16: "384 Well Microplate",
+}
+
+# Estimated durations in seconds for the different robot operations
+DEFAULT_TIMINGS = {
+    "aspirate": 4.0,
+    "dispense": 3.0,
+    "tip_change": 12.0,
+    "trough_travel": 4.0,  # moving between the water trough and a plate
+    "well_travel": 0.3,  # moving one well on a plate
+}
+
+
+class WorklistOptions(object):
+    def __init__(self, tip_volume=200.0, dead_volume=10.0, water_rack="Water", water_rack_type="Trough 100ml",
+                 source_rack="Source", destination_rack="Destination",
+                 plate_rack_type=None, water_liquid_class="Water Free Multi",
+                 sample_liquid_class="Water Free Single", timings=None):
+        self.tip_volume = tip_volume
+        # extra volume aspirated for multi-dispense runs, which is discarded with the tip
+        self.dead_volume = dead_volume
+        self.water_rack = water_rack
+        self.water_rack_type = water_rack_type
+        self.source_rack = source_rack
+        self.destination_rack = destination_rack
+        # None: the labware of the plate format, see PLATE_RACK_TYPES
+        self.plate_rack_type = plate_rack_type
+        self.water_liquid_class = water_liquid_class
+        self.sample_liquid_class = sample_liquid_class
+        self.timings = dict(DEFAULT_TIMINGS)
+        if timings:
+            self.timings.update(timings)
+
+
+def plate_rack_type(options, rows):
+    """The rack type of the plates, from the options or else from the plate format"""
+    if options.plate_rack_type:
+        return options.plate_rack_type
+    if rows not in PLATE_RACK_TYPES:
+        raise(RuntimeError("There is no rack type for plates with %d rows, please give the rack type" % rows))
+    return PLATE_RACK_TYPES[rows]
+
+
+class PlateEstimate(object):
+    """Estimated robot time (seconds) for one plate, before and after optimization"""
+
+    def __init__(self, container, naive_seconds, optimized_seconds, tip_changes_naive, tip_changes_optimized):
+        self.container = container
+        self.naive_seconds = naive_seconds
+        self.optimized_seconds = optimized_seconds
+        self.tip_changes_naive = tip_changes_naive
+        self.tip_changes_optimized = tip_changes_optimized
+
+    @property
+    def saved_seconds(self):
+        return self.naive_seconds - self.optimized_seconds
+
+    def __repr__(self):
+        return ("Plate %s: estimated robot time %.1f min (was %.1f min), saved %.1f min, "
+                "%d tip changes (was %d)" % (
+                    self.container, self.optimized_seconds / 60.0, self.naive_seconds / 60.0,
+                    self.saved_seconds / 60.0, self.tip_changes_optimized, self.tip_changes_naive))
+
+
+class Worklist(object):
+    def __init__(self, records, estimates):
+        self.records = records
+        self.estimates = estimates
+
+
+def well_distance(position1, position2, rows=ROWS_PER_COLUMN):
+    """Number of wells the arm has to move between two columnwise positions"""
+    row1, col1 = position1 % rows, position1 // rows
+    row2, col2 = position2 % rows, position2 // rows
+    return max(abs(row1 - row2), abs(col1 - col2))
+
+
+def serpentine_key(position, rows=ROWS_PER_COLUMN):
+    """Down the odd columns and up the even ones, so that the arm never jumps
+    back to row A between two columns"""
+    row, col = position % rows, position // rows
+    if col % 2 == 1:
+        row = rows - 1 - row
+    return col * rows + row
+
+
+def split_volume(volume, max_volume):
+    """Splits a volume that doesn't fit in one tip into equal parts that do"""
+    parts = int(math.ceil(volume / max_volume))
+    return [volume / parts] * parts
+
+
+def group_multi_dispense(transfers, usable_volume):
+    """Greedily groups (position, volume) water transfers into runs that fit in one tip"""
+    runs = list()
+    current = list()
+    current_volume = 0.0
+    for position, volume in transfers:
+        for part in split_volume(volume, usable_volume):
+            if current and current_volume + part > usable_volume:
+                runs.append(current)
+                current = list()
+                current_volume = 0.0
+            current.append((position, part))
+            current_volume += part
+    if current:
+        runs.append(current)
+    return runs
+
+
+def aspirate_volume(run, dead_volume):
+    """The volume to aspirate for a run of (position, volume) dispenses. The dead volume
+    is only needed for multi-dispense, i.e. for runs of more than one dispense."""
+    volume = sum(volume for _, volume in run)
+    if len(run) > 1:
+        volume += dead_volume
+    return volume
+
+
+def format_record(record_type, rack, rack_type, position, volume, liquid_class):
+    # The worklist positions are 1-based and columnwise, just like ours
+    return "%s;%s;;%s;%d;;%.2f;%s;;" % (record_type, rack, rack_type, position + 1, volume, liquid_class)
+
+
+def estimate_naive(water, samples, timings):
+    """One water and one sample transfer per well, each with its own tip, in columnwise order"""
+    seconds = 0.0
+    tip_changes = 0
+    for _ in water + samples:
+        seconds += (timings["tip_change"] + timings["aspirate"] + timings["dispense"] +
+                    2 * timings["trough_travel"])
+        tip_changes += 1
+    return seconds, tip_changes
+
+
+def plate_transfers(result, indexes):
+    water = list()
+    samples = list()
+    for ix in indexes:
+        position = int(result.plate.positions[ix])
+        if result.water_volumes[ix] > 0:
+            water.append((position, float(result.water_volumes[ix])))
+        if result.sample_volumes[ix] > 0:
+            samples.append((position, float(result.sample_volumes[ix]), result.plate.source_racks[ix]))
+    return water, samples
+
+
+def optimize_plate(result, indexes, options):
+    """Returns the worklist records for one plate and the estimated robot time"""
+    timings = options.timings
+    water, samples = plate_transfers(result, indexes)
+    naive_seconds, tip_changes_naive = estimate_naive(water, samples, timings)
+
+    records = list()
+    seconds = 0.0
+    tip_changes = 0
+
+    rows = result.plate.rows
+    rack_type = plate_rack_type(options, rows)
+    water.sort(key=lambda transfer: serpentine_key(transfer[0], rows))
+    for run in group_multi_dispense(water, options.tip_volume - options.dead_volume):
+        records.append(format_record("A", options.water_rack, options.water_rack_type, 0,
+                                     aspirate_volume(run, options.dead_volume), options.water_liquid_class))
+        seconds += timings["aspirate"] + timings["trough_travel"]
+        previous = None
+        for position, volume in run:
+            records.append(format_record("D", options.destination_rack, rack_type, position,
+                                         volume, options.water_liquid_class))
+            if previous is not None:
+                seconds += well_distance(previous, position, rows) * timings["well_travel"]
+            seconds += timings["dispense"]
+            previous = position
+        records.append("W;")
+        seconds += timings["tip_change"] + timings["trough_travel"]
+        tip_changes += 1
+
+    # every sample needs its own tip, and the source and destination positions are the same
+    samples.sort(key=lambda transfer: transfer[0])
+    for position, volume, source_rack in samples:
+        for part in split_volume(volume, options.tip_volume):
+            records.append(format_record("A", source_rack or options.source_rack, rack_type, position,
+                                         part, options.sample_liquid_class))
+            records.append(format_record("D", options.destination_rack, rack_type, position,
+                                         part, options.sample_liquid_class))
+            seconds += timings["aspirate"] + timings["dispense"] + 2 * timings["trough_travel"]
+        records.append("W;")
+        seconds += timings["tip_change"]
+        tip_changes += 1
+
+    return records, seconds, naive_seconds, tip_changes, tip_changes_naive
+
+
+def optimize(result, options=None):
+    """Builds an optimized worklist for all plates in the normalization result"""
+    options = options or WorklistOptions()
+    indexes_by_container = OrderedDict()
+    for ix, container in enumerate(result.plate.containers):
+        indexes_by_container.setdefault(container, list()).append(ix)
+
+    records = list()
+    estimates = list()
+    for container, indexes in indexes_by_container.items():
+        plate_records, seconds, naive_seconds, tip_changes, tip_changes_naive = \
+            optimize_plate(result, indexes, options)
+        if records and plate_records:
+            records.append("B;")  # break: the plates are processed one at a time
+        records.extend(plate_records)
+        estimates.append(PlateEstimate(container, naive_seconds, seconds, tip_changes_naive, tip_changes))
+    return Worklist(records, estimates)
+
+
+def write_worklist(worklist, filename):
+    with open(filename, 'w', newline='') as gwl:
+        gwl.write("".join(record + "\r\n" for record in worklist.records))
@@ -4,9 +4,9 @@ from argparse import ArgumentParser
 from genologics.config import BASEURI, USERNAME, PASSWORD
 from genologics.entities import Process
 from genologics.lims import Lims
-import csv
 import genologics
-import re
+
+import normalization
 
 __author__ = "CTMR, Kim Wong"
 __date__ = "2019"
@@ -33,66 +33,15 @@ Usage:
     "
 """
 
-def get_udf_if_exists(artifact, udf, default=""):
-    if udf in artifact.udf:
-        return artifact.udf[udf]
-    else:
-        return default
-
-def sort_samples_columnwise(sample, well_re):
-    """A1 -> 0, B1 -> 1, A2 -> 8, B2 -> 9
-        Column number is worth x * 8
-        Row letter is worth +y
-    """
-    row_letters = "ABCDEFGH"
-    match = re.search(well_re, sample.location[1])
-    if not match:
-        raise(RuntimeError("No valid well position found for sample '%s'!" % sample.name))
-    row = match.group(1)
-    col = match.group(2)
-    row_index = row_letters.index(row)
-    col_value = (int(col) - 1) * 8
-
-    return col_value + row_index
-
-def find_output_artifact(name, p):
-    for i, artifact in enumerate(p.all_outputs(unique=True)):
-        if artifact.name == name:
-            return artifact
-    raise(RuntimeError("Could not find output artifact for sample '%s'!" % name))
-
 def main(lims, args, epp_logger):
     p = Process(lims, id=args.pid)
 
-    with open(args.newCsvFilename, 'w', newline='') as csvfile:
-        pass
-
     # the well location information is on the input samples,
-    well_re = re.compile("([A-Z]):*([0-9]{1,2})")
-    samples_in = p.all_inputs(unique=True)
-    samples_in.sort(key=lambda sample: sort_samples_columnwise(sample, well_re)) # wrap the call in a lambda to be able to pass in the regex
-
-    if args.concOnOutput:
-        samples = [find_output_artifact(s.name, p) for s in samples_in] # required in the WGS step
-    else:
-        samples = samples_in
-
-    for i, sample in enumerate(samples):
-        concentration = get_udf_if_exists(sample, args.concUdf, default=None)
-        if concentration is not None:
-            concentration = float(concentration)
-        else:
-            raise RuntimeError("Could not find UDF '%s' of sample '%s'" % (args.concUdf, sample.name))
-
-        if concentration == 0.0:
-            concentration = 0.01
-
-        well = samples_in[i].location[1].split(':')
-        well = ''.join(well)
-
-        with open(args.newCsvFilename, 'a') as csvfile:
-            csv_writer = csv.writer(csvfile, delimiter=';')
-            csv_writer.writerow([well, concentration])
+    # the concentrations on the outputs in the WGS step
+    plate = normalization.load_plate(p, args.concUdf, conc_on_output=args.concOnOutput)
+    # the Fluent calculates the volumes itself, so only the concentrations are written
+    result = normalization.NormalizationResult(plate)
+    normalization.write_output(result, "fluent480", args.newCsvFilename)
 
 if __name__ == "__main__":
     """See __doc__ at the top of this file for a description."""
@@ -4,9 +4,11 @@ from argparse import ArgumentParser
 from genologics.config import BASEURI, USERNAME, PASSWORD
 from genologics.entities import Process
 from genologics.lims import Lims
-import csv
 import genologics
-import re
+
+import normalization
+import normalization_dilution
+import normalization_worklist
 
 __author__ = "CTMR, Kim Wong"
 __date__ = "2019"
@@ -26,13 +28,36 @@ E1  35;1    4;9
 Usage:
     bash -c "/opt/gls/clarity/miniconda3/bin/python /opt/gls/clarity/customextensions/normalizationcsv780.py 
     --pid '{processLuid}'
-    --newCsvFilename '{compoundOutputFileLuid3}'
+   [--newCsvFilename '{compoundOutputFileLuid3}']
    [--concentrationUDF 'Concentration (nM)']
     --targetConcentration '{udf:Target Concentration (nM)}'
     --targetVolume '{udf:Target Volume (ul)}'
    [--thresholdConcNoNormalize '1.0']
    [--concOnOutput]
+   [--extraOutput 'overview:{compoundOutputFileLuid4}']
+   [--worklist '{compoundOutputFileLuid5}'
+    --tipVolume '200']
+   [--plateRackType '384 Well Microplate']
+   [--dilutionWorklist '{compoundOutputFileLuid6}'
+    --dilutionVolume '100']
     "
+
+The volumes are calculated by the shared engine in normalization.py. Any number of
+additional files can be written from the same result with --extraOutput, see
+normalization.output_formats for the available formats.
+
+With --worklist, an optimized Tecan worklist (gwl) with multi-dispensed water
+is written as well, and the estimated robot time saved is reported per plate,
+see normalization_worklist.py. The plates are 96 Well Microplate or 384 Well
+Microplate racks by the plate format, unless --plateRackType is given.
+
+With --dilutionWorklist, samples that are too concentrated to normalize even at 4x
+volumes are first diluted on intermediate plates, with as few dilution factors as
+possible. The worklist for these dilutions is written to the given file, and the
+--worklist is calculated for the diluted samples, see normalization_dilution.py.
+The --worklist is required, since it is the only output that says which plate each
+sample is taken from. --newCsvFilename and --extraOutput are refused, as the robot
+would take the volumes of the diluted samples from the source plate.
 """
 
 def calculate_sample_required(conc1, conc2, vol2):
@@ -40,137 +65,76 @@ def calculate_sample_required(conc1, conc2, vol2):
     All arguments should be floats.
     """
     if conc1 == 0.0:
-        conc1 = 0.000001 # don't want to divide by zero :)
+        conc1 = normalization.MIN_CONCENTRATION # don't want to divide by zero :)
     return (conc2 * vol2) / conc1
 
 def calculate_volumes_required(sample_conc, target_concentration, target_volume, threshold_conc_no_normalization, is_control=False):
     """Returns a tuple of the sample volume (s) and water volume (w)
     which should be input into the robot. All values should be floats.
+
+    Single sample version of normalization.calculate_volumes.
     """
-    if sample_conc < threshold_conc_no_normalization and not is_control:
-        # Don't normalize the sample if the concentration is too low and it isn't a control.
-        # If the threshold is 0, then all samples will be normalized.
-        # Control samples are normalized even if their volumes are too low (then all of
-        # the sample is taken (i.e. target_volume))
-        return (0.0, 0.0)
-
-    sample_required = calculate_sample_required(sample_conc, target_concentration, target_volume)
-    water_required = target_volume - sample_required
-    too_low_volume = 1.5 # the volume which is too low for pipetting
-    # firstly, is the sample concentration is too low:
-    if sample_required > target_volume:
-        s = target_volume
-        w = 0.0
-    # otherwise, if the sample concentration is too high:
-    elif sample_required < too_low_volume:
-        if sample_required * 2.0 > too_low_volume:
-            s = sample_required * 2.0
-            w = water_required * 2.0
-        elif sample_required * 3.0 > too_low_volume:
-            s = sample_required * 3.0
-            w = water_required * 3.0
-        else:
-            s = sample_required * 4.0
-            w = water_required * 4.0
-    # but maybe it's lagom!
-    else:
-        s = sample_required
-        w = water_required
-    return (s, w)
-
-def sort_samples_columnwise(sample, well_re):
-    """A1 -> 0, B1 -> 1, A2 -> 8, B2 -> 9
-        Column number is worth x * 8
-        Row letter is worth +y
-    """
-    row_letters = "ABCDEFGH"
-    match = re.search(well_re, sample.location[1])
-    if not match:
-        raise(RuntimeError("No valid well position found for sample '%s'!" % sample.name))
-    row = match.group(1)
-    col = match.group(2)
-    row_index = row_letters.index(row)
-    col_value = (int(col) - 1) * 8
-
-    return col_value + row_index
-
-def get_udf_if_exists(sample, udf, default=""):
-    if (udf in sample.udf):
-        return sample.udf[udf]
-    else:
-        return default
-
-def find_output_artifact(name, p):
-    for i, artifact in enumerate(p.all_outputs(unique=True)):
-        if artifact.name == name:
-            return artifact
-    raise(RuntimeError("Could not find output artifact for sample '%s'!" % name))
-
-control_re = re.compile("neg|pos", re.IGNORECASE)
-def is_control(sample_name):
-    """Try to deduce if the sample is a control or not from the sample name.
-    Just checks for 'neg' or 'pos' in the sample name, which could possibly
-    return false positives...
-    """
-    match = re.search(control_re, sample_name)
-    return match
+    s, w = normalization.calculate_volumes([sample_conc], target_concentration, target_volume,
+                                           threshold_conc_no_normalization, [is_control])
+    return (float(s[0]), float(w[0]))
 
-def format_volume(volume, decimal_sep='.'):
-    volume_string = "{:.2f}".format(volume) # format to 2 decimal places
-    volume_string = volume_string.replace('.', decimal_sep)
-    return volume_string
+def worklist_options(args):
+    return normalization_worklist.WorklistOptions(tip_volume=float(args.tipVolume),
+                                                  plate_rack_type=args.plateRackType)
 
 def main(lims, args, epp_logger):
     p = Process(lims, id = args.pid)
     target_concentration = float(args.targetConcentration)
     target_volume = float(args.targetVolume)
     threshold_conc_no_normalize = float(args.thresholdConcNoNormalize)
-
-    with open(args.newCsvFilename, 'w', newline='') as csvfile:
-        pass
-
-    samples_in = p.all_inputs(unique=True) 
-
-    well_re = re.compile("([A-Z]):*([0-9]{1,2})")
-    samples_in.sort(key=lambda sample: sort_samples_columnwise(sample, well_re)) # wrap the call in a lambda to be able to pass in the regex
-
-    if args.concOnOutput:
-        samples = [find_output_artifact(s.name, p) for s in samples_in] # required for the WGS step
-    else:
-        samples = samples_in
-
-    print(samples)
-
-    for i, sample in enumerate(samples):
-        if not args.concOnOutput and sample.type != "Analyte":
-            # if 16S, only work on analytes (not result files)
-            # but WGS should work on result files
-            continue
-        concentration = get_udf_if_exists(sample, args.concentrationUDF, default=None)
-        if concentration is not None:
-            concentration = float(concentration)
-            sample_required, water_required = calculate_volumes_required(concentration, target_concentration, target_volume, threshold_conc_no_normalize, is_control(sample.name))
-            sample_required = format_volume(sample_required)
-            water_required = format_volume(water_required)
-        else:
-            raise RuntimeError("Could not find UDF '%s' of sample '%s'" % (args.concentrationUDF, sample.name))
-        well = samples_in[i].location[1].split(':')
-        well = ''.join(well)
-
-        with open(args.newCsvFilename, 'a') as csvfile:
-            csv_writer = csv.writer(csvfile, delimiter='\t')
-            csv_writer.writerow([well, water_required, sample_required])
+    extra_outputs = [normalization.parse_extra_output(extra) for extra in args.extraOutput]
+    if args.dilutionWorklist:
+        if not args.worklist:
+            raise(RuntimeError("--dilutionWorklist requires --worklist, the only output that takes the "
+                               "diluted samples from their dilution plates"))
+        if args.newCsvFilename or extra_outputs:
+            raise(RuntimeError("--newCsvFilename and --extraOutput can't be used with --dilutionWorklist, "
+                               "they don't say which plate to take the diluted samples from"))
+    elif not args.newCsvFilename:
+        raise(RuntimeError("--newCsvFilename is required without --dilutionWorklist"))
+
+    plate = normalization.load_plate(p, args.concentrationUDF, conc_on_output=args.concOnOutput, analytes_only=True)
+    if args.dilutionWorklist:
+        plan = normalization_dilution.plan_dilutions(plate, target_concentration, target_volume,
+                                                     threshold_conc_no_normalize, float(args.dilutionVolume))
+        normalization_dilution.write_dilution_worklist(plan, args.dilutionWorklist, worklist_options(args))
+        for tier in plan.tiers:
+            print(tier)
+        plate = plan.diluted_plate()
+    result = normalization.normalize(plate, target_concentration, target_volume, threshold_conc_no_normalize)
+
+    if args.newCsvFilename:
+        normalization.write_output(result, "tecan780", args.newCsvFilename)
+    for output_format, filename in extra_outputs:
+        normalization.write_output(result, output_format, filename)
+
+    if args.worklist:
+        worklist = normalization_worklist.optimize(result, worklist_options(args))
+        normalization_worklist.write_worklist(worklist, args.worklist)
+        for estimate in worklist.estimates:
+            print(estimate)
 
 if __name__ == "__main__":
     """See __doc__ at the top of this file for a description."""
     parser = ArgumentParser(description=__doc__)
     parser.add_argument('--pid', required=True, help='Lims id for current Process')
-    parser.add_argument('--newCsvFilename', required=True, help='limsid of the csv file to write to')
+    parser.add_argument('--newCsvFilename', default=None, help='limsid of the csv file to write to, required without --dilutionWorklist')
     parser.add_argument('--concentrationUDF', default='Concentration (nM)', help='The name of the UDF to read the concentrations from')
     parser.add_argument('--targetConcentration', required=True, help='target concentration')
     parser.add_argument('--targetVolume', required=True, help='target volume')
     parser.add_argument('--thresholdConcNoNormalize', default=1.0, help='the volume which all samples should be over for them to be normalized (otherwise they are ignored and 0 sample and 0 water is taken from them)')
     parser.add_argument('--concOnOutput', default=False, action='store_true', help='The initial WGS QC step writes the concentrations to the outputs, whereas the normal aggregation steps have them on the input.')
+    parser.add_argument('--extraOutput', default=[], action='append', help='Additional file to write from the same volumes, formatted as <format>:<filename>, e.g. fluent480:{compoundOutputFileLuid4}. Can be given several times.')
+    parser.add_argument('--worklist', default=None, help='limsid of the optimized worklist file to write to')
+    parser.add_argument('--tipVolume', default=200.0, help='The volume of the tips used for the multi-dispensed water in the worklist')
+    parser.add_argument('--plateRackType', default=None, help='The rack type of the plates in the worklists, by default from the plate format (%s)' % ", ".join(normalization_worklist.PLATE_RACK_TYPES.values()))
+    parser.add_argument('--dilutionWorklist', default=None, help='limsid of the worklist file for the intermediate dilutions of over-concentrated samples')
+    parser.add_argument('--dilutionVolume', default=100.0, help='The total volume in each well of the intermediate dilution plates')
 
     args = parser.parse_args()
 
@@ -7,22 +7,25 @@ Usage in Clarity LIMS:
     --pid {processLuid}
     --tapestation-csv 'TapeStation Compact Peak Table'
     --udf-fragsize 'Average Fragment Size (bp)'
+   [--strategy 'single']
     2> {compoundOutfileLuid3}
     "
+
+By default a well gets the size of its peak if there is exactly one peak within
+the size window, and -1 otherwise. See tapestation_peaks.py for the other
+strategies (weighted, dominant and smear).
 """
 __author__ = "CTMR, Fredrik Boulund"
 __date__ = "2019"
 from argparse import ArgumentParser
-from collections import defaultdict, namedtuple
 import logging
-import csv
-import re
 from sys import stderr
 
 from genologics.config import BASEURI, USERNAME, PASSWORD
 from genologics.entities import Process
 from genologics.lims import Lims
 
+import tapestation_peaks
 
 logging.basicConfig(
     level=logging.DEBUG, 
@@ -43,56 +46,15 @@ def get_tapestation_file(process, filename):
     return content
 
 
-def parse_tapestation_csv(tapestation_csv, min_fragsize, max_fragsize):
-    """Parse TapeStation CSV into a dictionary of observed peaks."""
-    ignored_observations = {"Lower Marker", "Upper Marker"}
-    ignored_sample_descriptions = {"Ladder"}
-    Peak = namedtuple("Peak", ["Well", "Sample", "Size", "Percent", "Observations"])
-    measured_peaks = defaultdict(list)
-    reader = csv.DictReader(tapestation_csv, delimiter=',')
-    for line in reader:
-        if line["Observations"] in ignored_observations:
-            continue
-        if line["Sample Description"] in ignored_sample_descriptions:
-            continue
-        if not line["Size [bp]"]:
-            fragment_size = 0
-        else:
-            fragment_size = int(line["Size [bp]"])
-        if not line["% Integrated Area"]:
-            integrated_area = 0
-        else:
-            integrated_area = float(line["% Integrated Area"])
-        try:
-            peak = Peak(
-                line["Well"],
-                line["Sample Description"], 
-                fragment_size,
-                integrated_area,
-                line["Observations"])
-        except KeyError:
-            raise(RuntimeError("Could not parse line: {}".format(line)))
-        except ValueError:
-            raise(RuntimeError("Could not parse line: {}".format(line)))
-        if peak.Size > min_fragsize and peak.Size < max_fragsize:
-            measured_peaks[peak.Well].append(peak)
-    return measured_peaks
-
-
-def find_input_in_well(well, p):
-    for i, artifact in enumerate(p.all_inputs(unique=True)):
+def find_inputs_by_well(p):
+    """Maps the wells of the input analytes, e.g. 'A1', to the artifacts"""
+    inputs = {}
+    for artifact in p.all_inputs(unique=True):
         if artifact.type == "Analyte":
             artifact_well = artifact.location[1]
             artifact_well = "".join(artifact_well.split(":"))
-            if artifact_well == well:
-                if artifact:
-                    return artifact
-                else:
-                    logger.error("Artifact %s, %s is invalid: %s", well, p, artifact)
-
-
-def is_well(string, well_re=re.compile(r'[A-Z][0-9]{1,2}')):
-    return well_re.match(string)
+            inputs[artifact_well] = artifact
+    return inputs
 
 
 def main(lims, args, logger):
@@ -118,15 +80,16 @@ def main(lims, args, logger):
     logger.debug(tapestation_file)
 
     outputs = []
-    measured_peaks = parse_tapestation_csv(tapestation_file.splitlines(), args.min_fragsize, args.max_fragsize)
-    for well, peaks in measured_peaks.items():
-        fragment_size = -1
-        if len(peaks) == 1:
-            fragment_size = peaks[0].Size
-        logger.debug([well, peaks, fragment_size])
+    summary = tapestation_peaks.summarize_tables(
+        [tapestation_file.splitlines()], args.min_fragsize, args.max_fragsize, args.strategy)
+    # Input artifacts, these have well information
+    inputs_by_well = find_inputs_by_well(p)
+    for well, fragment_size, peak_count in zip(summary.wells.tolist(), summary.sizes.tolist(), summary.peak_counts.tolist()):
+        logger.debug([well, peak_count, fragment_size])
 
-        # Find input artifact, this has well information
-        artifact = find_input_in_well(well, p)
+        artifact = inputs_by_well.get(well)
+        if not artifact:
+            raise(RuntimeError("Cannot find sample at well position {}".format(well)))
 
         # Find output artifact, this has the UDF where we store the peak size
         output = output_artifacts[input_output_map[artifact.id]]
@@ -151,6 +114,10 @@ if __name__ == "__main__":
     parser.add_argument("--udf-fragsize", dest="udf_fragsize",
             required=True, 
             help="The UDF to set")
+    parser.add_argument("--strategy",
+            choices=tapestation_peaks.STRATEGIES,
+            default="single",
+            help="How to summarize the peaks of a well, see tapestation_peaks.py [%(default)s].")
     parser.add_argument("--min-fragsize", dest="min_fragsize",
             type=int,
             default=200,
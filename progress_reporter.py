@@ -0,0 +1,114 @@
+from __future__ import print_function
+import logging
+import threading
+import time
+from xml.etree import ElementTree
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Live progress for long running EPP scripts, shown in the step's program status.
+
+setExitStatus.py and glsapiutil3.reportScriptStatus GET, edit and PUT the
+programstatus XML each time they are called, which is fine for a final status
+but too expensive to call per sample. The ProgressReporter only records the
+latest message when it is called, which costs a lock and an assignment, and a
+background thread PUTs it at most once every interval seconds. Messages that
+are replaced before the next PUT are never sent. The programstatus XML is fetched
+once and reused for all updates.
+
+Usage:
+    with ProgressReporter(lims, step_uri, interval=5) as progress:
+        for i, sample in enumerate(samples):
+            ...
+            progress.progress(i + 1, len(samples))
+"""
+
+PROGRESS_STATUS = "RUNNING"
+
+
+def programstatus_uri(lims, pid):
+    """The programstatus URI of the step of a process, e.g. 24-1234"""
+    return lims.get_uri("steps", pid, "programstatus")
+
+
+class ProgressReporter(object):
+    """Coalesces progress messages and PUTs the latest one at most once every interval seconds"""
+
+    def __init__(self, lims, uri, interval=5.0, status=PROGRESS_STATUS):
+        if not uri.endswith("/programstatus"):
+            uri = uri.rstrip("/") + "/programstatus"
+        self.lims = lims
+        self.uri = uri
+        self.interval = interval
+        self.status = status
+        self._pending = None
+        self._sent = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._root = None
+
+    def update(self, message, status=None):
+        """Sets the message to show, cheap enough to call for every sample"""
+        with self._lock:
+            self._pending = (status or self.status, message)
+
+    def progress(self, done, total, what="samples"):
+        self.update("%d/%d %s done" % (done, total, what))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="progress-reporter")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self, status=None, message=None):
+        """Stops the background thread and sends the final status, if any, right away"""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        if message is not None:
+            self.update(message, status)
+        self.flush()
+
+    def flush(self):
+        """PUTs the latest message now, unless it has already been sent"""
+        with self._lock:
+            pending = self._pending
+        if pending is None or pending == self._sent:
+            return
+        try:
+            self._put(*pending)
+            self._sent = pending
+        except Exception as e:
+            # the progress is only informative, it must never fail the script
+            logging.warning("Could not update the program status: %s", e)
+
+    def _put(self, status, message):
+        if self._root is None:
+            self._root = self.lims.get(self.uri)
+        status_node = self._root.find("status")
+        if status_node is None:
+            status_node = ElementTree.SubElement(self._root, "status")
+        status_node.text = status
+        message_node = self._root.find("message")
+        if message_node is None:
+            message_node = ElementTree.SubElement(self._root, "message")
+        message_node.text = message
+        self.lims.put(self.uri, ElementTree.tostring(self._root))
+
+    def _run(self):
+        next_put = time.time()
+        while not self._stopped.wait(max(0.0, next_put - time.time())):
+            self.flush()
+            next_put = time.time() + self.interval
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
@@ -1,15 +1,25 @@
 # -*- coding: utf-8 -*-
 
 import os
-import yaml
 import logging
 import codecs
 import base64
-import lxml
-from lxml import objectify
-import lxml.etree as ET
-from suds.client import Client
-from suds.xsd.doctor import ImportDoctor, Import
+import importlib
+# lxml, suds and yaml are only needed to build the XML, talk to SmiNet or read the config,
+# so they're imported on first use, not by every extension that imports the types
+
+
+class _LazyModule(object):
+    """Imports the module on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+
+ET = _LazyModule("lxml.etree")
 
 logger = logging.getLogger(__name__)
 
@@ -643,6 +653,8 @@ class SmiNetClient(object):
     @property
     def soap_client(self):
         if self._soap_client is None:
+            from suds.client import Client
+            from suds.xsd.doctor import ImportDoctor, Import
             imp = Import('http://schemas.xmlsoap.org/soap/encoding/')
             doctor = ImportDoctor(imp)
             self._soap_client = Client(self.wsdl_url,
@@ -667,6 +679,7 @@ class SmiNetClient(object):
         """
         Returns a Python object from an XML response string"
         """
+        from lxml import objectify
         xml = codecs.encode(xml, "utf-8")
         obj = objectify.fromstring(xml)
         return obj
@@ -694,7 +707,7 @@ class SmiNetClient(object):
         """
         Validates an XML contract against the xsd SmiNet provides
         """
-        xml_validator = lxml.etree.XMLSchema(
+        xml_validator = ET.XMLSchema(
             file="http://stage.sminet.se/xml-schemas/SmiNetLabExport.xsd")
         is_valid = xml_validator.validate(xml)
 
@@ -741,6 +754,7 @@ class SmiNetConfig(object):
         for path in paths:
             path = os.path.expanduser(path)
             if os.path.exists(path):
+                import yaml
                 with open(path, "r") as f:
                     config = yaml.safe_load(f)
                     return cls(**config)
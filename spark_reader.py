@@ -0,0 +1,151 @@
+import re
+
+import numpy as np
+import xlrd
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Streaming reader for Tecan Spark output files (.xls or .xlsx).
+
+The rows are streamed sheet by sheet without loading the whole workbook, and
+every sheet can contain several plates: a new plate starts on every new sheet
+and whenever a well that has already been seen on the current plate shows up
+again. The rows of each well have the well in the first column, the raw value
+in the second and the concentration (or 'NoCalc') in the third, if present.
+
+The concentrations of each plate are returned as an array, with '<Min' set to
+0.0, '>Max' to 99.9 and 'NoCalc' replaced by the value of the second column.
+The raw values of the second column are kept as well, so that the concentrations
+can be recalculated from the standards (see standard_curve.py).
+"""
+
+well_re = re.compile("[A-Z][0-9]{1,2}$")
+
+MIN_CONCENTRATION = 0.0
+MAX_CONCENTRATION = 99.9
+
+XLSX_MAGIC = b"PK"
+
+
+class SparkPlate(object):
+    """The wells of one plate in a Spark file and their concentrations"""
+
+    def __init__(self, sheet, index, wells, rows, concentrations, raw_values):
+        self.sheet = sheet
+        self.index = index
+        self.wells = wells
+        self.rows = rows  # the row of each well in the sheet, for error messages
+        self.concentrations = concentrations
+        # the raw measurements (e.g. fluorescence) in the second column, NaN if not a number
+        self.raw_values = raw_values
+
+    def __len__(self):
+        return len(self.wells)
+
+    def __repr__(self):
+        return "SparkPlate(sheet='%s', index=%d, wells=%d)" % (self.sheet, self.index, len(self.wells))
+
+
+def iter_xls_rows(contents):
+    """Yields (sheet name, row index, row values) from an .xls file, loading one sheet at a time"""
+    workbook = xlrd.open_workbook(file_contents=contents, on_demand=True)
+    try:
+        for sheet_i in range(workbook.nsheets):
+            sheet = workbook.sheet_by_index(sheet_i)
+            for row_i in range(sheet.nrows):
+                yield sheet.name, row_i, sheet.row_values(row_i, end_colx=min(3, sheet.ncols))
+            workbook.unload_sheet(sheet_i)
+    finally:
+        workbook.release_resources()
+
+
+def iter_xlsx_rows(contents):
+    """Yields (sheet name, row index, row values) from an .xlsx file in read-only mode"""
+    from io import BytesIO
+    from openpyxl import load_workbook
+    workbook = load_workbook(BytesIO(contents), read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            for row_i, row in enumerate(sheet.iter_rows(max_col=3, values_only=True)):
+                yield sheet.title, row_i, row
+    finally:
+        workbook.close()
+
+
+def iter_rows(contents):
+    if contents[:len(XLSX_MAGIC)] == XLSX_MAGIC:
+        return iter_xlsx_rows(contents)
+    return iter_xls_rows(contents)
+
+
+def is_number(value):
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def format_concentrations(wells, values, fallback_values):
+    """Converts the raw cell values of a plate to floats, all at once"""
+    values = np.asarray(values, dtype=object)
+    fallback_values = np.asarray(fallback_values, dtype=object)
+    values = np.where(values == "NoCalc", fallback_values, values)
+    is_min = values == "<Min"
+    is_max = values == ">Max"
+    other = ~(is_min | is_max)
+    concentrations = np.empty(len(values))
+    try:
+        concentrations[other] = values[other].astype(float)
+    except (TypeError, ValueError):
+        ix = next(ix for ix in np.flatnonzero(other) if not is_number(values[ix]))
+        raise(RuntimeError("Error! Invalid concentration '%s' for well %s" % (values[ix], wells[ix])))
+    concentrations[is_min] = MIN_CONCENTRATION
+    concentrations[is_max] = MAX_CONCENTRATION
+    return concentrations
+
+
+def read_plates(contents, parse_concentrations=True):
+    """Reads all plates in a Spark file. Returns a list of SparkPlates in file order.
+
+    If parse_concentrations is False, only the raw values are read and the
+    concentrations of the plates are None.
+    """
+    plates = list()
+
+    def finish_plate():
+        if not wells:
+            return
+        concentrations = None
+        if parse_concentrations:
+            try:
+                concentrations = format_concentrations(wells, values, fallback_values)
+            except RuntimeError as e:
+                raise(RuntimeError("%s on sheet '%s', plate %d" % (e, sheet, len(plates) + 1)))
+        raw_values = np.array([float(value) if is_number(value) else np.nan for value in fallback_values])
+        plates.append(SparkPlate(sheet, len(plates), list(wells), list(rows), concentrations, raw_values))
+
+    sheet = None
+    wells, rows, values, fallback_values = list(), list(), list(), list()
+    seen = set()
+    for sheet_name, row_i, row in iter_rows(contents):
+        if not row:
+            continue
+        well = row[0]
+        if not isinstance(well, str) or not well_re.match(well):
+            continue
+        if sheet_name != sheet or well in seen:
+            finish_plate()
+            sheet = sheet_name
+            wells, rows, values, fallback_values = list(), list(), list(), list()
+            seen = set()
+        seen.add(well)
+        wells.append(well)
+        rows.append(row_i)
+        fallback = row[1] if len(row) > 1 else None
+        # some files may be missing the "NoCalc" column
+        values.append(row[2] if len(row) > 2 and row[2] is not None else fallback)
+        fallback_values.append(fallback)
+    finish_plate()
+    return plates
@@ -4,14 +4,28 @@ import logging
 from genologics.config import BASEURI, USERNAME, PASSWORD
 from genologics.entities import Process
 from genologics.lims import Lims
-import xlrd
 import re
 
+from progress_reporter import ProgressReporter, programstatus_uri
+import spark_reader
+import standard_curve
+from wells import format_well
+
 __author__ = "CTMR, Kim Wong"
 __date__ = "2019"
 __doc__ = """
 Takes an output file from the Tecan Spark and sets the relevant
 concentration UDF on the samples in the step.
+
+The file may contain several plates, on separate sheets or one after the other
+on the same sheet (see spark_reader.py). They are matched to the containers of
+the samples sorted by container name, so that one upload can cover a whole run.
+
+With --fitStandards, the concentrations calculated by the Spark software are
+ignored. The standard curve is fitted to the raw fluorescence of the given
+standard wells instead, for all plates at once (see standard_curve.py).
+
+The progress is shown in the step while the script runs (see progress_reporter.py).
 Usage:
     bash -c "/opt/gls/clarity/miniconda3/bin/python /opt/gls/clarity/customextensions/sparkoutput.py 
     --pid {processLuid}
@@ -20,6 +34,8 @@ Usage:
    [--convertToNm
     --fragmentSize '620bp'
     --concentrationUdfNm 'QuantIt HS Concentration (nM)']
+   [--fitStandards 'A12:0,B12:0.5,C12:1,D12:2.5,E12:5,F12:10'
+    --curve '4pl']
     2> {compoundOutputFileLuid1}
     "
 """
@@ -36,7 +52,7 @@ def format_fragment_size(fragment_size):
         return float(match.group(1))
     raise(RuntimeError("Invalid fragment size '%s'! Please specify the fragment size in the format '620' or '620bp'" % fragment_size))
 
-def get_spark_file(process, filename):
+def get_spark_file(lims, process, filename):
     content = None
     for outart in process.all_outputs():
         #get the right output artifact
@@ -49,38 +65,22 @@ def get_spark_file(process, filename):
             break
     return content
 
-def is_well(string, well_re):
-    return well_re.match(string)
-
-def find_input_in_well(well, p):
-    for i, artifact in enumerate(p.all_inputs(unique=True)):
-        if artifact.type == "Analyte":
-            artifact_well = artifact.location[1]
-            artifact_well = "".join(artifact_well.split(":"))
-            if artifact_well == well:
-                return artifact
-
-def find_output_in_well(well, p):
-    for i, artifact in enumerate(p.all_outputs(unique=True)):
-        if artifact.location[1] is not None:
-            artifact_well = artifact.location[1]
-            artifact_well = "".join(artifact_well.split(":"))
-            if artifact_well == well:
-                return artifact
-
-def format_concentration(concentration):
-    if type(concentration) == str:
-        if concentration == "<Min":
-            concentration = 0.0
-        elif concentration == ">Max":
-            concentration = 99.9
-        else:
-            concentration = float(concentration)
-    elif type(concentration) == int:
-        concentration = float(concentration)
-    elif type(concentration) != float:
-        raise(RuntimeError("Error! Invalid concentration '%s' for well %s, row %s" % (concentration, well, row_i)))
-    return concentration
+def build_well_map(artifacts):
+    """Maps (container id, well) to the artifact in that well, e.g. ('27-1449', 'A1')"""
+    well_map = {}
+    for artifact in artifacts:
+        if artifact.location and artifact.location[1] is not None:
+            well_map[(artifact.location[0].id, format_well(artifact.location[1]))] = artifact
+    return well_map
+
+def get_containers(artifacts):
+    """The containers of the artifacts, sorted by name. The plates in the Spark
+    file are expected in this order."""
+    containers = {}
+    for artifact in artifacts:
+        if artifact.location and artifact.location[1] is not None:
+            containers[artifact.location[0].id] = artifact.location[0]
+    return sorted(containers.values(), key=lambda container: container.name)
 
 def convert_to_nm(concentration, fragment_size):
     # convert from ng/ul to nM
@@ -88,6 +88,13 @@ def convert_to_nm(concentration, fragment_size):
     return (concentration * 1000000) / (fragment_size * basepair_mw)
 
 def main(lims, args, logger):
+    progress = ProgressReporter(lims, programstatus_uri(lims, args.pid), args.progressInterval).start()
+    try:
+        update_concentrations(lims, args, logger, progress)
+    finally:
+        progress.stop()
+
+def update_concentrations(lims, args, logger, progress):
     p = Process(lims, id=args.pid)
     
     # Precompute lookup dictionaries for output artifacts and input_output_maps
@@ -99,52 +106,66 @@ def main(lims, args, logger):
     logger.info("output_artifacts: %s", output_artifacts)
     logger.info("input_output_map: %s", input_output_map)
 
-    sparkfile = get_spark_file(p, args.sparkOutputFilename)
+    if args.wellFromOutput:
+        artifacts = list(output_artifacts.values())
+    else:
+        artifacts = [artifact for artifact in p.all_inputs(unique=True) if artifact.type == "Analyte"]
+    well_map = build_well_map(artifacts)
+    containers = get_containers(artifacts)
+    logger.info("containers: %s", containers)
+
+    progress.update("Reading the Spark file")
+    sparkfile = get_spark_file(lims, p, args.sparkOutputFilename)
     if not sparkfile:
         raise(RuntimeError("Cannot find the Spark output file, are you sure it has been uploaded?"))
 
-    workbook = xlrd.open_workbook(file_contents=sparkfile.read())
-    sheet = workbook.sheet_by_index(0)
+    if args.fitStandards:
+        # recalculate the concentrations from the raw fluorescence instead of using the Spark's
+        standards = standard_curve.parse_standards(args.fitStandards)
+        plates = spark_reader.read_plates(sparkfile.read(), parse_concentrations=False)
+        params = standard_curve.calculate_concentrations(plates, standards, args.curve)
+        logger.info("%s standard curve parameters: %s", args.curve, params)
+        standard_wells = set(standards[0])
+        missing = standard_curve.missing_concentrations(plates, standard_wells)
+        if missing:
+            raise(RuntimeError("Error! The raw value is not a number in the well(s) %s" % ", ".join(missing)))
+    else:
+        plates = spark_reader.read_plates(sparkfile.read())
+        standard_wells = set()
+    logger.info("plates: %s", plates)
+    if len(plates) != len(containers):
+        raise(RuntimeError("Error! Found %d plate(s) in the Spark file, but the samples are in %d container(s)" % (len(plates), len(containers))))
 
-    well_re = re.compile("[A-Z][0-9]{1,2}")
     if args.convertToNm:
         fragment_size = format_fragment_size(args.fragmentSize)
     outputs = []
 
-    for row_i in range(0, sheet.nrows):
-        if is_well(sheet.cell(row_i, 0).value, well_re):
-            well = sheet.cell(row_i, 0).value
-            if args.wellFromOutput:
-                artifact = find_output_in_well(well, p)
-            else:
-                artifact = find_input_in_well(well, p)
+    for plate_i, (plate, container) in enumerate(zip(plates, containers)):
+        progress.progress(plate_i, len(plates), "plates")
+        logger.info("Container %s: %s", container.name, plate)
+        if args.convertToNm:
+            concentrations_nm = convert_to_nm(plate.concentrations, fragment_size)
+        for i, well in enumerate(plate.wells):
+            if well in standard_wells:
+                continue
+            artifact = well_map.get((container.id, well))
             if not artifact:
-                raise(RuntimeError("Error! Cannot find sample at well position %s, row %s" % (well, row_i)))
-            logger.info("Input artifact: %s", artifact)
+                raise(RuntimeError("Error! Cannot find sample at well position %s in container %s, row %s" % (well, container.name, plate.rows[i])))
 
-            if sheet.ncols > 2: # some files may be missing the "NoCalc" column
-                concentration = sheet.cell(row_i, 2).value
+            if args.wellFromOutput:
+                output = artifact
             else:
-                concentration = sheet.cell(row_i, 1).value
-
-            if concentration == "NoCalc":
-                concentration = sheet.cell(row_i, 1).value
-            concentration = format_concentration(concentration)
-            logger.info("concentration: %s", concentration)
-            
-            # Find output artifact
-            output = output_artifacts[input_output_map[artifact.id]]
-            logger.info("Output artifact: %s", output)
-
-            output.udf[args.concentrationUdf] = concentration
-            outputs.append(output)
+                output = output_artifacts[input_output_map[artifact.id]]
+            logger.info("Artifact: %s, output artifact: %s, concentration: %s", artifact, output, plate.concentrations[i])
 
+            output.udf[args.concentrationUdf] = float(plate.concentrations[i])
             if args.convertToNm:
-                concentration_nm = convert_to_nm(concentration, fragment_size)
-                output.udf[args.concentrationUdfNm] = concentration_nm
+                output.udf[args.concentrationUdfNm] = float(concentrations_nm[i])
+            outputs.append(output)
 
-    for out in outputs:
-        out.put()
+    progress.update("Updating %d samples" % len(outputs))
+    lims.put_batch(outputs)
+    progress.progress(len(outputs), len(outputs))
 
 if __name__ == "__main__":
     parser = ArgumentParser(description=__doc__)
@@ -155,7 +176,10 @@ if __name__ == "__main__":
     parser.add_argument('--convertToNm', default=False, action='store_true', help='Should the parsed concentrations be converted from ng/ul to nM or not?')
     parser.add_argument('--fragmentSize', default='620bp', help='The average fragment size of the DNA, if converting to nM')
     parser.add_argument('--concentrationUdfNm', default='QuantIt HS Concentration (nM)', help='The nM concentration UDF to set')
+    parser.add_argument('--fitStandards', default=None, help='Recalculate the concentrations from the raw fluorescence, using the standards in these wells, e.g. A12:0,B12:0.5,C12:1')
+    parser.add_argument('--curve', default='linear', choices=standard_curve.CURVES, help='The type of standard curve to fit with --fitStandards')
     parser.add_argument('--wellFromOutput', default=False, action='store_true', help='Should the wells on the samples be found in the inputs or the outputs? The initial WGS QC step requires them to be read from the outputs, since the inputs are usually placed into new wells.')
+    parser.add_argument('--progressInterval', type=float, default=5, help='Seconds between the progress updates shown in the step')
 
     args = parser.parse_args()
     lims = Lims(BASEURI, USERNAME, PASSWORD)
@@ -0,0 +1,228 @@
+from argparse import ArgumentParser
+import csv
+import sys
+
+import numpy as np
+
+import spark_reader
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Standard curve fitting for raw Spark/QuantIt fluorescence.
+
+The curves of all plates are fitted at once: the standards are stacked into
+(plates x standards) arrays and fitted with either a least squares line or a
+four parameter logistic (4PL) curve, using a Levenberg-Marquardt solver that
+works on all plates in parallel. The concentrations of all wells on all plates
+are then interpolated in one vectorized call.
+
+As in the Spark software, signals below the lowest standard are reported as
+0.0 (<Min) and signals above the highest standard as 99.9 (>Max).
+
+Used by sparkoutput.py with --fitStandards, or on its own to reanalyze historic
+runs in bulk:
+    python standard_curve.py --standards 'A12:0,B12:0.5,C12:1,D12:2.5,E12:5,F12:10' --curve 4pl
+        run1.xlsx run2.xls [...] > concentrations.csv
+"""
+
+CURVES = ("linear", "4pl")
+
+
+def parse_standards(standards):
+    """'A12:0,B12:0.5' -> (['A12', 'B12'], array([0.0, 0.5]))"""
+    wells = list()
+    concentrations = list()
+    for standard in standards.split(","):
+        well, sep, concentration = standard.strip().partition(":")
+        try:
+            concentrations.append(float(concentration))
+        except ValueError:
+            raise(RuntimeError("Invalid standard '%s'! Format as <well>:<concentration>, e.g. A12:0.5" % standard))
+        wells.append(well)
+    if len(wells) < 2:
+        raise(RuntimeError("At least two standards are required to fit a curve"))
+    return wells, np.array(concentrations)
+
+
+def standard_signals(plates, standard_wells):
+    """The raw signals of the standards as a (plates x standards) array"""
+    signals = np.empty((len(plates), len(standard_wells)))
+    for plate_i, plate in enumerate(plates):
+        index = {well: i for i, well in enumerate(plate.wells)}
+        for standard_i, well in enumerate(standard_wells):
+            if well not in index:
+                raise(RuntimeError("Standard well %s is missing on sheet '%s', plate %d" %
+                                   (well, plate.sheet, plate.index + 1)))
+            signals[plate_i, standard_i] = plate.raw_values[index[well]]
+    if np.isnan(signals).any():
+        raise(RuntimeError("All standards must have a numeric raw value"))
+    return signals
+
+
+def fit_linear(x, y):
+    """Least squares lines y = slope * x + intercept for each row. Returns a (rows x 2) array."""
+    x_mean = x.mean(axis=1, keepdims=True)
+    y_mean = y.mean(axis=1, keepdims=True)
+    slope = ((x - x_mean) * (y - y_mean)).sum(axis=1) / ((x - x_mean) ** 2).sum(axis=1)
+    intercept = y_mean[:, 0] - slope * x_mean[:, 0]
+    return np.column_stack([slope, intercept])
+
+
+def interpolate_linear(params, signals):
+    slope, intercept = params[:, 0:1], params[:, 1:2]
+    return (signals - intercept) / slope
+
+
+def logistic_4pl(params, x):
+    """y = d + (a - d) / (1 + (x / c)^b), with params (a, b, log c, d) for each row"""
+    a, b, log_c, d = [params[:, i:i + 1] for i in range(4)]
+    u = np.where(x > 0, np.exp(b * (np.log(np.where(x > 0, x, 1.0)) - log_c)), 0.0)
+    return d + (a - d) / (1.0 + u), u
+
+
+def jacobian_4pl(params, x):
+    a, b, log_c, d = [params[:, i:i + 1] for i in range(4)]
+    _, u = logistic_4pl(params, x)
+    log_ratio = np.where(x > 0, np.log(np.where(x > 0, x, 1.0)) - log_c, 0.0)
+    denominator = (1.0 + u) ** 2
+    return np.stack([
+        1.0 / (1.0 + u),
+        -(a - d) * u * log_ratio / denominator,
+        (a - d) * u * b / denominator,
+        u / (1.0 + u),
+    ], axis=-1)
+
+
+def fit_4pl(x, y, iterations=200, tolerance=1e-10):
+    """Levenberg-Marquardt fit of a 4PL curve for each row of x and y, all rows at once.
+    Returns a (rows x 4) array of (a, b, log c, d)."""
+    rows = x.shape[0]
+    positive = np.where(x > 0, x, np.nan)
+    params = np.column_stack([
+        y.min(axis=1),
+        np.ones(rows),
+        np.log(np.nanmedian(positive, axis=1)),
+        y.max(axis=1) + 0.1 * (y.max(axis=1) - y.min(axis=1)),
+    ])
+    damping = np.full(rows, 1e-3)
+    residuals = y - logistic_4pl(params, x)[0]
+    cost = (residuals ** 2).sum(axis=1)
+    for _ in range(iterations):
+        jac = jacobian_4pl(params, x)
+        jtj = np.einsum("rsi,rsj->rij", jac, jac)
+        jtr = np.einsum("rsi,rs->ri", jac, residuals)
+        diagonal = np.einsum("rii->ri", jtj)
+        lhs = jtj + damping[:, None, None] * (diagonal[:, :, None] * np.eye(4) + 1e-12 * np.eye(4))
+        step = np.linalg.solve(lhs, jtr[:, :, None])[:, :, 0]
+        candidate = params + step
+        candidate_residuals = y - logistic_4pl(candidate, x)[0]
+        candidate_cost = (candidate_residuals ** 2).sum(axis=1)
+        better = candidate_cost < cost
+        params = np.where(better[:, None], candidate, params)
+        residuals = np.where(better[:, None], candidate_residuals, residuals)
+        improvement = np.where(better, cost - candidate_cost, 0.0)
+        cost = np.where(better, candidate_cost, cost)
+        damping = np.where(better, damping / 10.0, damping * 10.0)
+        # done when no plate improves anymore, either by a tiny step or not at all
+        converged = np.where(better, improvement <= tolerance * (1.0 + cost), damping > 1e10)
+        if converged.all():
+            break
+    return params
+
+
+def interpolate_4pl(params, signals):
+    """The inverse of the 4PL curve. Signals at or beyond the asymptote a (the response at
+    zero concentration) get the concentration 0, and signals at or beyond the asymptote d
+    get an infinite concentration, so that they are clamped to the curve's min and max."""
+    a, b, log_c, d = [params[:, i:i + 1] for i in range(4)]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # how far the signal is from d towards a, 1.0 at a and 0.0 at d
+        position = (signals - d) / (a - d)
+        inside = (position > 0) & (position < 1)
+        ratio = 1.0 / np.where(inside, position, 0.5) - 1.0
+        concentrations = np.where(inside, np.exp(log_c) * ratio ** (1.0 / b), np.nan)
+    concentrations = np.where(position >= 1, 0.0, concentrations)
+    return np.where(position <= 0, np.inf, concentrations)
+
+
+def fit(x, y, curve):
+    if curve == "linear":
+        return fit_linear(x, y)
+    elif curve == "4pl":
+        return fit_4pl(x, y)
+    raise(RuntimeError("Unknown curve '%s'! Choose one of: %s" % (curve, ", ".join(CURVES))))
+
+
+def interpolate(params, signals, curve):
+    if curve == "linear":
+        return interpolate_linear(params, signals)
+    return interpolate_4pl(params, signals)
+
+
+def calculate_concentrations(plates, standards, curve="linear"):
+    """Fits the standard curve of every plate and sets the concentrations of all wells.
+
+    standards is a tuple of the standard wells and their concentrations, see parse_standards.
+    Returns the fitted parameters, one row per plate.
+    """
+    standard_wells, standard_concentrations = standards
+    x = np.tile(standard_concentrations, (len(plates), 1))
+    y = standard_signals(plates, standard_wells)
+    params = fit(x, y, curve)
+
+    # all plates padded to the same number of wells, so that they're interpolated at once
+    width = max(len(plate) for plate in plates)
+    signals = np.full((len(plates), width), np.nan)
+    for plate_i, plate in enumerate(plates):
+        signals[plate_i, :len(plate)] = plate.raw_values
+    concentrations = interpolate(params, signals, curve)
+
+    lowest = y[np.arange(len(plates)), standard_concentrations.argmin()][:, None]
+    highest = y[np.arange(len(plates)), standard_concentrations.argmax()][:, None]
+    increasing = highest >= lowest
+    below = np.where(increasing, signals < lowest, signals > lowest)
+    above = np.where(increasing, signals > highest, signals < highest)
+    concentrations = np.where(below, spark_reader.MIN_CONCENTRATION, concentrations)
+    concentrations = np.where(above, spark_reader.MAX_CONCENTRATION, concentrations)
+    concentrations = np.clip(concentrations, spark_reader.MIN_CONCENTRATION, spark_reader.MAX_CONCENTRATION)
+
+    for plate_i, plate in enumerate(plates):
+        plate.concentrations = concentrations[plate_i, :len(plate)]
+    return params
+
+
+def missing_concentrations(plates, skipped_wells=()):
+    """The wells without a concentration, because their raw value is not a number, as
+    '<well> (sheet '<sheet>', plate <n>)' for error messages"""
+    missing = list()
+    for plate in plates:
+        for well, concentration in zip(plate.wells, plate.concentrations.tolist()):
+            if np.isnan(concentration) and well not in skipped_wells:
+                missing.append("%s (sheet '%s', plate %d)" % (well, plate.sheet, plate.index + 1))
+    return missing
+
+
+def main(args):
+    standards = parse_standards(args.standards)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["File", "Sheet", "Plate", "Well", "Raw", "Concentration"])
+    plates_by_file = list()
+    for filename in args.files:
+        with open(filename, "rb") as spark_file:
+            plates_by_file.append((filename, spark_reader.read_plates(spark_file.read(), parse_concentrations=False)))
+    # the curves of all plates in all files are fitted in one go
+    calculate_concentrations([plate for _, plates in plates_by_file for plate in plates], standards, args.curve)
+    for filename, plates in plates_by_file:
+        for plate in plates:
+            writer.writerows(zip([filename] * len(plate), [plate.sheet] * len(plate), [plate.index + 1] * len(plate),
+                                 plate.wells, plate.raw_values.tolist(), plate.concentrations.tolist()))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--standards', required=True, help='The wells of the standards and their concentrations, e.g. A12:0,B12:0.5,C12:1')
+    parser.add_argument('--curve', default='linear', choices=CURVES, help='The type of standard curve to fit')
+    parser.add_argument('files', nargs='+', help='Spark output files (.xls or .xlsx)')
+
+    main(parser.parse_args())
@@ -1,52 +1,77 @@
-from __future__ import print_function
-import sys
-import subprocess
+#!/usr/bin/env python3
 import argparse
+from io import BytesIO
+from multiprocessing import Pool
 
 import requests
 import xml.dom.minidom
+import xml.parsers.expat
 import xml.etree.ElementTree as ET
 
-from glsapiutil import glsapiutil
+from wells import format_well, sort_columnwise
 
 
 HOSTNAME = 'https://ctmr-lims.scilifelab.se'
 VERSION = "v2"
 BASE_URI = HOSTNAME + "/api/" + VERSION + "/"
 
+__doc__ = """
+Extract the electropherogram images of each sample from a TapeStation report (PDF).
 
-def download_pdf(artifactluid_of_pdf, username, password):
+The PDF is downloaded into memory once. The pages are read in a pool of worker
+processes, which each open the PDF once and encode the first image of every page
+they get as a JPEG in memory. When all pages are done, the images are written in
+one go as <output file LUID>_<well>.jpeg, which Clarity attaches to the result
+file placeholders with those LUIDs when the script finishes. The images are
+not uploaded through the API; the only API calls are the download of the PDF
+and one batch retrieve of the output artifacts.
+
+The sample in the first well (columnwise) is expected on page --startPage, the
+next sample on the next page and so on.
+
+Runs on Python 3, with PyMuPDF and Pillow (see requirements.txt):
+    python3 tapestation_extract.py -u <username> -p <password> -a <artifact LUID of the PDF>
+        -f '<output file LUIDs, space separated>' [-s 10] [-n 4]
+"""
+
+# The PDF, opened once in each worker process
+_document = None
+
+
+def api_session(username, password):
+    session = requests.Session()
+    session.auth = (username, password)
+    return session
+
+
+def download_pdf(session, artifactluid_of_pdf):
     """
-    Finds the file LUID from artifact LUID of the PDF
+    Finds the file LUID from artifact LUID of the PDF, and returns the contents of the file
     """
     artif_URI = BASE_URI + "artifacts/" + artifactluid_of_pdf
-    artGET = requests.get(artif_URI, auth=(username, password))       # GET artifact XML
+    artGET = session.get(artif_URI)                                   # GET artifact XML
     artXML = artGET.text
     root = ET.fromstring(artXML)
 
-    #The following part doesn't make sense
-    #############################################################
-
     fileLUID = root.findall("{http://genologics.com/ri/file}file")[0].get("limsid")
-   
-
-    #############################################################
 
     file_URI = BASE_URI + "files/" + fileLUID + "/download"
-    fileGET = requests.get(file_URI, auth=(username, password))       # Retrieves the pdf file
-    with open("frag.pdf", 'wb') as fd:
-        for chunk in fileGET.iter_content():                          # Saving data stream to file in local
-            fd.write(chunk)
+    fileGET = session.get(file_URI)                                   # Retrieves the pdf file
+    fileGET.raise_for_status()
+    return fileGET.content
 
 
-def getartifact_batch(LUIDs):
+def getartifact_batch(session, LUIDs):
 
     lXML = ['<ri:links xmlns:ri="http://genologics.com/ri">']
     for limsid in LUIDs:
         lXML.append( '<link uri="' + BASE_URI + 'artifacts/' + limsid + '" rel="artifacts"/>' )
     lXML.append('</ri:links>')
     lXML = ''.join(lXML)
-    mXML = api.getBatchResourceByURI(BASE_URI + "artifacts/batch/retrieve", lXML)
+    response = session.post(BASE_URI + "artifacts/batch/retrieve", data=lXML.encode("utf-8"),
+                            headers={"Content-Type": "application/xml", "Accept": "application/xml"})
+    response.raise_for_status()
+    mXML = response.text
 
     try:
         mDOM = xml.dom.minidom.parseString(mXML)
@@ -56,11 +81,11 @@ def getartifact_batch(LUIDs):
         else:
             return None
 
-    except xml.etree.ElementTree.ParseError as e:
+    except xml.parsers.expat.ExpatError as e:
         print("Could not parse xml: {}".format(mXML), e)
 
 
-def make_wellmap(batchDom):
+def make_wellmap(batchDOM):
     """
     Return a dict of which sample is in which well
     """
@@ -70,49 +95,67 @@ def make_wellmap(batchDom):
         limsID = node.getAttribute("limsid")
         node_value = node.getElementsByTagName("value")
         well = node_value[0].firstChild.data
-        place = well[0] + well[2:]
-        well_map[str(place)] = str(limsID)
+        well_map[str(format_well(well))] = str(limsID)
 
     return well_map
 
 
-def main(startpage=10):
+def page_assignments(well_map, startpage):
+    """(page, filename) for each sample, the pages follow the wells columnwise"""
+    wells = sort_columnwise(list(well_map), lambda well: well)
+    return [(startpage + i, well_map[well_loc] + "_" + well_loc + ".jpeg") for i, well_loc in enumerate(wells)]
 
-    #Setup the api
-    api = glsapiutil()
-    api.setHostname(HOSTNAME)
-    api.setVersion(VERSION)
-    api.setup(args.username, args.password)
 
-    download_pdf(args.artifactLUID, args.username, args.password)
+def _open_document(pdf):
+    global _document
+    try:
+        import pymupdf as fitz
+    except ImportError:
+        import fitz  # PyMuPDF before 1.24
+    _document = fitz.open(stream=pdf, filetype="pdf")
+
+
+def extract_page_image(page):
+    """The first image on the (1-based) page, encoded as JPEG"""
+    from PIL import Image
+    images = _document.get_page_images(page - 1)
+    if not images:
+        raise RuntimeError("No image found on page {}".format(page))
+    image = _document.extract_image(images[0][0])
+    if image["ext"] in ("jpeg", "jpg"):
+        return image["image"]
+    jpeg = BytesIO()
+    Image.open(BytesIO(image["image"])).convert("RGB").save(jpeg, "JPEG")
+    return jpeg.getvalue()
+
+
+def extract_images(pdf, pages, processes=None):
+    """Extracts the images of all pages in a process pool, returns the JPEGs in page order"""
+    pool = Pool(processes, initializer=_open_document, initargs=(pdf,))
+    try:
+        return pool.map(extract_page_image, pages)
+    finally:
+        pool.close()
+        pool.join()
 
-    outputfileLUIDs = args.outputfileLUIDs.split(" ")
-    batchXML = getartifact_batch(outputfileLUIDs)
-    batchDOM = xml.dom.minidom.parseString(batchXML)
-    well_map = make_wellmap(batchDOM)
 
-    wells = [x + str(y) for y in range(1,13) for x in 'ABCDEFGH']
+def main(args):
+    session = api_session(args.username, args.password)
 
-    page = startpage
-    for well_loc in wells:
-       if well_loc in well_map.keys():
-          limsid = well_map[well_loc]
-          filename = limsid + "_" + well_loc
-          ppmname = filename + "-000.ppm"
-          jpegname = filename + "-000.jpeg"
+    pdf = download_pdf(session, args.artifactLUID)
 
-          cmd1 = ['pdfimages', 'frag.pdf', '-j', '-f', str(page), '-l', str(page), filename]
-          p1 = subprocess.Popen(cmd1)
-          p1.wait()
-          page += 1
+    outputfileLUIDs = args.outputfileLUIDs.split(" ")
+    batchXML = getartifact_batch(session, outputfileLUIDs)
+    batchDOM = xml.dom.minidom.parseString(batchXML)
+    well_map = make_wellmap(batchDOM)
 
-          cmd2 = ['convert', ppmname, jpegname]
-          p2 = subprocess.Popen(cmd2)                       #conversion to .jpeg
-          p2.wait()
+    assignments = page_assignments(well_map, args.startPage)
+    jpegs = extract_images(pdf, [page for page, _ in assignments], args.processes)
 
-          cmd3 = ['rm' ,'*ppm']                             #removing ppm image so it isn't inadvertently attached
-          p3 = subprocess.Popen(cmd3)
-          p3.wait()
+    # Clarity attaches the files starting with an output file LUID to that output
+    for (_, filename), jpeg in zip(assignments, jpegs):
+        with open(filename, 'wb') as fd:
+            fd.write(jpeg)
 
 
 if __name__ == "__main__":
@@ -121,5 +164,7 @@ if __name__ == "__main__":
     parser.add_argument('-u', '--username', help='username')
     parser.add_argument('-p', '--password', help='password')
     parser.add_argument('-f', '--outputfileLUIDs', help='')
+    parser.add_argument('-s', '--startPage', type=int, default=10, help='The page of the first sample in the report')
+    parser.add_argument('-n', '--processes', type=int, default=None, help='Number of worker processes, defaults to the number of CPUs')
     args = parser.parse_args()
-    main()
+    main(args)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+__doc__ = """
+Vectorized peak engine for TapeStation Compact Peak Tables (csv).
+
+The tables are loaded once into columnar NumPy arrays, the markers and ladders
+are filtered out with masks, and the peaks within the expected fragment size
+window are summarized per well with one of these strategies:
+
+    single    The size of the peak if there is exactly one, otherwise -1
+    weighted  The mean size of the peaks, weighted by their integrated area
+    dominant  The size of the peak with the largest integrated area
+    smear     The median size of the smear, i.e. the size where the cumulative
+              integrated area of the peaks reaches half of the total
+
+Several tables (e.g. a pile of runs) can be processed in one call. Wells are
+keyed on (FileName, Well), so the same well in different runs is kept apart.
+"""
+__author__ = "CTMR"
+__date__ = "2020"
+import csv
+
+import numpy as np
+
+
+IGNORED_OBSERVATIONS = ("Lower Marker", "Upper Marker")
+IGNORED_SAMPLE_DESCRIPTIONS = ("Ladder",)
+COLUMNS = ("FileName", "Well", "Sample Description", "Size [bp]", "% Integrated Area", "Observations")
+STRATEGIES = ("single", "weighted", "dominant", "smear")
+
+
+class PeakTable(object):
+    """The columns of one or more Compact Peak Tables as arrays"""
+
+    def __init__(self, files, wells, descriptions, sizes, areas, observations):
+        self.files = files
+        self.wells = wells
+        self.descriptions = descriptions
+        self.sizes = sizes
+        self.areas = areas
+        self.observations = observations
+
+    def __len__(self):
+        return len(self.wells)
+
+
+class PeakSummary(object):
+    """One fragment size per (file, well) that has any peaks in the size window"""
+
+    def __init__(self, files, wells, sizes, peak_counts):
+        self.files = files
+        self.wells = wells
+        self.sizes = sizes
+        self.peak_counts = peak_counts
+
+    def __len__(self):
+        return len(self.wells)
+
+    def by_well(self):
+        """{well: size}, for a summary of a single run"""
+        if len(set(self.files.tolist())) > 1:
+            raise(RuntimeError("The peak summary contains several runs, wells are not unique"))
+        return dict(zip(self.wells.tolist(), self.sizes.tolist()))
+
+
+def to_numbers(column, dtype):
+    """Empty cells are 0, as in the TapeStation software"""
+    column = np.asarray(column, dtype=object)
+    column[column == ""] = "0"
+    try:
+        return column.astype(dtype)
+    except ValueError:
+        raise(RuntimeError("Could not parse column values: {}".format(
+            [value for value in column.tolist() if not is_number(value)][:5])))
+
+
+def is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def load_table(lines):
+    """Loads one Compact Peak Table (an iterable of csv lines) into a PeakTable"""
+    reader = csv.reader(lines, delimiter=',')
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise(RuntimeError("The TapeStation CSV file is empty"))
+    try:
+        indexes = [header.index(column) for column in COLUMNS]
+    except ValueError as e:
+        raise(RuntimeError("Could not find the expected columns in the TapeStation CSV file: {}".format(e)))
+    rows = [row for row in reader if row]
+    width = max(indexes) + 1
+    for row in rows:
+        if len(row) < width:
+            raise(RuntimeError("Could not parse line: {}".format(row)))
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    files, wells, descriptions, sizes, areas, observations = [
+        np.array(columns[index], dtype=str) for index in indexes]
+    return PeakTable(files, wells, descriptions, to_numbers(sizes, float).astype(int),
+                     to_numbers(areas, float), observations)
+
+
+def concatenate(tables):
+    return PeakTable(*[np.concatenate([getattr(table, name) for table in tables]) for name in
+                       ("files", "wells", "descriptions", "sizes", "areas", "observations")])
+
+
+def load_tables(tables):
+    """Loads several Compact Peak Tables into one PeakTable"""
+    return concatenate([load_table(lines) for lines in tables])
+
+
+def sample_peak_mask(table, min_fragsize, max_fragsize):
+    """Peaks of the samples within (min_fragsize, max_fragsize), without markers and ladders"""
+    return (~np.isin(table.observations, IGNORED_OBSERVATIONS) &
+            ~np.isin(table.descriptions, IGNORED_SAMPLE_DESCRIPTIONS) &
+            (table.sizes > min_fragsize) & (table.sizes < max_fragsize))
+
+
+def summarize(table, min_fragsize, max_fragsize, strategy="single"):
+    """Summarizes the peaks of every well in the PeakTable with the given strategy"""
+    if strategy not in STRATEGIES:
+        raise(RuntimeError("Unknown strategy '%s'! Choose one of: %s" % (strategy, ", ".join(STRATEGIES))))
+    mask = sample_peak_mask(table, min_fragsize, max_fragsize)
+    files = table.files[mask]
+    wells = table.wells[mask]
+    sizes = table.sizes[mask].astype(float)
+    areas = table.areas[mask]
+
+    # one group per (file, well), in order of first appearance
+    keys = np.char.add(np.char.add(files, "\t"), wells)
+    unique_keys, first, groups = np.unique(keys, return_index=True, return_inverse=True)
+    groups = groups.ravel()
+    counts = np.bincount(groups, minlength=len(unique_keys))
+    total_areas = np.bincount(groups, weights=areas, minlength=len(unique_keys))
+
+    if strategy == "single":
+        summary = np.where(counts == 1, np.bincount(groups, weights=sizes, minlength=len(unique_keys)), -1)
+    elif strategy == "weighted":
+        weighted = np.bincount(groups, weights=sizes * areas, minlength=len(unique_keys))
+        plain = np.bincount(groups, weights=sizes, minlength=len(unique_keys)) / np.maximum(counts, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            summary = np.where(total_areas > 0, weighted / total_areas, plain)
+        summary = np.rint(summary)
+    elif strategy == "dominant":
+        # sorted by group and area, the dominant peak is the last one of each group
+        order = np.lexsort((areas, groups))
+        last = np.cumsum(counts) - 1
+        summary = sizes[order][last]
+    else:
+        # sorted by group and size, the median is where the cumulative area reaches half of the total
+        order = np.lexsort((sizes, groups))
+        sorted_groups = groups[order]
+        cumulative = np.cumsum(areas[order])
+        group_start = np.concatenate([[0.0], cumulative])[np.cumsum(counts) - counts]
+        within = cumulative - group_start[sorted_groups]
+        reached = within >= total_areas[sorted_groups] / 2.0
+        # the first peak of each group that reaches half of the area
+        candidates = np.where(reached, np.arange(len(order)), len(order))
+        median_index = np.minimum.reduceat(candidates, np.cumsum(counts) - counts) if len(order) else candidates
+        summary = sizes[order][np.minimum(median_index, len(order) - 1)]
+
+    appearance = np.argsort(first, kind="stable")
+    return PeakSummary(files[first][appearance], wells[first][appearance],
+                       summary.astype(int)[appearance], counts[appearance])
+
+
+def summarize_tables(tables, min_fragsize, max_fragsize, strategy="single"):
+    """Loads and summarizes one or more Compact Peak Tables in one call"""
+    return summarize(load_tables(tables), min_fragsize, max_fragsize, strategy)
@@ -0,0 +1,79 @@
+import os
+import xml.etree.ElementTree as ET
+from argparse import Namespace
+
+import pytest
+
+pytest.importorskip("genologics")
+
+import driver_file_generator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+
+class Entity(object):
+    """Stands in for the genologics entities, with the XML the LIMS returns"""
+
+    def __init__(self, id, name, xml, location=None):
+        self.id = id
+        self.name = name
+        self.root = ET.fromstring(xml)
+        self.location = location
+
+
+def artifact(id, concentration=None, location=None):
+    udf = ('<udf:field xmlns:udf="http://genologics.com/ri/userdefined" name="Concentration">%s</udf:field>'
+           % concentration if concentration is not None else "")
+    return Entity(id, "Sample " + id, "<artifact>%s</artifact>" % udf, location)
+
+
+class FakeLims(object):
+
+    def get_batch(self, entities):
+        return list(entities)
+
+
+class FakeProcess(object):
+
+    def __init__(self, wells):
+        plate = Entity("27-100", "Plate1", '<container><type name="96 well plate"/></container>')
+        self.id = "24-1000"
+        self.type = Entity("", "QuantIt HighSensitivity", "<process-type/>")
+        self.input_output_maps = []
+        for ix, (well, concentration) in enumerate(wells):
+            input_ = artifact("2-%d" % ix, concentration, (plate, well))
+            self.input_output_maps.append((
+                {"uri": input_},
+                {"uri": artifact("92-%d" % ix),
+                 "output-generation-type": "PerInput", "output-type": "ResultFile"}))
+        # a shared output is not a row
+        self.input_output_maps.append((
+            {"uri": input_},
+            {"uri": artifact("92-shared"), "output-generation-type": "PerAllInputs",
+             "output-type": "ResultFile"}))
+
+
+# Fluent_input.csv is written by hand, not produced by DriverFileGenerator.jar. Replace it
+# with the jar's output for the same process before the automation is switched over.
+def test_fluent_template_renders_the_expected_driver_file(tmpdir, monkeypatch):
+    process = FakeProcess([("B:1", "150.25"), ("A:10", "7"), ("A:1", "12.5"), ("B:2", None), ("A:2", "0.31")])
+    monkeypatch.setattr(driver_file_generator, "Process", lambda lims, uri: process)
+    output_file = str(tmpdir.join("driver.csv"))
+    args = Namespace(template=os.path.join(ROOT, "driver_templates", "Fluent_template.csv"),
+                     processURI="https://lims/api/v2/processes/24-1000", outputFile=output_file)
+
+    driver_file_generator.main(FakeLims(), args)
+
+    with open(output_file, "rb") as actual, open(os.path.join(FIXTURES, "Fluent_input.csv"), "rb") as expected:
+        assert actual.read() == expected.read()
+
+
+def test_placement_falls_back_to_row_colon_column():
+    placement = driver_file_generator.compile_placement([
+        '// The inputs to this segment are: String row, String column, Node containerTypeNode',
+        'if (containerTypeNode.@name == "96 well plate") return row + column',
+        'else return row + ":" + column'])
+
+    assert placement("A", "1", "96 well plate") == "A1"
+    assert placement("A", "1", "Tube") == "A:1"
@@ -0,0 +1,91 @@
+import csv
+import time
+from argparse import Namespace
+
+import pytest
+
+pytest.importorskip("genologics")
+
+import export_samples
+
+ROWS = [["27-1", "Plate1", "A:1", "sample1", "2-1"],
+        ["27-1", "Plate1", "B:1", "sample2", "2-2"]]
+
+
+def write(filename, batches):
+    writer = export_samples.get_writer(filename)
+    try:
+        for rows in batches:
+            writer.write(rows)
+    finally:
+        writer.close()
+
+
+def test_csv_writer(tmpdir):
+    filename = str(tmpdir.join("samples.csv"))
+
+    write(filename, [ROWS[:1], [], ROWS[1:]])
+
+    with open(filename, newline="") as csv_file:
+        assert list(csv.reader(csv_file)) == [export_samples.COLUMNS] + ROWS
+
+
+def test_xlsx_writer(tmpdir):
+    openpyxl = pytest.importorskip("openpyxl")
+    filename = str(tmpdir.join("samples.xlsx"))
+
+    write(filename, [ROWS[:1], [], ROWS[1:]])
+
+    sheet = openpyxl.load_workbook(filename)["Samples"]
+    assert [list(row) for row in sheet.iter_rows(values_only=True)] == [export_samples.COLUMNS] + ROWS
+
+
+def test_parquet_writer(tmpdir):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    filename = str(tmpdir.join("samples.parquet"))
+
+    write(filename, [ROWS[:1], [], ROWS[1:]])
+
+    table = parquet.read_table(filename)
+    assert table.column_names == export_samples.COLUMNS
+    assert [list(row.values()) for row in table.to_pylist()] == ROWS
+
+
+def test_unknown_format_is_refused(tmpdir):
+    with pytest.raises(RuntimeError):
+        export_samples.get_writer(str(tmpdir.join("samples.txt")))
+
+
+class Entity(object):
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FakeLims(object):
+    """Containers with the wells given, the first container answers last"""
+
+    def __init__(self, wells_by_container):
+        self.wells_by_container = wells_by_container
+
+    def get_artifacts(self, containerlimsid, resolve):
+        if containerlimsid == "27-1":
+            time.sleep(0.05)
+        return [Entity(id="2-%s-%s" % (containerlimsid, well), name="sample %s" % well,
+                       location=(None, well)) for well in self.wells_by_container[containerlimsid]]
+
+
+def test_rows_are_written_in_container_and_column_order(tmpdir, monkeypatch):
+    monkeypatch.setattr(export_samples, "Container", lambda lims, id: Entity(name="Plate " + id))
+    lims = FakeLims({"27-1": ["A:2", "B:1", "A:1"], "27-2": ["A:1"]})
+    filename = str(tmpdir.join("samples.csv"))
+    args = Namespace(containers=["27-1", "27-2", "27-1"], projects=[], since=None, until=None,
+                     output=filename, workers=4)
+
+    export_samples.main(lims, args)
+
+    with open(filename, newline="") as csv_file:
+        rows = list(csv.reader(csv_file))[1:]
+    assert [(row[0], row[2]) for row in rows] == [("27-1", "A:1"), ("27-1", "B:1"), ("27-1", "A:2"),
+                                                  ("27-2", "A:1")]
+    assert rows[0][1] == "Plate 27-1"
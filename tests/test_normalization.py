@@ -0,0 +1,56 @@
+import pytest
+
+from normalization import load_plate
+
+
+class Entity(object):
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FakeProcess(object):
+
+    def __init__(self, plates_and_wells):
+        self.inputs = [Entity(name="sample %s %s" % (plate.id, well), type="Analyte", location=(plate, well),
+                              udf={"Concentration": 1.0})
+                       for plate, well in plates_and_wells]
+
+    def all_inputs(self, unique=True):
+        return list(self.inputs)
+
+
+def plate(container_type, id="27-1"):
+    return Entity(id=id, type=Entity(name=container_type))
+
+
+def test_384_well_plate_with_samples_in_the_96_well_corner():
+    plate_384 = plate("384 well plate")
+    process = FakeProcess([(plate_384, "A:2"), (plate_384, "A:1"), (plate_384, "H:12"), (plate_384, "B:1")])
+
+    loaded = load_plate(process, "Concentration")
+
+    assert loaded.rows == 16
+    assert list(loaded.wells) == ["A1", "B1", "A2", "H12"]
+    assert list(loaded.positions) == [0, 1, 16, 183]
+
+
+def test_96_well_plate():
+    plate_96 = plate("96 well plate")
+
+    loaded = load_plate(FakeProcess([(plate_96, "A:2"), (plate_96, "A:1")]), "Concentration")
+
+    assert loaded.rows == 8
+    assert list(loaded.positions) == [0, 8]
+
+
+def test_unknown_container_type_fails():
+    with pytest.raises(ValueError, match="Tube"):
+        load_plate(FakeProcess([(plate("Tube"), "1:1")]), "Concentration")
+
+
+def test_plates_of_different_formats_fail():
+    process = FakeProcess([(plate("96 well plate"), "A:1"), (plate("384 well plate", id="27-2"), "A:1")])
+
+    with pytest.raises(RuntimeError, match="different formats"):
+        load_plate(process, "Concentration")
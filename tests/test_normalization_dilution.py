@@ -0,0 +1,50 @@
+import pytest
+
+import normalization
+import normalization_dilution
+import normalization_worklist
+
+
+def plate(concentrations, containers=None, positions=None):
+    wells = ["A1", "B1", "C1", "D1"][:len(concentrations)]
+    return normalization.NormalizationPlate(wells, ["s%d" % ix for ix in range(len(concentrations))],
+                                            concentrations, [False] * len(concentrations),
+                                            positions=positions, containers=containers)
+
+
+def test_samples_in_the_same_well_of_different_plates_are_diluted_separately():
+    two_plates = plate([50.0, 50.0], containers=["27-1", "27-2"], positions=[0, 0])
+    plan = normalization_dilution.plan_dilutions(two_plates, 1.0, 10.0, 0.0)
+
+    records = normalization_dilution.dilution_records(plan)
+
+    assert records.count("B;") == 1
+    first, second = "\n".join(records).split("B;")
+    for plate_records in (first, second):
+        samples = [record for record in plate_records.split("\n") if "Water Free Single" in record]
+        assert [record.split(";")[1] for record in samples] == ["Source", "Dilution 1"]
+
+    # The normalization worklist picks the samples of each plate up from its own dilution plate
+    result = normalization.normalize(plan.diluted_plate(), 1.0, 10.0, 0.0)
+    worklist = normalization_worklist.optimize(result)
+    assert worklist.records.count("B;") == 1
+
+
+def test_refuses_a_target_volume_that_is_too_low_to_pipette():
+    with pytest.raises(RuntimeError) as e:
+        normalization_dilution.plan_dilutions(plate([100.0]), 1.0, 1.0, 0.0)
+    assert "too low for pipetting" in str(e.value)
+
+
+def test_samples_are_not_diluted_below_the_threshold():
+    plan = normalization_dilution.plan_dilutions(plate([100.0]), 1.0, 10.0, 2.0)
+    assert plan.tiers[0].factor <= 50.0
+
+    result = normalization.normalize(plan.diluted_plate(), 1.0, 10.0, 2.0)
+    assert result.sample_volumes[0] >= normalization.TOO_LOW_VOLUME
+
+
+def test_refuses_samples_that_would_be_diluted_below_the_threshold():
+    with pytest.raises(RuntimeError) as e:
+        normalization_dilution.plan_dilutions(plate([100.0, 1000.0]), 1.0, 10.0, 8.0)
+    assert "A1, B1" in str(e.value)
@@ -0,0 +1,51 @@
+import pytest
+
+import normalization
+import normalization_dilution
+import normalization_worklist
+from normalization_worklist import WorklistOptions, aspirate_volume
+
+
+def aspirated_water(records):
+    return [float(record.split(";")[6]) for record in records if record.startswith("A;Water;")]
+
+
+def test_dead_volume_is_only_added_to_multi_dispense():
+    assert aspirate_volume([(0, 50.0)], 10.0) == 50.0
+    assert aspirate_volume([(0, 50.0), (1, 40.0)], 10.0) == 100.0
+
+
+def test_worklist_and_dilutions_use_the_same_dead_volume_rule():
+    options = WorklistOptions(tip_volume=200.0, dead_volume=10.0)
+    # The first sample needs 180 ul water, alone in a tip, the next two share a tip
+    plate = normalization.NormalizationPlate(["A1", "B1", "C1"], ["s1", "s2", "s3"], [10.0, 2.0, 2.0],
+                                             [False] * 3, containers=["27-1"] * 3)
+    result = normalization.normalize(plate, 1.0, 200.0, 0.0)
+    result.water_volumes[:] = [180.0, 50.0, 40.0]
+    worklist = normalization_worklist.optimize(result, options)
+    assert aspirated_water(worklist.records) == [180.0, 100.0]
+
+    # 50 ul water for the 2x dilution, 80 ul for each 5x dilution: a run of two and a single dispense
+    plan = normalization_dilution.DilutionPlan(plate, [normalization_dilution.DilutionTier(2.0, [0], [2.0]),
+                                                       normalization_dilution.DilutionTier(5.0, [1, 2], [5.0])],
+                                               dilution_volume=100.0)
+    records = normalization_dilution.dilution_records(plan, options)
+    assert aspirated_water(records) == [140.0, 80.0]
+
+
+def rack_types(records):
+    return set(record.split(";")[3] for record in records if record.startswith(("A;Source;", "D;Destination;")))
+
+
+def test_rack_type_follows_the_plate_format():
+    plate = normalization.NormalizationPlate(["A1", "A2"], ["s1", "s2"], [2.0, 2.0], [False] * 2,
+                                             positions=[0, 16], containers=["27-1"] * 2, rows=16)
+    result = normalization.normalize(plate, 1.0, 10.0, 0.0)
+
+    assert rack_types(normalization_worklist.optimize(result).records) == {"384 Well Microplate"}
+    options = WorklistOptions(plate_rack_type="384 Deep Well")
+    assert rack_types(normalization_worklist.optimize(result, options).records) == {"384 Deep Well"}
+
+    plate.rows = 12
+    with pytest.raises(RuntimeError):
+        normalization_worklist.optimize(result)
@@ -0,0 +1,75 @@
+from argparse import Namespace
+
+import pytest
+
+pytest.importorskip("genologics")
+
+import normalizationcsv780
+
+
+class Entity(object):
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FakeProcess(object):
+    """The inputs of a normalization step, all on one 96 well plate"""
+
+    def __init__(self, concentrations_by_well):
+        plate = Entity(id="27-1", type=Entity(name="96 well plate"))
+        self.inputs = [Entity(name="sample %s" % well, type="Analyte", location=(plate, well),
+                              udf={"Concentration (nM)": concentration})
+                       for well, concentration in concentrations_by_well]
+
+    def all_inputs(self, unique=True):
+        return list(self.inputs)
+
+
+def args(tmpdir, **overrides):
+    values = dict(pid="24-1", newCsvFilename=None, concentrationUDF="Concentration (nM)",
+                  targetConcentration="1.0", targetVolume="10.0", thresholdConcNoNormalize="0.0",
+                  concOnOutput=False, extraOutput=[], worklist=str(tmpdir.join("worklist.gwl")),
+                  tipVolume="200", plateRackType=None,
+                  dilutionWorklist=str(tmpdir.join("dilution.gwl")), dilutionVolume="100")
+    values.update(overrides)
+    return Namespace(**values)
+
+
+def records(path):
+    with open(str(path), newline="") as gwl:
+        return gwl.read().split("\r\n")[:-1]
+
+
+def test_dilution_worklist_end_to_end(tmpdir, monkeypatch):
+    # A1 is normalized directly, B1 needs a dilution: 0.1 ul * 4 would still be too low
+    process = FakeProcess([("A:1", 2.0), ("B:1", 100.0)])
+    monkeypatch.setattr(normalizationcsv780, "Process", lambda lims, id: process)
+
+    normalizationcsv780.main(None, args(tmpdir), None)
+
+    # B1 is diluted 100x, in two serial 10x dilutions
+    dilutions = [record.split(";") for record in records(tmpdir.join("dilution.gwl"))]
+    transfers = [fields for fields in dilutions if fields[7:8] == ["Water Free Single"]]
+    assert [(fields[0], fields[1], fields[4], fields[6]) for fields in transfers] == [
+        ("A", "Source", "2", "10.00"), ("D", "Dilution 1", "2", "10.00"),
+        ("A", "Dilution 1", "2", "10.00"), ("D", "Dilution 2", "2", "10.00")]
+
+    # and normalized from the last dilution plate, A1 from the source plate
+    samples = [record.split(";") for record in records(tmpdir.join("worklist.gwl"))
+               if record.startswith("A;") and not record.startswith("A;Water;")]
+    assert [(fields[1], fields[4], fields[6]) for fields in samples] == [
+        ("Source", "1", "5.00"), ("Dilution 2", "2", "10.00")]
+
+
+@pytest.mark.parametrize("overrides", [
+    dict(worklist=None),
+    dict(newCsvFilename="normalization.csv"),
+    dict(extraOutput=["fluent480:fluent.csv"]),
+])
+def test_outputs_without_the_source_plate_are_refused_with_dilutions(tmpdir, monkeypatch, overrides):
+    monkeypatch.setattr(normalizationcsv780, "Process", lambda lims, id: FakeProcess([("A:1", 100.0)]))
+
+    with pytest.raises(RuntimeError):
+        normalizationcsv780.main(None, args(tmpdir, **overrides), None)
+    assert not tmpdir.join("dilution.gwl").exists()
@@ -0,0 +1,83 @@
+import threading
+import time
+from xml.etree import ElementTree
+
+from progress_reporter import ProgressReporter
+
+
+class FakeLims(object):
+    """Records the status and message of every PUT of the programstatus"""
+
+    def __init__(self, fail=False):
+        self.gets = 0
+        self.puts = list()
+        self.fail = fail
+        self.put_done = threading.Event()
+
+    def get(self, uri):
+        self.gets += 1
+        return ElementTree.fromstring("<stp:program-status xmlns:stp='http://genologics.com/ri/step'/>")
+
+    def put(self, uri, data):
+        if self.fail:
+            raise IOError("The LIMS is down")
+        root = ElementTree.fromstring(data)
+        self.puts.append((root.find("status").text, root.find("message").text))
+        self.put_done.set()
+
+
+def reporter(lims, interval=60.0):
+    return ProgressReporter(lims, "http://lims/api/v2/steps/24-1", interval=interval)
+
+
+def test_only_the_latest_message_is_sent():
+    lims = FakeLims()
+    progress = reporter(lims)
+
+    for done in range(1, 101):
+        progress.progress(done, 100)
+    progress.flush()
+    progress.flush()
+
+    assert lims.puts == [("RUNNING", "100/100 samples done")]
+    assert lims.gets == 1
+
+
+def test_puts_at_most_once_per_interval():
+    lims = FakeLims()
+    progress = reporter(lims, interval=60.0)
+    progress.update("starting")
+    # the first message is sent as soon as the thread starts
+    progress.start()
+    try:
+        assert lims.put_done.wait(5.0)
+        for done in range(1, 1001):
+            progress.progress(done, 1000)
+        time.sleep(0.1)
+        assert lims.puts == [("RUNNING", "starting")]
+    finally:
+        progress.stop()
+
+    # and the latest message when it stops
+    assert lims.puts == [("RUNNING", "starting"), ("RUNNING", "1000/1000 samples done")]
+
+
+def test_stop_sends_the_final_status_right_away():
+    lims = FakeLims()
+    with reporter(lims) as progress:
+        progress.update("working")
+
+    progress.stop("COMPLETE", "Done")
+
+    assert lims.puts[-1] == ("COMPLETE", "Done")
+    assert progress._thread is None
+
+
+def test_failing_puts_never_fail_the_script():
+    lims = FakeLims(fail=True)
+    progress = reporter(lims)
+
+    progress.update("working")
+    progress.stop("COMPLETE", "Done")
+
+    assert lims.puts == []
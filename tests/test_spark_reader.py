@@ -0,0 +1,52 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+import spark_reader
+
+
+def spark_file(sheets):
+    """An .xlsx file with a sheet of (well, raw value, concentration) rows per sheet name"""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets:
+        sheet = workbook.create_sheet(name)
+        sheet.append(["Tecan Spark", None, None])
+        sheet.append(["Well", "Raw", "Concentration"])
+        for row in rows:
+            sheet.append(list(row))
+    contents = BytesIO()
+    workbook.save(contents)
+    return contents.getvalue()
+
+
+def test_reads_several_plates_per_sheet_and_per_file():
+    contents = spark_file([
+        ("Plate 1 and 2", [("A1", 100, 1.5), ("B1", 200, "<Min"),
+                           # A1 again: the second plate starts
+                           ("A1", 300, ">Max"), ("B1", 400, "NoCalc")]),
+        ("Plate 3", [("A1", 500, 2.5), ("C1", "Overflow", 3.0)]),
+    ])
+
+    plates = spark_reader.read_plates(contents)
+
+    assert [(plate.sheet, plate.index, plate.wells) for plate in plates] == [
+        ("Plate 1 and 2", 0, ["A1", "B1"]), ("Plate 1 and 2", 1, ["A1", "B1"]), ("Plate 3", 2, ["A1", "C1"])]
+    assert plates[0].concentrations.tolist() == [1.5, spark_reader.MIN_CONCENTRATION]
+    assert plates[1].concentrations.tolist() == [spark_reader.MAX_CONCENTRATION, 400.0]
+    assert plates[0].rows == [2, 3]
+    assert np.isnan(plates[2].raw_values[1])
+
+
+def test_invalid_concentration_names_the_well_and_plate():
+    contents = spark_file([("Sheet1", [("A1", 100, 1.5)]), ("Sheet2", [("A1", 100, 1.0), ("B1", 200, "n/a")])])
+
+    with pytest.raises(RuntimeError) as error:
+        spark_reader.read_plates(contents)
+    assert "well B1 on sheet 'Sheet2', plate 2" in str(error.value)
+
+    plates = spark_reader.read_plates(contents, parse_concentrations=False)
+    assert [plate.concentrations for plate in plates] == [None, None]
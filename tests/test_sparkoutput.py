@@ -0,0 +1,91 @@
+from argparse import Namespace
+from io import BytesIO
+import logging
+
+import pytest
+
+pytest.importorskip("genologics")
+pytest.importorskip("openpyxl")
+
+import sparkoutput
+from test_spark_reader import spark_file
+
+
+class Entity(object):
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FakeLims(object):
+
+    def __init__(self, contents):
+        self.contents = contents
+        self.updated = None
+
+    def get_file_contents(self, id):
+        return BytesIO(self.contents)
+
+    def put_batch(self, artifacts):
+        self.updated = list(artifacts)
+
+
+class FakeProgress(object):
+
+    def update(self, message):
+        pass
+
+    def progress(self, done, total, what=None):
+        pass
+
+
+class FakeProcess(object):
+    """Samples in well A1 and B1 of the containers, in the order given"""
+
+    def __init__(self, container_names):
+        self.inputs, self.outputs, self.input_output_maps = [], [], []
+        for container_ix, name in enumerate(container_names):
+            container = Entity(id="27-%d" % container_ix, name=name)
+            for well in ("A:1", "B:1"):
+                sample_id = "%s_%s" % (name, well)
+                input_ = Entity(id="2-" + sample_id, type="Analyte", location=(container, well))
+                output = Entity(id="92-" + sample_id, type="ResultFile", name=sample_id, udf={})
+                self.inputs.append(input_)
+                self.outputs.append(output)
+                self.input_output_maps.append(({"limsid": input_.id},
+                                               {"limsid": output.id, "output-generation-type": "PerInput"}))
+        self.outputs.append(Entity(id="92-spark", type="ResultFile", name="Spark File", files=[Entity(id="40-1")]))
+
+    def all_inputs(self, unique=True):
+        return list(self.inputs)
+
+    def all_outputs(self, unique=True):
+        return list(self.outputs)
+
+
+def run(container_names, contents, monkeypatch):
+    process = FakeProcess(container_names)
+    monkeypatch.setattr(sparkoutput, "Process", lambda lims, id: process)
+    lims = FakeLims(contents)
+    args = Namespace(pid="24-1", sparkOutputFilename="Spark File", concentrationUdf="Concentration",
+                     convertToNm=False, fitStandards=None, wellFromOutput=False)
+    sparkoutput.update_concentrations(lims, args, logging.getLogger(__name__), FakeProgress())
+    return dict((output.name, output.udf["Concentration"]) for output in lims.updated)
+
+
+def test_plates_are_matched_to_the_containers_sorted_by_name(monkeypatch):
+    contents = spark_file([("Sheet1", [("A1", 1, 1.0), ("B1", 2, 2.0), ("A1", 3, 3.0), ("B1", 4, 4.0)]),
+                           ("Sheet2", [("A1", 5, 5.0), ("B1", 6, 6.0)])])
+
+    concentrations = run(["Plate_C", "Plate_A", "Plate_B"], contents, monkeypatch)
+
+    assert concentrations == {"Plate_A_A:1": 1.0, "Plate_A_B:1": 2.0, "Plate_B_A:1": 3.0, "Plate_B_B:1": 4.0,
+                              "Plate_C_A:1": 5.0, "Plate_C_B:1": 6.0}
+
+
+def test_plate_count_must_match_the_containers(monkeypatch):
+    contents = spark_file([("Sheet1", [("A1", 1, 1.0), ("B1", 2, 2.0)])])
+
+    with pytest.raises(RuntimeError) as error:
+        run(["Plate_A", "Plate_B"], contents, monkeypatch)
+    assert "Found 1 plate(s) in the Spark file, but the samples are in 2 container(s)" in str(error.value)
@@ -0,0 +1,52 @@
+import numpy as np
+
+import spark_reader
+import standard_curve
+
+STANDARDS = (["A12", "B12", "C12", "D12", "E12", "F12"], np.array([0.0, 0.5, 1.0, 2.5, 5.0, 10.0]))
+
+
+def signal(concentration, a=100.0, b=1.2, c=20.0, d=50000.0):
+    return d + (a - d) / (1.0 + (concentration / c) ** b)
+
+
+def plate(sample_signals):
+    standard_signals = [signal(concentration) for concentration in STANDARDS[1]]
+    # a little noise, so that the fitted lower asymptote isn't exactly the blank
+    standard_signals[0] += 3.0
+    wells = STANDARDS[0] + ["A%d" % (ix + 1) for ix in range(len(sample_signals))]
+    raw_values = np.array(standard_signals + list(sample_signals), dtype=float)
+    return spark_reader.SparkPlate("Sheet1", 0, wells, list(range(len(wells))), None, raw_values)
+
+
+def test_signals_at_the_blank_level_are_clamped_to_the_curve():
+    blank = signal(0.0)
+    spark_plate = plate([blank - 10.0, blank, blank + 1.0, signal(2.0), signal(1000.0), 60000.0])
+
+    standard_curve.calculate_concentrations([spark_plate], STANDARDS, "4pl")
+
+    samples = spark_plate.concentrations[len(STANDARDS[0]):]
+    assert not np.isnan(samples).any()
+    assert samples[0] == spark_reader.MIN_CONCENTRATION
+    assert samples[1] == spark_reader.MIN_CONCENTRATION
+    assert 0.0 <= samples[2] < 0.5
+    assert abs(samples[3] - 2.0) < 0.1
+    assert samples[4] == spark_reader.MAX_CONCENTRATION
+    assert samples[5] == spark_reader.MAX_CONCENTRATION
+    assert standard_curve.missing_concentrations([spark_plate]) == []
+
+
+def test_interpolates_signals_beyond_the_asymptotes():
+    params = np.array([[100.0, 1.0, np.log(20.0), 50000.0]])
+    concentrations = standard_curve.interpolate_4pl(params, np.array([[90.0, 100.0, 50000.0, 60000.0, np.nan]]))
+    assert concentrations[0, :2].tolist() == [0.0, 0.0]
+    assert np.isinf(concentrations[0, 2:4]).all()
+    assert np.isnan(concentrations[0, 4])
+
+
+def test_reports_the_wells_without_a_numeric_raw_value():
+    spark_plate = plate([signal(1.0), np.nan])
+
+    standard_curve.calculate_concentrations([spark_plate], STANDARDS, "4pl")
+
+    assert standard_curve.missing_concentrations([spark_plate], set(STANDARDS[0])) == ["A2 (sheet 'Sheet1', plate 1)"]
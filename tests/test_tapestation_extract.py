@@ -0,0 +1,39 @@
+from io import BytesIO
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+Image = pytest.importorskip("PIL.Image")
+
+import tapestation_extract
+
+
+def pdf_with_images(colors):
+    """A PDF with one PNG image on each page"""
+    document = fitz.open()
+    for color in colors:
+        png = BytesIO()
+        Image.new("RGB", (40, 20), color).save(png, "PNG")
+        page = document.new_page(width=200, height=200)
+        page.insert_image(fitz.Rect(10, 10, 90, 50), stream=png.getvalue())
+    return document.tobytes()
+
+
+def test_extracts_the_image_of_each_page_as_jpeg():
+    pdf = pdf_with_images([(255, 0, 0), (0, 0, 255)])
+
+    jpegs = tapestation_extract.extract_images(pdf, [1, 2], processes=1)
+
+    assert len(jpegs) == 2
+    images = [Image.open(BytesIO(jpeg)) for jpeg in jpegs]
+    assert [image.format for image in images] == ["JPEG", "JPEG"]
+    assert images[0].size == (40, 20)
+    red, _, blue = images[0].convert("RGB").getpixel((20, 10))
+    assert red > 200 and blue < 50
+    red, _, blue = images[1].convert("RGB").getpixel((20, 10))
+    assert blue > 200 and red < 50
+
+
+def test_page_assignments_follow_the_wells_columnwise():
+    assignments = tapestation_extract.page_assignments({"B1": "92-2", "A1": "92-1", "A2": "92-3"}, 10)
+    assert assignments == [(10, "92-1_A1.jpeg"), (11, "92-2_B1.jpeg"), (12, "92-3_A2.jpeg")]
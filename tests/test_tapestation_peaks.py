@@ -0,0 +1,59 @@
+import os
+
+import benchmark_tapestation_peaks
+import tapestation_peaks
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_TABLE = os.path.join(ROOT, "test_data", "tapestation_compact_peak_table.csv")
+
+HEADER = "FileName,Well,Sample Description,Size [bp],% Integrated Area,Observations"
+
+
+def fixture_lines():
+    with open(TEST_TABLE, encoding="utf-8") as table:
+        return table.read().splitlines()
+
+
+def summary_by_key(summary):
+    return dict(zip(zip(summary.files.tolist(), summary.wells.tolist()), summary.sizes.tolist()))
+
+
+def test_single_strategy_agrees_with_the_row_by_row_parser():
+    lines = fixture_lines()
+
+    summary = tapestation_peaks.summarize_tables([lines], 200, 1000)
+
+    expected = benchmark_tapestation_peaks.row_by_row([lines], 200, 1000)
+    assert len(expected) > 0
+    assert summary_by_key(summary) == expected
+    # the wells are kept in the order of the table
+    wells = [line.split(",")[1] for line in lines[1:]]
+    assert summary.wells.tolist() == sorted(set(summary.wells.tolist()), key=wells.index)
+
+
+def test_runs_of_a_pile_are_kept_apart():
+    pile = benchmark_tapestation_peaks.synthetic_tables(3)
+
+    summary = tapestation_peaks.summarize_tables(pile, 200, 1000)
+
+    assert summary_by_key(summary) == benchmark_tapestation_peaks.row_by_row(pile, 200, 1000)
+    assert len(set(summary.files.tolist())) == 3
+
+
+def test_strategies_for_a_well_with_several_peaks():
+    lines = [HEADER,
+             "run,A1,Ladder,300,50,",
+             "run,B1,sample,25,10,Lower Marker",
+             "run,B1,sample,300,20,",
+             "run,B1,sample,400,50,",
+             "run,B1,sample,600,30,",
+             "run,C1,sample,500,100,",
+             "run,D1,sample,1500,100,"]
+
+    def sizes(strategy):
+        return tapestation_peaks.summarize_tables([lines], 200, 1000, strategy).by_well()
+
+    assert sizes("single") == {"B1": -1, "C1": 500}
+    assert sizes("weighted") == {"B1": 440, "C1": 500}
+    assert sizes("dominant") == {"B1": 400, "C1": 500}
+    assert sizes("smear") == {"B1": 400, "C1": 500}
@@ -0,0 +1,61 @@
+import logging
+
+import pytest
+
+pytest.importorskip("genologics")
+pytest.importorskip("pandas")
+
+import upload_csv_measurements
+
+CSV = b"""Quant-iT results
+
+SampleID,Concentration
+
+A01,12.5
+B01,n/a
+C1,3.25
+
+Z99,4.0
+"""
+
+
+class Output(object):
+
+    def __init__(self):
+        self.udf = {}
+
+
+def measurements():
+    return upload_csv_measurements.read_measurements(CSV, 3, "comma", "SampleID", ["Concentration"])
+
+
+def test_reads_the_wells_and_the_lines_of_the_rows():
+    table, lines = measurements()
+
+    assert table.index.tolist() == ["A1", "B1", "C1", "Z99"]
+    assert lines.tolist() == [5, 6, 7, 9]
+
+
+def test_problems_are_reported_with_the_line_in_the_file():
+    table, lines = measurements()
+    outputs = {well: Output() for well in ("A1", "B1", "C1")}
+
+    with pytest.raises(RuntimeError) as error:
+        upload_csv_measurements.assign_measurements(table, lines, outputs, [("Concentration", "Concentration")], False)
+
+    assert str(error.value).splitlines()[1:] == [
+        "Line 6: no number for all measurements in well B1",
+        "Line 9: no sample in well Z99"]
+
+
+def test_relaxed_skips_the_problem_rows(caplog):
+    table, lines = measurements()
+    outputs = {well: Output() for well in ("A1", "B1", "C1")}
+
+    with caplog.at_level(logging.WARNING):
+        updated = upload_csv_measurements.assign_measurements(
+            table, lines, outputs, [("Concentration", "Concentration")], True)
+
+    assert updated == [outputs["A1"], outputs["C1"]]
+    assert outputs["C1"].udf == {"Concentration": 3.25}
+    assert "Line 9: no sample in well Z99" in caplog.text
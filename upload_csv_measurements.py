@@ -0,0 +1,158 @@
+from argparse import ArgumentParser
+from io import BytesIO
+import logging
+
+import numpy as np
+import pandas as pd
+
+from genologics.entities import Artifact, Process
+from genologics.lims import Lims
+
+__author__ = "CTMR"
+__date__ = "2020"
+__doc__ = """
+Sets measurement UDFs from a CSV file on the outputs of a step, as a drop in
+replacement for 'ngs-extensions.jar script:parseCSV'.
+
+The rows of the CSV file are matched to the samples by their well, given in the
+sampleLocation column as e.g. A1, A01 or A:1. The file is parsed in one go with
+pandas, and all matched outputs are updated with one batch request.
+
+Options, with the same names as parseCSV:
+    -inputFile           LUID of the file placeholder the CSV file is uploaded to
+    -log                 The log file to write
+    -headerRow           The (1-based) line of the column headers
+    -separator           comma, tab, semicolon or a literal separator
+    -sampleLocation      The column with the wells
+    -measurementUDFMap   <column>::<UDF>, can be repeated
+    -relaxed             With 'true', rows that don't match a sample or don't have
+                         a number are skipped instead of failing the step
+
+Usage:
+    bash -c "/opt/gls/clarity/miniconda3/bin/python /opt/gls/clarity/customextensions/upload_csv_measurements.py
+    -i {processURI:v2:http} -u {username} -p {password}
+    -inputFile {compoundOutputFileLuid0} -log {compoundOutputFileLuid3}
+    -headerRow '1' -separator 'comma' -sampleLocation 'SampleID'
+    -measurementUDFMap 'Concentration::Concentration' -relaxed 'true'"
+"""
+
+SEPARATORS = {"comma": ",", "tab": "\t", "semicolon": ";"}
+WELL_RE = r"^\s*([A-Z]+)\s*:?\s*0*(\d+)\s*$"
+
+
+def parse_udf_map(udf_maps):
+    """['Concentration::Concentration'] -> [('Concentration', 'Concentration')]"""
+    pairs = []
+    for udf_map in udf_maps:
+        column, sep, udf = udf_map.partition("::")
+        if not sep or not column or not udf:
+            raise(RuntimeError("Invalid measurementUDFMap '%s'! Format as <column>::<UDF>" % udf_map))
+        pairs.append((column, udf))
+    return pairs
+
+
+def read_measurements(contents, header_row, separator, location_column, columns):
+    """Parses the CSV file into a DataFrame indexed on the well (e.g. 'A1'), with
+    one float column per measurement. Values that aren't numbers are NaN.
+    Returns the DataFrame and the (1-based) line in the file of each of its rows."""
+    # blank lines are kept while parsing, so that the header row and the row
+    # positions are lines of the file
+    table = pd.read_csv(BytesIO(contents), sep=SEPARATORS.get(separator.lower(), separator),
+                        header=header_row - 1, dtype=str, skipinitialspace=True, skip_blank_lines=False)
+    table = table.dropna(how="all")
+    table.columns = [str(column).strip() for column in table.columns]
+    missing = [column for column in [location_column] + columns if column not in table.columns]
+    if missing:
+        raise(RuntimeError("Cannot find the column(s) %s in the CSV file, found: %s" %
+                           (", ".join(missing), ", ".join(table.columns))))
+    wells = table[location_column].str.upper().str.extract(WELL_RE)
+    measurements = pd.DataFrame({column: pd.to_numeric(table[column].str.strip(), errors="coerce")
+                                 for column in columns})
+    measurements.index = wells[0] + wells[1]
+    return measurements, table.index.to_numpy() + header_row + 1
+
+
+def get_output_by_well(process):
+    """The per input outputs, keyed on the well of their input"""
+    outputs = {}
+    containers = set()
+    for input_, output in process.input_output_maps:
+        if output and output["output-generation-type"] == "PerInput":
+            location = input_["uri"].location
+            if location and location[1]:
+                containers.add(location[0].id)
+                outputs["".join(location[1].split(":"))] = output["uri"]
+    if len(containers) > 1:
+        raise(RuntimeError("The samples are in %d containers, the wells in the CSV file are ambiguous" % len(containers)))
+    return outputs
+
+
+def assign_measurements(measurements, lines, outputs, udf_map, relaxed):
+    """Sets the UDFs on the outputs, returns the updated outputs. Problems are
+    reported with the lines of the rows in the file."""
+    wells = measurements.index.to_numpy()
+    known = measurements.index.notna() & np.isin(wells, list(outputs))
+    values = measurements[[column for column, _ in udf_map]].to_numpy()
+    complete = ~np.isnan(values).any(axis=1)
+    problems = sorted([(row, "no sample in well %s" % wells[row]) for row in np.flatnonzero(~known)] +
+                      [(row, "no number for all measurements in well %s" % wells[row])
+                       for row in np.flatnonzero(known & ~complete)])
+    problems = ["Line %d: %s" % (lines[row], problem) for row, problem in problems]
+    duplicated = measurements.index[known].duplicated()
+    if duplicated.any():
+        raise(RuntimeError("The wells %s occur more than once in the CSV file" %
+                           ", ".join(sorted(set(measurements.index[known][duplicated])))))
+    if problems:
+        if not relaxed:
+            raise(RuntimeError("Could not upload the measurements:\n" + "\n".join(problems)))
+        for problem in problems:
+            logging.warning(problem)
+
+    updated = []
+    for row in np.flatnonzero(known & ~np.isnan(values).all(axis=1)):
+        output = outputs[wells[row]]
+        for (column, udf), value in zip(udf_map, values[row].tolist()):
+            if not np.isnan(value):
+                output.udf[udf] = value
+        updated.append(output)
+    return updated
+
+
+def main(lims, args):
+    process = Process(lims, uri=args.processURI)
+    udf_map = parse_udf_map(args.measurementUDFMap)
+    placeholder = Artifact(lims, id=args.inputFile)
+    if not placeholder.files:
+        raise(RuntimeError("Cannot find the CSV file, are you sure it has been uploaded?"))
+    contents = lims.get_file_contents(id=placeholder.files[0].id)
+    if isinstance(contents, str):
+        contents = contents.encode("utf-8")
+
+    measurements, lines = read_measurements(contents, int(args.headerRow), args.separator, args.sampleLocation,
+                                            [column for column, _ in udf_map])
+    # one batch request for all inputs and outputs
+    process.all_inputs(unique=True, resolve=True)
+    process.all_outputs(unique=True, resolve=True)
+    outputs = get_output_by_well(process)
+    updated = assign_measurements(measurements, lines, outputs, udf_map, args.relaxed.lower() == "true")
+    lims.put_batch(updated)
+    logging.info("Uploaded the measurements of %d samples from %d rows", len(updated), len(measurements))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-i', '--processURI', required=True, help='URI of the current process')
+    parser.add_argument('-u', '--username', required=True, help='username')
+    parser.add_argument('-p', '--password', required=True, help='password')
+    parser.add_argument('-inputFile', '--inputFile', required=True, help='LUID of the file placeholder of the CSV file')
+    parser.add_argument('-log', '--log', help='The log file to write')
+    parser.add_argument('-headerRow', '--headerRow', default='1', help='The line of the column headers, starting at 1')
+    parser.add_argument('-separator', '--separator', default='comma', help='comma, tab, semicolon or a literal separator')
+    parser.add_argument('-sampleLocation', '--sampleLocation', required=True, help='The column with the wells of the samples')
+    parser.add_argument('-measurementUDFMap', '--measurementUDFMap', required=True, action='append', help='<column>::<UDF>, can be repeated')
+    parser.add_argument('-relaxed', '--relaxed', default='false', help="With 'true', skip the rows that don't match a sample")
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=args.log, level=logging.INFO)
+    lims = Lims(args.processURI.split("/api/")[0], args.username, args.password)
+    main(lims, args)
@@ -2,6 +2,7 @@ from argparse import ArgumentParser
 from genologics.config import BASEURI, USERNAME, PASSWORD
 from genologics.entities import Process
 from genologics.lims import Lims
+import numpy as np
 import xlrd
 import re
 
@@ -75,35 +76,29 @@ def format_concentration(concentration):
     return concentration
 
 def get_outputs(p):
-    # to avoid the uploaded files (maybe there's a better way to do this)
-    outputs = []
-    for i in p.all_inputs(unique=True):
-        if i.type != 'Analyte':
+    """The PerInput outputs of the analytes in the step, from one pass over the
+    input-output maps (to avoid the uploaded files)"""
+    inputs = {artifact.id: artifact for artifact in p.all_inputs(unique=True, resolve=True)}
+    outputs = {artifact.id: artifact for artifact in p.all_outputs(unique=True, resolve=True)}
+    per_input = []
+    seen = set()
+    for input_, output_ in p.input_output_maps:
+        if output_ is None or output_["output-generation-type"] != "PerInput":
             continue
-        for o in p.all_outputs(unique=True):
-            if i.name == o.name:
-                outputs.append(o)
-                continue
-    return outputs
-
-def choose_concentration(output, args):
-    conc_hs = output.udf.get(args.concUdfHS)
-    conc_br = output.udf.get(args.concUdfBR)
-    conc_qb = output.udf.get(args.concUdfQB)
-    conc_chosen = output.udf.get(args.concUdfChosen)
-    if conc_hs is None: # conc_hs is mandatory
-        raise(RuntimeError("Error! Sample '%s' is missing UDF '%s'!" % (output.name, args.concUdfHS)))
-#    elif conc_chosen is None: # conc_chosen is mandatory
-#        raise(RuntimeError("Error! Sample '%s' is missing UDF '%s'!" % (output.name, args.concUdfChosen)))
-
-    if conc_qb is not None:
-        conc_selected = conc_qb
-    elif conc_br is not None:
-        conc_selected = conc_br
-    else:
-        conc_selected = conc_hs
-
-    return conc_selected
+        input_artifact = inputs.get(input_["limsid"])
+        if input_artifact is None or input_artifact.type != 'Analyte' or output_["limsid"] in seen:
+            continue
+        seen.add(output_["limsid"])
+        per_input.append(outputs[output_["limsid"]])
+    return per_input
+
+def get_udf_array(outputs, udf):
+    """The values of the UDF on all outputs as floats, NaN where missing"""
+    return np.array([output.udf.get(udf, np.nan) for output in outputs], dtype=float)
+
+def choose_concentrations(conc_hs, conc_br, conc_qb):
+    """Qubit has precedence over BroadRange, which has precedence over HighSensitivity"""
+    return np.where(~np.isnan(conc_qb), conc_qb, np.where(~np.isnan(conc_br), conc_br, conc_hs))
 
 def main(lims, args, logger):
     p = Process(lims, id=args.pid)
@@ -112,19 +107,24 @@ def main(lims, args, logger):
     if args.qcPassCondition2:
         operator2, threshold2 = parse_qc_condition(args.qcPassCondition2)
 
-    for i, output in enumerate(get_outputs(p)):
-        concentration = choose_concentration(output, args)
-        output.udf[args.concUdfChosen] = concentration
-        
-        qc_pass = check_qc_pass(concentration, operator, threshold)
-        qc_flag = 'PASSED' if qc_pass else 'FAILED'
-
-        if args.qcPassCondition2:
-            qc_pass2 = check_qc_pass(concentration, operator, threshold)
-            # set qc flag based on both conditions
-            qc_flag = 'PASSED' if (qc_pass and qc_pass2) else 'FAILED'
+    outputs = get_outputs(p)
+    conc_hs = get_udf_array(outputs, args.concUdfHS)
+    conc_br = get_udf_array(outputs, args.concUdfBR)
+    conc_qb = get_udf_array(outputs, args.concUdfQB)
+    missing_hs = np.isnan(conc_hs)
+    if missing_hs.any(): # conc_hs is mandatory
+        names = ", ".join("'%s'" % output.name for output, missing in zip(outputs, missing_hs) if missing)
+        raise(RuntimeError("Error! Sample(s) %s are missing UDF '%s'!" % (names, args.concUdfHS)))
+
+    concentrations = choose_concentrations(conc_hs, conc_br, conc_qb)
+    qc_pass = check_qc_pass(concentrations, operator, threshold)
+    if args.qcPassCondition2:
+        # set qc flag based on both conditions
+        qc_pass &= check_qc_pass(concentrations, operator2, threshold2)
 
-        output.qc_flag = qc_flag
+    for output, concentration, passed in zip(outputs, concentrations.tolist(), qc_pass.tolist()):
+        output.udf[args.concUdfChosen] = concentration
+        output.qc_flag = 'PASSED' if passed else 'FAILED'
 
 #    # create fluent file
 #    fluent_file = get_file_artifact(p, args.fluentNormalizationFilename)
@@ -134,8 +134,7 @@ def main(lims, args, logger):
 #    overview_file = get_file_artifact(p, args.overviewFilename)
 #    if overview_file:
 
-    for i, output in enumerate(get_outputs(p)):
-        output.put()
+    lims.put_batch(outputs)
 
 #    workbook = xlrd.open_workbook(file_contents=sparkfile.read())
 #    sheet = workbook.sheet_by_index(0)